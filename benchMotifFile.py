@@ -0,0 +1,128 @@
+'''
+Benchmarks printMotifFile on synthetic Motif files made by makeMotifFile.
+
+For each file size (entries per block) and layout, times printMotifFile,
+doBlock for each BlockSpec on its own, and the motif2text export path
+(writeTextFile, which needs no Tk window), and reports entries per second,
+MB per second (of the blocks each benchmark reads) and peak traced memory.
+
+   python benchMotifFile.py [-n 1000,10000,100000] [-r 3] [--json results.json]
+'''
+
+import argparse, io, json, os, sys, tempfile, time, tracemalloc
+
+import makeMotifFile
+from printMotifFile import MotifFile, TextReport, blockSpecs, blockSummary, doBlock, printMotifFile
+
+try:
+	import motif2text
+except ImportError:								# no tkinter
+	motif2text = None
+
+class BenchResult:
+	def __init__(self, name, layoutName, nEntries, fileSize, nBytes, seconds, peakBytes):
+		self.name =			name
+		self.layoutName =	layoutName
+		self.nEntries =		nEntries			# entries decoded
+		self.fileSize =		fileSize
+		self.nBytes =		nBytes				# bytes of the file the benchmark covers
+		self.seconds =		seconds				# best of the repeats
+		self.peakBytes =	peakBytes			# peak traced memory, from a separate run
+
+	def entriesPerSecond(self):
+		return self.nEntries / self.seconds if self.seconds > 0 else 0.0
+
+	def mbPerSecond(self):
+		return self.nBytes / self.seconds / 1e6 if self.seconds > 0 else 0.0
+
+def timeFn(fn, repeats):
+	best = None
+	for _ in range(repeats):
+		startTime = time.perf_counter()
+		fn()
+		seconds = time.perf_counter() - startTime
+		if best is None or seconds < best:
+			best = seconds
+	tracemalloc.start()
+	try:
+		fn()
+		_, peakBytes = tracemalloc.get_traced_memory()
+	finally:
+		tracemalloc.stop()
+	return best, peakBytes
+
+def printFileFn(fileName):
+	def fn():
+		printMotifFile(fileName, (), out = io.StringIO())
+	return fn
+
+def doBlockFn(fileName, blockSpec):
+	def fn():
+		with MotifFile(fileName) as motifFile:
+			doBlock(TextReport(motifFile, io.StringIO()), blockSpec)
+	return fn
+
+def exportFn(fileName):
+	def fn():
+		os.remove(motif2text.writeTextFile(fileName, list(blockSpecs.keys())))
+	return fn
+
+def blockBytes(motifFile, blockSpec):
+	# size of the block doBlock reads, and of its Data chunks' block if it reads those too
+	start, end = motifFile.blockExtent(blockSpec.ident)
+	nBytes = end - start
+	if blockSpec.needsData and motifFile.hasBlock(blockSpec.dataIdent):
+		start, end = motifFile.blockExtent(blockSpec.dataIdent)
+		nBytes += end - start
+	return nBytes
+
+def benchFile(fileName, layoutName, repeats):
+	fileSize = os.path.getsize(fileName)
+	with MotifFile(fileName) as motifFile:
+		counts = dict((blockSpec.name, count) for blockSpec, count in blockSummary(motifFile))
+		sizes = dict((blockSpec.name, blockBytes(motifFile, blockSpec)) for blockSpec in blockSpecs.values()
+					 if motifFile.hasBlock(blockSpec.ident))
+	nEntries = sum(count for count in counts.values() if count is not None)
+	benches = [('printMotifFile', nEntries, fileSize, printFileFn(fileName))]
+	for blockSpec in blockSpecs.values():
+		if counts[blockSpec.name] is not None:
+			benches.append(('doBlock %s' % blockSpec.name, counts[blockSpec.name], sizes[blockSpec.name],
+							doBlockFn(fileName, blockSpec)))
+	if motif2text is not None:
+		benches.append(('motif2text export', nEntries, fileSize, exportFn(fileName)))
+	results = []
+	for name, benchEntries, nBytes, fn in benches:
+		seconds, peakBytes = timeFn(fn, repeats)
+		results.append(BenchResult(name, layoutName, benchEntries, fileSize, nBytes, seconds, peakBytes))
+	return results
+
+def printResults(results, out):
+	print('%-26s %-6s %8s %10s %12s %9s %10s' %
+		  ('benchmark', 'layout', 'entries', 'seconds', 'entries/s', 'MB/s', 'peak KB'), file = out)
+	for result in results:
+		print('%-26s %-6s %8d %10.4f %12.0f %9.1f %10.0f' %
+			  (result.name, result.layoutName, result.nEntries, result.seconds,
+			   result.entriesPerSecond(), result.mbPerSecond(), result.peakBytes / 1024), file = out)
+
+def run(sizes, repeats, layouts = ('pre-XF', 'XF'), out = sys.stdout):
+	results = []
+	with tempfile.TemporaryDirectory() as tempDir:
+		for nEntries in sizes:
+			for layoutName in layouts:
+				fileName = os.path.join(tempDir, 'bench_%d_%s.X0A' % (nEntries, layoutName))
+				makeMotifFile.makeMotifFile(fileName, nEntries, preXF = layoutName == 'pre-XF')
+				results += benchFile(fileName, layoutName, repeats)
+	printResults(results, out)
+	return results
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description = 'benchmark printMotifFile on synthetic files')
+	parser.add_argument('-n', '--sizes', default = '1000,10000,100000',
+						help = 'comma-separated entries per block (default: %(default)s)')
+	parser.add_argument('-r', '--repeats', type = int, default = 3, help = 'timed runs per benchmark')
+	parser.add_argument('--json', default = None, help = 'also write the results to this JSON file')
+	options = parser.parse_args()
+	results = run([int(size) for size in options.sizes.split(',')], options.repeats)
+	if options.json is not None:
+		with open(options.json, 'w') as jsonFile:
+			json.dump([result.__dict__ for result in results], jsonFile, indent = 1)
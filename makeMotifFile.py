@@ -0,0 +1,149 @@
+'''
+Writes synthetic Motif (YAMAHA-YSFC) files, for benchmarks and for
+reproducing problems without needing anyone's real backup files.
+
+The files have the blocks printMotifFile knows about (ESNG, EPTN, EMST with
+its DMST data, EPFM, EVCE, EARP, EWFM with its DWFM data), in either the
+pre-XF or the XF layout, with a chosen number of entries in each block. EVCE
+entries are spread over normal, mixing and sample voice banks, EWFM entries
+over the User/FL1/FL2 ranges, and waveform names repeat so there are
+duplicates. Waveform data repeats too, under other names, and is the same
+in files made with the same seed.
+
+   python makeMotifFile.py [--pre-xf] nEntries fileName
+'''
+
+import random, struct, sys
+
+from printMotifFile import BLOCK_DATA_ID, BLOCK_ENTRY_ID, FILE_HDR_ID, FILE_HDR_LGTH, \
+	PRE_XF_LAYOUT, XF_LAYOUT, MasterTargetType
+
+PRE_XF_VERSION =	'1.0.1'
+XF_VERSION =		'1.0.2'
+
+DUPLICATE_WAVEFORM_EVERY =	8			# every 8th waveform has the same name as one before it
+DUPLICATE_WAVEFORM_DATA_EVERY =	5		# every 5th waveform has the same data as one before it
+WAVEFORM_DATA_LGTH =		256
+
+def blockBytes(ident, nEntries, body):
+	# block length counts everything after the ident and length fields
+	return b''.join((ident, struct.pack('> I I', len(body) + 4, nEntries), body))
+
+def entryBlocks(ident, layout, entryNumbers, entryNames, dataFn = None):
+	'''
+	Returns [(ident, block bytes)] for an entry block, plus its D block if
+	dataFn is given. dataFn(i) returns the payload of the i'th entry's Data chunk.
+	'''
+	padding = b'\x00' * (layout.entryFixedSizeDataLgth - 20)
+	entries = []
+	dataChunks = []
+	dataOffset = 12								# D block header: ident, length, nEntries
+	for i, (entryNumber, entryName) in enumerate(zip(entryNumbers, entryNames)):
+		entryStrs = entryName.encode('ascii') + b'\x00' + b'\x00'
+		if dataFn is None:
+			dataSize = 0
+			entryDataOffset = 0
+		else:
+			payload = dataFn(i)
+			dataSize = len(payload)
+			entryDataOffset = dataOffset
+			dataChunks.append(BLOCK_DATA_ID + struct.pack('> I', dataSize) + payload)
+			dataOffset += dataSize + 8
+		entries.append(struct.pack('> 4s I 4x I 4x I I', BLOCK_ENTRY_ID,
+								   layout.entryFixedSizeDataLgth + len(entryStrs),
+								   dataSize, entryDataOffset, entryNumber))
+		entries.append(padding)
+		entries.append(entryStrs)
+	blocks = [(ident, blockBytes(ident, len(entryNumbers), b''.join(entries)))]
+	if dataFn is not None:
+		dataIdent = b'D' + ident[1:]
+		blocks.append((dataIdent, blockBytes(dataIdent, len(entryNumbers), b''.join(dataChunks))))
+	return blocks
+
+def voiceEntryNumber(i):
+	# cycles through normal, UDR (bank 40), sample (bank 134) and mixing voice banks
+	kind = i % 4
+	if kind == 0:
+		return ((i >> 7) % 16) << 8 | (i & 0x7F)
+	elif kind == 1:
+		return 40 << 8 | (i & 0x7F)
+	elif kind == 2:
+		return 134 << 8 | (128 + (i & 0x3F))
+	else:
+		return (135 + (i >> 2) % 100) << 8 | (128 + (i & 0x3F))
+
+def waveformEntryNumber(layout, i):
+	if layout is PRE_XF_LAYOUT:
+		return 1 + i % 128
+	return 1 + i % 4224							# User, FL1 and FL2 ranges
+
+def waveformNameNumber(i):
+	if i % DUPLICATE_WAVEFORM_EVERY == DUPLICATE_WAVEFORM_EVERY - 1:
+		return i - (DUPLICATE_WAVEFORM_EVERY - 1)
+	return i
+
+def waveformData(seed):
+	def dataFn(i):
+		if i % DUPLICATE_WAVEFORM_DATA_EVERY == DUPLICATE_WAVEFORM_DATA_EVERY - 1:
+			i -= DUPLICATE_WAVEFORM_DATA_EVERY - 1
+		return random.Random('%d/%d' % (seed, i)).getrandbits(8 * WAVEFORM_DATA_LGTH).to_bytes(WAVEFORM_DATA_LGTH, 'big')
+	return dataFn
+
+def masterData(layout, rnd):
+	def dataFn(i):
+		payload = bytearray(layout.masterStruct.size - 8)
+		targetType = i % 4
+		payload[28] = targetType
+		if targetType == MasterTargetType.MST_PERFORMANCE:
+			payload[30] = rnd.randrange(4)
+		else:
+			payload[30] = rnd.randrange(16)
+		payload[31] = rnd.randrange(128)
+		return bytes(payload)
+	return dataFn
+
+def motifFileBytes(nEntries, preXF = False, seed = 0):
+	'''
+	Returns the contents of a synthetic Motif file with nEntries entries in
+	each entry block.
+	'''
+	rnd = random.Random(seed)
+	layout = PRE_XF_LAYOUT if preXF else XF_LAYOUT
+	numbers = range(nEntries)
+	bankNumbers = [i % 1024 for i in numbers]	# keeps bank/section numbers in USR1..UDR
+	blocks = []
+	blocks += entryBlocks(b'ESNG', layout, numbers, ['Song %d' % i for i in numbers])
+	blocks += entryBlocks(b'EPTN', layout, numbers, ['Pattern %d' % i for i in numbers])
+	blocks += entryBlocks(b'EMST', layout, bankNumbers, ['Master %d' % i for i in numbers],
+						  masterData(layout, rnd))
+	blocks += entryBlocks(b'EPFM', layout, bankNumbers, ['Pf:Performance %d' % i for i in numbers])
+	blocks += entryBlocks(b'EVCE', layout, [voiceEntryNumber(i) for i in numbers],
+						  ['Pd:Voice %d' % i for i in numbers])
+	blocks += entryBlocks(b'EARP', layout, numbers, ['Ar:Arpeggio %d' % i for i in numbers])
+	blocks += entryBlocks(b'EWFM', layout, [waveformEntryNumber(layout, i) for i in numbers],
+						  ['Wf:Wave %d' % waveformNameNumber(i) for i in numbers], waveformData(seed))
+
+	catalogSize = 8 * len(blocks)
+	catalog = []
+	posn = FILE_HDR_LGTH + catalogSize
+	for ident, block in blocks:
+		catalog.append(struct.pack('> 4s I', ident, posn))
+		posn += len(block)
+	version = PRE_XF_VERSION if preXF else XF_VERSION
+	fileHdr = struct.pack('> 16s 16s I 28x', FILE_HDR_ID, version.encode('ascii'), catalogSize)
+	return b''.join([fileHdr] + catalog + [block for _, block in blocks])
+
+def makeMotifFile(fileName, nEntries, preXF = False, seed = 0):
+	with open(fileName, 'wb') as motifFile:
+		motifFile.write(motifFileBytes(nEntries, preXF, seed))
+	return fileName
+
+if __name__ == '__main__':
+	args = sys.argv[1:]
+	preXF = '--pre-xf' in args
+	if preXF:
+		args.remove('--pre-xf')
+	if len(args) != 2:
+		print(__doc__.strip().split('\n')[-1].strip(), file = sys.stderr)
+		sys.exit(2)
+	makeMotifFile(args[1], int(args[0]), preXF)
@@ -4,14 +4,18 @@
 @contact: http://spot.pcc.edu/~mtrigobo
 '''
 
+import collections
 import configparser
 import os.path
+import queue
 import sys
+import threading
 from tkinter import BooleanVar, StringVar, ttk
 import tkinter
-from tkinter.filedialog import askopenfilename
+from tkinter.filedialog import askopenfilename, asksaveasfilename
 
-from printMotifFile import blockSpecs, printMotifFile, VERSION as PMF_VERSION
+from printMotifFile import ParseCancelled, ParseStats, blockSpecs, printMotifFile, renderBlocks, \
+						   VERSION as PMF_VERSION
 
 
 class CheckBox:
@@ -20,14 +24,118 @@ class CheckBox:
 		self.abbrev =		abbrev
 		self.variable =		BooleanVar()
 		self.checkBtn = 	ttk.Checkbutton(frame, text = label, variable = self.variable,
-											command = setCreateBtnState, underline = underlineIndex)
+											command = selectionChanged, underline = underlineIndex)
 		checkBoxShortcuts[label[underlineIndex].lower()] = self
 		self.variable.set(state)
 
+class CancellableWriter:
+	# text file whose next write raises ParseCancelled once cancelEvent is set
+	def __init__(self, out, cancelEvent):
+		self.out =			out
+		self.cancelEvent =	cancelEvent
+
+	def write(self, text):
+		if self.cancelEvent.is_set():
+			raise ParseCancelled()
+		return self.out.write(text)
+
+	def flush(self):
+		self.out.flush()
+
+class ExportJob:
+	'''
+	Writes the .txt file on a background thread. The thread only puts
+	(kind, value) messages on self.messages; the Tk thread polls them with
+	root.after, so no Tk calls are made off the main thread.
+	'''
+
+	def __init__(self, motifFilePath, selectedItems, textFilePath):
+		self.motifFilePath =	motifFilePath
+		self.selectedItems =	selectedItems
+		self.textFilePath =		textFilePath
+		self.cancelEvent =		threading.Event()
+		self.messages =			queue.Queue()
+		self.nBlocksDone =		0
+		self.nEntriesDone =		0
+		self.thread =			threading.Thread(target = self.run, daemon = True)
+
+	def start(self):
+		self.thread.start()
+
+	def cancel(self):
+		self.cancelEvent.set()
+
+	def blockDone(self, blockStats):
+		self.nBlocksDone += 1
+		self.nEntriesDone += blockStats.entries
+		self.messages.put(('progress', (self.nBlocksDone, len(self.selectedItems), self.nEntriesDone)))
+
+	def run(self):
+		try:
+			textFilePath = writeTextFile(self.motifFilePath, self.selectedItems,
+										 self.cancelEvent, self.blockDone, self.textFilePath)
+			self.messages.put(('done', textFilePath))
+		except ParseCancelled:
+			self.messages.put(('cancelled', None))
+		except Exception as e:
+			self.messages.put(('failed', e))
+
+class PreviewJob:
+	'''
+	Renders blocks for the preview pane on a background thread, one block
+	ident at a time, and puts ('block', (blockAbbrev, sections)) on
+	self.messages as each is done, where sections is a list of lines for
+	each blank-line-separated part of the block's text (the first line of
+	each is its heading). Like ExportJob, it makes no Tk calls.
+	'''
+
+	def __init__(self, motifFilePath, selectedItems):
+		self.motifFilePath =	motifFilePath
+		self.selectedItems =	selectedItems
+		self.cancelEvent =		threading.Event()
+		self.messages =			queue.Queue()
+		self.thread =			threading.Thread(target = self.run, daemon = True)
+
+	def start(self):
+		self.thread.start()
+
+	def cancel(self):
+		self.cancelEvent.set()
+
+	def run(self):
+		blockAbbrevsByIdent = collections.OrderedDict()
+		for blockAbbrev in self.selectedItems:
+			blockAbbrevsByIdent.setdefault(blockSpecs[blockAbbrev].ident, []).append(blockAbbrev)
+		try:
+			for blockAbbrevs in blockAbbrevsByIdent.values():
+				if self.cancelEvent.is_set():
+					self.messages.put(('cancelled', None))
+					return
+				blockTexts = renderBlocks(self.motifFilePath, blockAbbrevs)
+				for blockAbbrev, blockText in zip(blockAbbrevs, blockTexts):
+					sections = [sectionText.split('\n') for sectionText in blockText.rstrip('\n').split('\n\n')]
+					self.messages.put(('block', (blockAbbrev, sections)))
+			self.messages.put(('done', None))
+		except Exception as e:
+			self.messages.put(('failed', e))
+
 # global variables
-VERSION =				'1.2'
+VERSION =				'1.3'
 checkBoxes =			[]
 checkBoxShortcuts = 	{}
+exportJob =				None		# the ExportJob in flight, if any
+EXPORT_POLL_MS =		100
+
+# preview pane: blocks are rendered once per file and cached as lines; a section's
+# rows are only put in the Treeview when it is first opened, PREVIEW_ROWS_PER_TICK at a time
+previewJob =			None		# the PreviewJob in flight, if any
+previewFilePath =		''			# Motif file that previewLines came from
+previewLines =			{}			# blockAbbrev -> [[section heading, row, ...], ...]
+previewSections =		{}			# blockAbbrev -> Treeview items for its sections
+previewUnfedRows =		{}			# section item -> rows not yet inserted
+previewFeed =			collections.deque()		# [section item, rows, index of next row]
+previewFeeding =		False
+PREVIEW_ROWS_PER_TICK =	500
 
 # global constants for app state .ini file
 STATE_FILE_NAME =		'motif2text.ini'
@@ -43,12 +151,34 @@ def launchFile(filePath):			# launch file with default app for that file type
 	# open file with default app
 	if sys.platform == 'win32' or sys.platform == 'win64':		# windows
 		os.startfile(filePath)
-	else:														# mac, linux
+	elif sys.platform == 'darwin':								# mac
 		os.system("open " + filePath)
+	else:														# linux, etc
+		os.system("xdg-open " + filePath)
 	#os.system("notepad.exe \"" + textFilePath + "\"")			#open .txt file with notepad
 
+def writeTextFile(motifFilePath, selectedItems, cancelEvent = None, blockDoneFn = None, textFilePath = None):
+	# returns path of .txt file (motifFilePath + '.txt' by default); no Tk needed. The text goes
+	# to a .tmp file that only replaces the .txt file once it is complete, so if anything goes
+	# wrong (or the export is cancelled) an existing .txt file is left as it was.
+	if textFilePath is None:
+		textFilePath = motifFilePath + '.txt'
+	tempFilePath = textFilePath + '.tmp'
+	textFile = open(tempFilePath, 'w')
+	try:
+		out = textFile if cancelEvent is None else CancellableWriter(textFile, cancelEvent)
+		stats = None if blockDoneFn is None else ParseStats(blockDoneFn)
+		printMotifFile(motifFilePath, selectedItems, out = out, stats = stats, cancelEvent = cancelEvent)
+		textFile.close()
+		os.replace(tempFilePath, textFilePath)
+	except:
+		textFile.close()
+		os.remove(tempFilePath)
+		raise
+	return textFilePath
+
 def setCreateBtnState():
-	if len(motifFileDir) == 0:
+	if len(motifFileDir) == 0 or exportJob is not None:
 		createTextBtn['state'] = 'disabled'
 	else:
 		atLeastOneChecked = False
@@ -60,15 +190,22 @@ def setCreateBtnState():
 		else:
 			createTextBtn['state'] = 'disabled'		
 
+def selectedItemsList():
+	return [checkBox.abbrev for checkBox in checkBoxes if checkBox.variable.get()]
+
+def selectionChanged():
+	setCreateBtnState()
+	refreshPreview()
+
 def allFn():
 	for checkBox in checkBoxes:
 		checkBox.variable.set(True)
-	setCreateBtnState()
+	selectionChanged()
 
 def noneFn():
 	for checkBox in checkBoxes:
 		checkBox.variable.set(False)
-	setCreateBtnState()		
+	selectionChanged()
 
 def selectFileFn():
 	global motifFileDir, motifFileName
@@ -82,34 +219,181 @@ def selectFileFn():
 	motifFileDir = os.path.dirname(motifFilePath)
 	motifFileName = os.path.basename(motifFilePath)
 	fileNameEntryVar.set(motifFileName)
-	setCreateBtnState()
+	selectionChanged()
 
 def createTextFn():
-	global motifFileDir, motifFileName
-	selectedItems = []
-	for checkBox in checkBoxes:
-		if checkBox.variable.get():
-			selectedItems.append(checkBox.abbrev)
+	global exportJob
+	if exportJob is not None or len(motifFileDir) == 0:
+		return
+	selectedItems = selectedItemsList()
 	if len(selectedItems) == 0:
 		return
-	realStdOut = sys.stdout
+	textFilePath = asksaveasfilename(initialdir = motifFileDir, initialfile = motifFileName + '.txt',
+									 defaultextension = '.txt')
+	if textFilePath == '':								# user hit Cancel
+		return
 	motifFilePath = os.path.join(motifFileDir, motifFileName)
-	textFilePath = motifFilePath + '.txt'
-	try:
-		textFile = open(textFilePath, 'w')
-		sys.stdout = textFile
-		printMotifFile(motifFilePath, selectedItems)
-		textFile.close()
-		launchFile(textFilePath)
-	except Exception as _:
-		fileNameEntryVar.set('problem reading \'%s\'' % motifFileName)
-		motifFileDir = ''
-		motifFileName = ''
-		setCreateBtnState()
-		if not textFile.closed:
-			textFile.close()
-		os.remove(textFilePath)
-	sys.stdout = realStdOut
+	exportJob = ExportJob(motifFilePath, selectedItems, os.path.realpath(textFilePath))
+	exportJob.start()
+	statusVar.set('reading...')
+	cancelBtn['state'] = 'enabled'
+	setCreateBtnState()
+	root.after(EXPORT_POLL_MS, pollExportFn)
+
+def cancelFn():
+	if exportJob is not None:
+		exportJob.cancel()
+		statusVar.set('cancelling...')
+
+def exportFinished():
+	global exportJob
+	exportJob = None
+	cancelBtn['state'] = 'disabled'
+	setCreateBtnState()
+
+def readProblem():							# the Motif file couldn't be read
+	global motifFileDir, motifFileName
+	statusVar.set('')
+	fileNameEntryVar.set('problem reading \'%s\'' % motifFileName)
+	motifFileDir = ''
+	motifFileName = ''
+
+def pollExportFn():							# runs on the Tk thread, via root.after
+	while True:
+		try:
+			kind, value = exportJob.messages.get_nowait()
+		except queue.Empty:
+			break
+		if kind == 'progress':
+			nBlocksDone, nBlocks, nEntriesDone = value
+			statusVar.set('block %d of %d, %d entries' % (nBlocksDone, nBlocks, nEntriesDone))
+		elif kind == 'done':
+			statusVar.set('saved %s' % os.path.basename(value))
+			exportFinished()
+			return
+		elif kind == 'cancelled':
+			statusVar.set('cancelled')
+			exportFinished()
+			return
+		else:									# 'failed'
+			readProblem()
+			exportFinished()
+			return
+	root.after(EXPORT_POLL_MS, pollExportFn)
+
+def clearPreview():
+	global previewJob
+	if previewJob is not None:
+		previewJob.cancel()
+		previewJob = None
+	previewLines.clear()
+	previewSections.clear()
+	previewUnfedRows.clear()
+	previewFeed.clear()
+	previewTree.delete(*previewTree.get_children())
+
+def refreshPreview():
+	# brings the preview in line with the selected file and check boxes, rendering only
+	# the blocks that haven't been rendered yet for this file
+	global previewJob, previewFilePath
+	motifFilePath = os.path.join(motifFileDir, motifFileName) if len(motifFileName) > 0 else ''
+	if motifFilePath != previewFilePath:
+		clearPreview()
+		previewFilePath = motifFilePath
+	selectedItems = selectedItemsList()
+	for blockAbbrev in list(previewSections.keys()):
+		if blockAbbrev not in selectedItems:
+			hidePreviewSection(blockAbbrev)
+	for blockAbbrev in selectedItems:
+		if blockAbbrev in previewLines and blockAbbrev not in previewSections:
+			showPreviewSection(blockAbbrev)
+	missingItems = [blockAbbrev for blockAbbrev in selectedItems if blockAbbrev not in previewLines]
+	if len(missingItems) > 0 and previewJob is None and len(motifFilePath) > 0:
+		previewJob = PreviewJob(motifFilePath, missingItems)
+		previewJob.start()
+		previewStatusVar.set('rendering preview...')
+		root.after(EXPORT_POLL_MS, pollPreviewFn, previewJob)
+
+def showPreviewSection(blockAbbrev):
+	# sections are kept in blockSpecs order, closed until the user opens them
+	index = 0
+	for otherAbbrev in blockSpecs.keys():
+		if otherAbbrev == blockAbbrev:
+			break
+		index += len(previewSections.get(otherAbbrev, ()))
+	sections = []
+	for lines in previewLines[blockAbbrev]:
+		section = previewTree.insert('', index, text = lines[0], open = False)
+		if len(lines) > 1:
+			previewTree.insert(section, 'end')		# placeholder, so the section can be opened
+			previewUnfedRows[section] = lines[1:]
+		sections.append(section)
+		index += 1
+	previewSections[blockAbbrev] = sections
+
+def hidePreviewSection(blockAbbrev):
+	for section in previewSections.pop(blockAbbrev):
+		previewUnfedRows.pop(section, None)
+		previewTree.delete(section)
+
+def previewOpenFn(event):
+	section = previewTree.focus()
+	rows = previewUnfedRows.pop(section, None)
+	if rows is not None:
+		previewTree.delete(*previewTree.get_children(section))
+		previewFeed.append([section, rows, 0])
+		if not previewFeeding:
+			feedPreview()
+
+def feedPreview():							# inserts queued rows a chunk at a time, via root.after
+	global previewFeeding
+	nRows = 0
+	while len(previewFeed) > 0 and nRows < PREVIEW_ROWS_PER_TICK:
+		feedItem = previewFeed[0]
+		section, rows, index = feedItem
+		if not previewTree.exists(section):			# hidden since it was opened
+			previewFeed.popleft()
+			continue
+		end = min(index + PREVIEW_ROWS_PER_TICK - nRows, len(rows))
+		for row in rows[index:end]:
+			previewTree.insert(section, 'end', text = row)
+		nRows += end - index
+		if end == len(rows):
+			previewFeed.popleft()
+		else:
+			feedItem[2] = end
+	previewFeeding = len(previewFeed) > 0
+	if previewFeeding:
+		root.after(1, feedPreview)
+
+def pollPreviewFn(job):						# runs on the Tk thread, via root.after
+	global previewJob
+	if job is not previewJob:					# superseded by a different file
+		return
+	selectedItems = selectedItemsList()
+	while True:
+		try:
+			kind, value = job.messages.get_nowait()
+		except queue.Empty:
+			break
+		if kind == 'block':
+			blockAbbrev, sections = value
+			previewLines[blockAbbrev] = sections
+			if blockAbbrev in selectedItems and blockAbbrev not in previewSections:
+				showPreviewSection(blockAbbrev)
+		elif kind == 'done' or kind == 'cancelled':
+			previewJob = None
+			previewStatusVar.set('')
+			refreshPreview()						# pick up check boxes changed meanwhile
+			return
+		else:									# 'failed'
+			previewJob = None
+			previewStatusVar.set('')
+			readProblem()
+			clearPreview()
+			setCreateBtnState()
+			return
+	root.after(EXPORT_POLL_MS, pollPreviewFn, job)
 
 def helpFn():
 	helpFileName = 'motif2textHelp.pdf'
@@ -128,7 +412,7 @@ def checkBoxKeyboardShortcutFn(ch):
 	try:
 		checkBox = checkBoxShortcuts[ch]
 		checkBox.variable.set(not checkBox.variable.get())
-		setCreateBtnState()
+		selectionChanged()
 	except KeyError:
 		pass
 
@@ -160,11 +444,11 @@ def keyPressFn(kpEvent):
 		pass
 
 def setupGUI(checkBoxStates):
-	global createTextBtn, fileNameEntryVar
+	global cancelBtn, createTextBtn, fileNameEntryVar, statusVar, previewTree, previewStatusVar
 
 	root.bind_all('<KeyPress>', keyPressFn)
 	rootFrame = ttk.Frame(root, padding = '12 12 12 12')
-	rootFrame.pack()
+	rootFrame.pack(fill = 'both', expand = True)
 
 	selectItemsFrame = ttk.LabelFrame(rootFrame, text = 'Select Items', padding = '6 0 6 6')
 	checkBoxFrame = ttk.Frame(selectItemsFrame, padding = '6 6 6 6')
@@ -196,14 +480,39 @@ def setupGUI(checkBoxStates):
 	selectFileBtn = ttk.Button(btnsFrame, text = 'Select File', command = selectFileFn, underline = 7)
 	selectFileBtn.grid(row = 0, column = 0, sticky = 'w', padx = 6)
 	createTextBtn = \
-		ttk.Button(btnsFrame, text = 'Create Text', command = createTextFn, state = 'disabled', underline = 7)
+		ttk.Button(btnsFrame, text = 'Save as Text', command = createTextFn, state = 'disabled', underline = 8)
 	createTextBtn.grid(row = 0, column = 1, sticky = 'w', padx = 12)
+	cancelBtn = ttk.Button(btnsFrame, text = 'Cancel', command = cancelFn, state = 'disabled')
+	cancelBtn.grid(row = 0, column = 2, sticky = 'w', padx = 6)
+	statusVar = StringVar()
+	statusLabel = ttk.Label(btnsFrame, textvariable = statusVar, width = 32)
+	statusLabel.grid(row = 1, column = 0, columnspan = 3, sticky = 'w', padx = 6, pady = 6)
 	btnsFrame.grid(row = 2, column = 0, padx = 12, sticky = 'ew')
 	
 	helpBtnFrame = ttk.Frame(rootFrame, padding = '12 12 12 12')
 	helpBtn = ttk.Button(helpBtnFrame, text = 'Help', command = helpFn, underline = 0)
 	helpBtn.grid(row = 0, column = 0, sticky = 'e')
 	helpBtnFrame.grid(row = 2, column = 1, padx = 12, sticky = 'ew')
+
+	# Treeview only draws the rows in view, so long sections stay cheap to scroll
+	previewFrame = ttk.LabelFrame(rootFrame, text = 'Preview', padding = '6 6 6 6')
+	ttk.Style().configure('Preview.Treeview', font = 'TkFixedFont')
+	previewTree = ttk.Treeview(previewFrame, show = 'tree', selectmode = 'browse',
+							   style = 'Preview.Treeview', height = 24)
+	previewTree.column('#0', width = 480, stretch = True)
+	previewTree.bind('<<TreeviewOpen>>', previewOpenFn)
+	previewScrollbar = ttk.Scrollbar(previewFrame, orient = 'vertical', command = previewTree.yview)
+	previewTree['yscrollcommand'] = previewScrollbar.set
+	previewTree.grid(row = 0, column = 0, sticky = 'nsew')
+	previewScrollbar.grid(row = 0, column = 1, sticky = 'ns')
+	previewStatusVar = StringVar()
+	previewStatusLabel = ttk.Label(previewFrame, textvariable = previewStatusVar)
+	previewStatusLabel.grid(row = 1, column = 0, sticky = 'w', pady = 4)
+	previewFrame.rowconfigure(0, weight = 1)
+	previewFrame.columnconfigure(0, weight = 1)
+	previewFrame.grid(row = 0, column = 2, rowspan = 3, padx = 12, sticky = 'nsew')
+	rootFrame.rowconfigure(2, weight = 1)
+	rootFrame.columnconfigure(2, weight = 1)
 	
 	setCreateBtnState()
 
@@ -217,6 +526,11 @@ def getAppDirectory():									# returns directory app is in
 		# realpath to get os-specific path separators, e.g. '\' for Windows
 
 def windowCloseRequested():
+	if exportJob is not None:				# stop it and let it remove its partial .tmp file
+		exportJob.cancel()
+		exportJob.thread.join(2.0)
+	if previewJob is not None:
+		previewJob.cancel()
 	config[STATE_SECTION_NAME] = { \
 		WN_POSN_KEY			:	'%d, %d' % (root.winfo_x(), root.winfo_y()),
 		MOTIF_FILE_DIR_KEY	:	motifFileDir,
@@ -262,9 +576,9 @@ def run():
 	root.protocol('WM_DELETE_WINDOW', windowCloseRequested)
 	
 	setupGUI(checkBoxStates)
+	refreshPreview()
 
 	root.title('motif2text    v%s(%s)' % (VERSION, PMF_VERSION))
-	root.resizable(False, False)
 	root.mainloop()
 
 if __name__ == '__main__':
@@ -0,0 +1,143 @@
+'''
+Reads Motif files straight out of zip and tar archives, without extracting
+them first.
+
+A Motif file in an archive is named 'archive.zip!/path/file.X0A'. Small
+members are read whole into memory (and then parsed through a memoryview,
+like an mmapped file); larger ones are read through the archive's own
+seekable member stream. Open archives are kept per process, so a batch
+over an archive opens it once rather than once per member.
+'''
+
+import collections, io, os, tarfile, threading, zipfile
+
+from printMotifFile import ARCHIVE_MEMBER_SEP
+
+ARCHIVE_EXTS =			('.zip', '.tar', '.tgz', '.tar.gz', '.tbz2', '.tar.bz2', '.txz', '.tar.xz')
+SMALL_MEMBER_SIZE =		1 << 25			# members up to this size are read into memory
+OPEN_ARCHIVES_MAX =		8
+
+def isArchivePath(path):
+	return path.lower().endswith(ARCHIVE_EXTS) and os.path.isfile(path)
+
+def splitArchivePath(path):
+	'''
+	Returns (archive path, member name) for 'archive.zip!/path/file.X0A',
+	or (path, None) if path doesn't name an archive member.
+	'''
+	i = path.find(ARCHIVE_MEMBER_SEP)
+	while i >= 0:
+		if os.path.isfile(path[:i]):
+			return path[:i], path[i + len(ARCHIVE_MEMBER_SEP):]
+		i = path.find(ARCHIVE_MEMBER_SEP, i + 1)
+	return path, None
+
+def isFile(path):
+	# like os.path.isfile(), but also true for members of archives
+	archivePath, memberName = splitArchivePath(path)
+	if memberName is None:
+		return os.path.isfile(path)
+	try:
+		return memberName in openArchive(archivePath).memberNames()
+	except IOError:
+		return False
+
+def memberPath(archivePath, memberName):
+	return archivePath + ARCHIVE_MEMBER_SEP + memberName
+
+def extractedPath(path):
+	# where an archive member would be if its archive were extracted next to it
+	archivePath, memberName = splitArchivePath(path)
+	if memberName is None:
+		return path
+	for archiveExt in ARCHIVE_EXTS:
+		if archivePath.lower().endswith(archiveExt):
+			archivePath = archivePath[:-len(archiveExt)]
+			break
+	return os.path.join(archivePath, *memberName.split('/'))
+
+class Archive:
+	# an open zip or tar archive, whose members may be opened from several threads
+	def __init__(self, archivePath):
+		self.archivePath =	archivePath
+		stat = os.stat(archivePath)
+		self.fileKey =		(stat.st_size, stat.st_mtime_ns)
+		self.lock =			threading.Lock()
+		self.zipFile =		None
+		self.tarFile =		None
+		if zipfile.is_zipfile(archivePath):
+			self.zipFile = zipfile.ZipFile(archivePath)
+		elif tarfile.is_tarfile(archivePath):
+			self.tarFile = tarfile.open(archivePath)
+		else:
+			raise IOError('not a zip or tar archive: %s' % archivePath)
+
+	def memberNames(self):
+		# names of all the regular files in the archive
+		if self.zipFile is not None:
+			return [info.filename for info in self.zipFile.infolist() if not info.is_dir()]
+		return [info.name for info in self.tarFile.getmembers() if info.isfile()]
+
+	def open(self, memberName):
+		'''
+		Returns a seekable binary stream of memberName: an io.BytesIO if it is
+		small, otherwise the archive's member stream.
+		'''
+		with self.lock:
+			try:
+				if self.zipFile is not None:
+					size = self.zipFile.getinfo(memberName).file_size
+					memberStream = self.zipFile.open(memberName)
+				else:
+					info = self.tarFile.getmember(memberName)
+					size = info.size
+					memberStream = self.tarFile.extractfile(info)
+			except KeyError:
+				raise IOError('could not open file: %s' % memberPath(self.archivePath, memberName))
+			if size <= SMALL_MEMBER_SIZE:
+				with memberStream:
+					return io.BytesIO(memberStream.read())
+			return memberStream
+
+	def close(self):
+		if self.zipFile is not None:
+			self.zipFile.close()
+		else:
+			self.tarFile.close()
+
+openArchives =		collections.OrderedDict()	# archive path -> Archive, least recently used first
+openArchivesLock =	threading.Lock()
+
+def openArchive(archivePath):
+	# returns the open Archive for archivePath, opening it if it isn't open or has changed
+	archivePath = os.path.abspath(archivePath)
+	stat = os.stat(archivePath)
+	with openArchivesLock:
+		archive = openArchives.pop(archivePath, None)
+		if archive is not None and archive.fileKey != (stat.st_size, stat.st_mtime_ns):
+			archive.close()
+			archive = None
+		if archive is None:
+			archive = Archive(archivePath)
+		openArchives[archivePath] = archive
+		while len(openArchives) > OPEN_ARCHIVES_MAX:
+			_, oldArchive = openArchives.popitem(last = False)
+			oldArchive.close()
+	return archive
+
+def openInput(path):
+	# returns a seekable binary stream of a Motif file, which may be in an archive
+	archivePath, memberName = splitArchivePath(path)
+	if memberName is None:
+		try:
+			return open(path, 'rb')
+		except IOError:
+			raise IOError('could not open file: %s' % path)
+	return openArchive(archivePath).open(memberName)
+
+def archiveMemberPaths(archivePath, memberNameFilter = None):
+	# 'archive!/member' paths of the members for which memberNameFilter(name) is true, sorted
+	memberNames = openArchive(archivePath).memberNames()
+	if memberNameFilter is not None:
+		memberNames = filter(memberNameFilter, memberNames)
+	return sorted(memberPath(archivePath, memberName) for memberName in memberNames)
@@ -0,0 +1,180 @@
+'''
+Prints many Motif files at once, in parallel across a process pool.
+
+Inputs may be files, directories (walked recursively for Motif files), glob
+patterns, zip or tar archives (all the Motif files in them) or Motif files
+in archives ('archive.zip!/path/file.X0A'). Each file gets its own .txt report, or all reports are written
+to one stream in a stable (sorted by path) order. One bad file only fails
+that file; the rest of the batch goes on.
+'''
+
+import collections, concurrent.futures, glob, io, os, re, sys
+
+import motifArchive
+from printMotifFile import printMotifFile
+
+# Motif file name extensions look like .X0A, .X3A, .X8A, .X0V, ...
+MOTIF_FILE_NAME_RE = re.compile(r'.*\.X[0-9A-Z][0-9A-Z]$', re.IGNORECASE)
+
+FILES_IN_FLIGHT_PER_WORKER =	4
+
+class BatchResult:
+	def __init__(self, fileName, ok, message, text = None):
+		self.fileName =		fileName
+		self.ok =			ok
+		self.message =		message			# output file path, or what went wrong
+		self.text =			text			# the report, if it wasn't written to a file
+
+def isMotifFileName(fileName):
+	return MOTIF_FILE_NAME_RE.match(fileName) is not None
+
+def expandPaths(paths):
+	'''
+	Returns the sorted, de-duplicated list of Motif files named by paths,
+	which may be files, directories, glob patterns, archives or archive
+	members.
+	'''
+	fileNames = set()
+	for path in paths:
+		if os.path.isdir(path):
+			for dirPath, _, dirFileNames in os.walk(path):
+				for dirFileName in dirFileNames:
+					if MOTIF_FILE_NAME_RE.match(dirFileName):
+						fileNames.add(os.path.join(dirPath, dirFileName))
+					elif motifArchive.isArchivePath(os.path.join(dirPath, dirFileName)):
+						fileNames.update(motifArchive.archiveMemberPaths(os.path.join(dirPath, dirFileName),
+																		 isMotifFileName))
+		elif motifArchive.isArchivePath(path):
+			fileNames.update(motifArchive.archiveMemberPaths(path, isMotifFileName))
+		elif os.path.isfile(path) or motifArchive.splitArchivePath(path)[1] is not None:
+			fileNames.add(path)
+		else:
+			for globPath in glob.glob(path, recursive = True):
+				if motifArchive.isArchivePath(globPath):
+					fileNames.update(motifArchive.archiveMemberPaths(globPath, isMotifFileName))
+				elif os.path.isfile(globPath):
+					fileNames.add(globPath)
+				elif os.path.isdir(globPath):
+					fileNames.update(expandPaths([globPath]))
+	return sorted(fileNames)
+
+def errorString(e):
+	return str(e) or e.__class__.__name__
+
+def callOrError(fn, *args):
+	# runs in a worker process; errors come back as strings so one bad file doesn't stop the rest
+	try:
+		return fn(*args), None
+	except Exception as e:
+		return None, errorString(e)
+
+def mapFiles(fn, jobArgs, nWorkers = None, ordered = True):
+	'''
+	Calls fn(*args) for each args tuple in jobArgs, whose first item is a
+	file name, across a process pool (nWorkers processes, None: one per
+	CPU). Yields (fileName, result, error): in jobArgs order if ordered,
+	otherwise as each call finishes. error is None if fn returned, else a
+	string saying what went wrong (including the worker dying), and result
+	is then None. Only FILES_IN_FLIGHT_PER_WORKER calls per worker are
+	submitted at once, and a result isn't kept once it has been yielded, so
+	memory use doesn't grow with the number of files.
+	'''
+	if nWorkers is None:
+		nWorkers = os.cpu_count() or 1
+	jobArgs = iter(jobArgs)
+	with concurrent.futures.ProcessPoolExecutor(nWorkers) as executor:
+		pending = collections.OrderedDict()			# future -> args, in the order submitted
+		while True:
+			while len(pending) < nWorkers * FILES_IN_FLIGHT_PER_WORKER:
+				args = next(jobArgs, None)
+				if args is None:
+					break
+				pending[executor.submit(callOrError, fn, *args)] = args
+			if len(pending) == 0:
+				break
+			if ordered:
+				done = [next(iter(pending))]
+			else:
+				done, _ = concurrent.futures.wait(pending.keys(), return_when = concurrent.futures.FIRST_COMPLETED)
+			for future in done:
+				args = pending.pop(future)
+				try:
+					result, error = future.result()
+				except Exception as e:				# e.g. the worker process died
+					result, error = None, errorString(e)
+				yield args[0], result, error
+
+def textFilePathFor(fileName, outDir, baseDir):
+	# reports of Motif files in archives go where they would if the archive were extracted
+	fileName = motifArchive.extractedPath(fileName)
+	if outDir is None:
+		return fileName + '.txt'
+	return os.path.join(outDir, os.path.relpath(fileName, baseDir) + '.txt')
+
+def printFileToText(fileName, selectedItems, textFilePath):
+	# runs in a worker process
+	try:
+		if textFilePath is None:
+			out = io.StringIO()
+			printMotifFile(fileName, selectedItems, out = out)
+			return BatchResult(fileName, True, '', out.getvalue())
+		textDir = os.path.dirname(textFilePath)
+		if textDir:
+			os.makedirs(textDir, exist_ok = True)
+		with open(textFilePath, 'w') as textFile:
+			try:
+				printMotifFile(fileName, selectedItems, out = textFile)
+			except:
+				textFile.close()
+				os.remove(textFilePath)
+				raise
+		return BatchResult(fileName, True, textFilePath)
+	except Exception as e:
+		return BatchResult(fileName, False, errorString(e))
+
+def printFiles(fileNames, selectedItems, nWorkers = None, outDir = None, combinedOut = None):
+	'''
+	Prints each file in fileNames. If combinedOut is given, all reports are
+	written to it in fileNames order, otherwise each one goes to its own .txt
+	file (next to the Motif file, or under outDir). Yields a BatchResult per
+	file, in fileNames order.
+	'''
+	if len(fileNames) == 0:
+		return
+	baseDir = os.path.commonpath([os.path.dirname(os.path.abspath(motifArchive.extractedPath(fileName)))
+								  for fileName in fileNames])
+	jobArgs = ((fileName, selectedItems,
+				None if combinedOut is not None else textFilePathFor(fileName, outDir, baseDir))
+			   for fileName in fileNames)
+	first = True
+	for fileName, result, error in mapFiles(printFileToText, jobArgs, nWorkers):
+		if error is not None:
+			result = BatchResult(fileName, False, error)
+		if result.ok and combinedOut is not None:
+			if first:
+				first = False
+			else:
+				combinedOut.write('\n')
+			combinedOut.write(result.text)
+			result.text = None
+		yield result
+
+def printBatch(paths, selectedItems, nWorkers = None, outDir = None, combined = False):
+	'''
+	Prints every Motif file named by paths and a per-file summary to stderr.
+	Returns the number of files that failed.
+	'''
+	fileNames = expandPaths(paths)
+	if len(fileNames) == 0:
+		print('no Motif files found', file = sys.stderr)
+		return 0
+	nFailed = 0
+	combinedOut = sys.stdout if combined else None
+	for result in printFiles(fileNames, selectedItems, nWorkers, outDir, combinedOut):
+		if result.ok:
+			print('ok      %s' % result.fileName, file = sys.stderr)
+		else:
+			nFailed += 1
+			print('FAILED  %s (%s)' % (result.fileName, result.message), file = sys.stderr)
+	print('%d files, %d ok, %d failed' % (len(fileNames), len(fileNames) - nFailed, nFailed), file = sys.stderr)
+	return nFailed
@@ -0,0 +1,115 @@
+'''
+Finds identical waveforms across a library of Motif files, e.g. the same
+user samples kept in many backups, even when their names differ.
+
+Each EWFM entry's Data chunk is hashed in place (an mmap slice, or a few
+bounded reads when the file can't be mapped), across a process pool. The
+hashes go into a persistent SQLite index in the cache directory, keyed by
+each file's path, size and mtime, so later runs only hash new or changed
+files.
+'''
+
+import os, sys
+
+import motifBatch, motifIndex
+from motifDiff import regionHash
+from printMotifFile import MotifFile, blockSpecs
+
+INDEX_FILE_NAME =	'waveforms.sqlite'
+
+def waveformHashes(fileName):
+	'''
+	Returns [(number, label, name, waveform type, data size, hash), ...]
+	for the waveforms in a Motif file that have data.
+	'''
+	blockSpec = blockSpecs['wf']
+	rows = []
+	with MotifFile(fileName) as motifFile:
+		if not motifFile.hasBlock(blockSpec.ident) or not motifFile.hasBlock(blockSpec.dataIdent):
+			return rows
+		dataBlockPosn = motifFile.catalog[blockSpec.dataIdent]
+		layout = motifFile.layout
+		for entry in motifFile.entries(blockSpec):
+			if entry.dataSize == 0:
+				continue
+			dataPosn = dataBlockPosn + entry.dataOffset + 8		# skip the Data chunk's header
+			waveformType = layout.waveformTypes[layout.waveformTypeIndex(entry.number)]
+			rows.append((entry.number, entry.label, entry.name.split(':')[-1], waveformType.name,
+						 entry.dataSize, regionHash(motifFile, dataPosn, dataPosn + entry.dataSize)))
+	return rows
+
+class WaveformIndex:
+	# waveform hashes of every file hashed so far; re-hashing a file replaces its rows
+	def __init__(self, dbPath = None):
+		self.db = motifIndex.openCacheDatabase(dbPath, INDEX_FILE_NAME)
+		self.db.execute('CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER)')
+		self.db.execute('CREATE TABLE IF NOT EXISTS waveforms '
+						'(file TEXT, number INTEGER, label TEXT, name TEXT, waveform_type TEXT, '
+						'size INTEGER, hash BLOB)')
+		self.db.execute('CREATE INDEX IF NOT EXISTS waveforms_file ON waveforms (file)')
+		self.db.execute('CREATE INDEX IF NOT EXISTS waveforms_hash ON waveforms (hash)')
+		self.db.commit()
+
+	def update(self, key, rows):
+		filePath = key[0]
+		self.db.execute('DELETE FROM waveforms WHERE file = ?', (filePath,))
+		self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?)', key)
+		self.db.executemany('INSERT INTO waveforms VALUES (?, ?, ?, ?, ?, ?, ?)',
+							[(filePath,) + row for row in rows])
+		self.db.commit()
+
+	def duplicates(self, filePaths):
+		'''
+		Returns [(size, [(file, waveform type, label, name), ...]), ...], one
+		item per waveform that is stored more than once in filePaths, biggest
+		waste of space first.
+		'''
+		self.db.execute('CREATE TEMP TABLE IF NOT EXISTS selected_files (file TEXT PRIMARY KEY)')
+		self.db.execute('DELETE FROM selected_files')
+		self.db.executemany('INSERT OR IGNORE INTO selected_files VALUES (?)', [(path,) for path in filePaths])
+		groups = {}
+		for hash, size, filePath, waveformType, label, name in self.db.execute(
+				'SELECT hash, size, file, waveform_type, label, name FROM waveforms '
+				'WHERE file IN (SELECT file FROM selected_files) ORDER BY file, number'):
+			groups.setdefault(hash, (size, []))[1].append((filePath, waveformType, label, name))
+		duplicates = [group for group in groups.values() if len(group[1]) > 1]
+		duplicates.sort(key = lambda group: (-group[0] * (len(group[1]) - 1), group[1][0]))
+		return duplicates
+
+	def close(self):
+		self.db.close()
+
+def printDedupe(paths, dbPath = None, nWorkers = None, out = None):
+	'''
+	Prints the waveforms that are stored more than once in the Motif files
+	named by paths (files, directories or glob patterns). Progress goes to
+	stderr. Returns the number of files that could not be read.
+	'''
+	if out is None:
+		out = sys.stdout
+	fileNames = motifBatch.expandPaths(paths)
+	index = WaveformIndex(dbPath)
+	try:
+		nHashed = nFailed = 0
+		for fileName, error in motifIndex.refreshFiles(index.db, fileNames, waveformHashes, index.update, nWorkers):
+			if error is None:
+				nHashed += 1
+				print('hashed  %s' % fileName, file = sys.stderr)
+			else:
+				nFailed += 1
+				print('FAILED  %s (%s)' % (fileName, error), file = sys.stderr)
+		print('%d files, %d hashed, %d already indexed, %d failed' %
+			  (len(fileNames), nHashed, len(fileNames) - nHashed - nFailed, nFailed), file = sys.stderr)
+		duplicates = index.duplicates([os.path.abspath(fileName) for fileName in fileNames])
+	finally:
+		index.close()
+
+	nWastedBytes = 0
+	for size, copies in duplicates:
+		print('%d copies, %d bytes each' % (len(copies), size), file = out)
+		for filePath, waveformType, label, name in copies:
+			print('   %s  %s %s: %s' % (filePath, waveformType, label, name), file = out)
+		print(file = out)
+		nWastedBytes += size * (len(copies) - 1)
+	print('%d waveforms stored more than once, %d bytes in extra copies' % (len(duplicates), nWastedBytes), file = out)
+	return nFailed
@@ -0,0 +1,136 @@
+'''
+Compares two Motif files, e.g. two backups of the same synth, block by block.
+
+Each block's bytes (its E block plus its D block of Data chunks) are hashed
+first, straight from the mmapped files, and blocks that are byte-identical
+are skipped. In the blocks that differ, entries are matched by entry number
+(their slot in the synth) and reported as added, removed, renamed or
+changed, which means their Data chunk differs.
+'''
+
+import hashlib, sys
+
+from printMotifFile import MotifFile, blockSpecs, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+HASH_CHUNK_SIZE = 1 << 20		# for reading blocks when the file can't be mmapped
+
+class EntryChange:
+	ADDED =		'+'
+	REMOVED =	'-'
+	RENAMED =	'~'
+	CHANGED =	'*'
+
+	def __init__(self, kind, label, name, newName = None):
+		self.kind =		kind
+		self.label =	label
+		self.name =		name
+		self.newName =	newName			# for RENAMED
+
+	def __str__(self):
+		if self.kind == EntryChange.RENAMED:
+			return '%s %s %s -> %s' % (self.kind, self.label, self.name, self.newName)
+		elif self.kind == EntryChange.CHANGED:
+			return '%s %s %s (data changed)' % (self.kind, self.label, self.name)
+		return '%s %s %s' % (self.kind, self.label, self.name)
+
+def regionHash(motifFile, start, end):
+	digest = hashlib.blake2b(digest_size = 16)
+	if motifFile.inputView is not None:
+		region = motifFile.inputView[start:end]
+		digest.update(region)
+		region.release()
+	else:
+		inputStream = motifFile.inputStream
+		posn = inputStream.tell()			# may be in the middle of reading a block's entries
+		inputStream.seek(start)
+		while start < end:
+			chunk = inputStream.read(min(HASH_CHUNK_SIZE, end - start))
+			if len(chunk) == 0:
+				break
+			digest.update(chunk)
+			start += len(chunk)
+		inputStream.seek(posn)
+	return digest.digest()
+
+def blockHash(motifFile, blockSpec):
+	# hash of the block and its Data chunks, or None if the file has no such block
+	if not motifFile.hasBlock(blockSpec.ident):
+		return None
+	digest = hashlib.blake2b(regionHash(motifFile, *motifFile.blockExtent(blockSpec.ident)), digest_size = 16)
+	if motifFile.hasBlock(blockSpec.dataIdent):
+		digest.update(regionHash(motifFile, *motifFile.blockExtent(blockSpec.dataIdent)))
+	return digest.digest()
+
+def entryHash(entry):
+	data = entry.data
+	return None if data is None else hashlib.blake2b(data, digest_size = 16).digest()
+
+def blockEntries(motifFile, blockSpec):
+	# {entry number: entry} for the entries of blockSpec, which for EVCE is just one kind of voice
+	if not motifFile.hasBlock(blockSpec.ident):
+		return {}
+	kind = VOICE_KIND_BY_PRINT_FN.get(blockSpec.printFn) if blockSpec.ident == b'EVCE' else None
+	return {entry.number : entry for entry in motifFile.entries(blockSpec)
+			if kind is None or voiceKind(entry.number) == kind}
+
+def diffBlock(motifFileA, motifFileB, blockSpec):
+	'''
+	Returns a list of EntryChanges that turn blockSpec's entries in
+	motifFileA into those in motifFileB, in entry number order.
+	'''
+	entriesA = blockEntries(motifFileA, blockSpec)
+	entriesB = blockEntries(motifFileB, blockSpec)
+	changes = []
+	for entryNumber in sorted(entriesA.keys() | entriesB.keys()):
+		entryA = entriesA.get(entryNumber)
+		entryB = entriesB.get(entryNumber)
+		if entryA is None:
+			changes.append(EntryChange(EntryChange.ADDED, entryB.label, entryB.name))
+		elif entryB is None:
+			changes.append(EntryChange(EntryChange.REMOVED, entryA.label, entryA.name))
+		else:
+			if entryA.name != entryB.name:
+				changes.append(EntryChange(EntryChange.RENAMED, entryB.label, entryA.name, entryB.name))
+			if entryHash(entryA) != entryHash(entryB):
+				changes.append(EntryChange(EntryChange.CHANGED, entryB.label, entryB.name))
+	return changes
+
+def diffFiles(fileNameA, fileNameB, selectedItems = ()):
+	'''
+	Yields (blockSpec, changes) for the selectedItems (blockSpecs keys; all of
+	them if empty) of two Motif files, where changes is None if the block is
+	byte-identical in both files.
+	'''
+	if len(selectedItems) == 0:
+		selectedItems = blockSpecs.keys()
+	with MotifFile(fileNameA) as motifFileA, MotifFile(fileNameB) as motifFileB:
+		blockHashes = {}		# by ident; the 3 kinds of voice share the EVCE block
+		for blockAbbrev in selectedItems:
+			blockSpec = blockSpecs[blockAbbrev]
+			if blockSpec.ident not in blockHashes:
+				blockHashes[blockSpec.ident] = (blockHash(motifFileA, blockSpec), blockHash(motifFileB, blockSpec))
+			hashA, hashB = blockHashes[blockSpec.ident]
+			if hashA == hashB:
+				yield blockSpec, None
+			else:
+				yield blockSpec, diffBlock(motifFileA, motifFileB, blockSpec)
+
+def printDiff(fileNameA, fileNameB, selectedItems = (), out = None):
+	'''
+	Prints what changed from fileNameA to fileNameB. Returns the number of
+	changed entries.
+	'''
+	if out is None:
+		out = sys.stdout
+	nChanges = 0
+	for blockSpec, changes in diffFiles(fileNameA, fileNameB, selectedItems):
+		if changes is None:
+			print('%-16s same' % blockSpec.name, file = out)
+		elif len(changes) == 0:
+			print('%-16s same entries' % blockSpec.name, file = out)
+		else:
+			print('%-16s %d changes' % (blockSpec.name, len(changes)), file = out)
+			for change in changes:
+				print('   %s' % change, file = out)
+			nChanges += len(changes)
+	return nChanges
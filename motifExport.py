@@ -0,0 +1,203 @@
+'''
+Exports the contents of Motif files as JSON Lines, CSV or SQLite, for tools
+that would otherwise have to scrape printMotifFile's text output.
+
+There is one table per BlockSpec in blockSpecs (e.g. 'voices',
+'mixing_voices', 'waveforms'), plus 'waveform_duplicates'. Every row starts
+with the Motif file's path, so many files can go into one export. Rows are
+written a whole block at a time: one executemany() per block for SQLite,
+one buffered write per block for the text formats.
+'''
+
+import collections, csv, json, os, sqlite3, sys
+
+import motifBatch
+from printMotifFile import MotifFile, blockSpecs, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+DEFAULT_BUFFER_SIZE =	1 << 20
+
+def tableName(blockSpec):
+	return blockSpec.name.lower().replace(' ', '_')
+
+ENTRY_COLUMNS = ('file', 'label', 'number', 'name')
+
+TABLE_COLUMNS = collections.OrderedDict(
+	[(tableName(blockSpec), ENTRY_COLUMNS) for blockSpec in blockSpecs.values()])
+TABLE_COLUMNS['masters'] =				ENTRY_COLUMNS + ('target_type', 'target')
+TABLE_COLUMNS['waveforms'] =			ENTRY_COLUMNS + ('waveform_type',)
+TABLE_COLUMNS['waveform_duplicates'] =	('file', 'waveform_type', 'name', 'label', 'duplicate_label')
+
+# these blocks' names are printed without their 'category:' prefix
+SPLIT_NAME_IDENTS = {b'EPFM', b'EVCE', b'EARP', b'EWFM'}
+
+def entryRows(motifFile, fileName, blockAbbrev, entries):
+	blockSpec = blockSpecs[blockAbbrev]
+	splitName = blockSpec.ident in SPLIT_NAME_IDENTS
+	rows = []
+	for entry in entries:
+		name = entry.name.split(':')[-1] if splitName else entry.name
+		row = (fileName, entry.label, entry.number, name)
+		if blockAbbrev == 'ms':
+			row += (entry.params['targetType'], entry.params['target'])
+		elif blockAbbrev == 'wf':
+			layout = motifFile.layout
+			row += (layout.waveformTypes[layout.waveformTypeIndex(entry.number)].name,)
+		rows.append(row)
+	return rows
+
+def waveformDuplicateRows(waveformRows):
+	# pairs up the waveforms with the same name within each waveform type
+	byName = collections.defaultdict(list)
+	for row in waveformRows:
+		byName[(row[4], row[3])].append(row[1])
+	rows = []
+	for row in waveformRows:
+		labels = byName[(row[4], row[3])]
+		for label in labels:
+			if label != row[1]:
+				rows.append((row[0], row[4], row[3], row[1], label))
+	return rows
+
+def fileTables(fileName, selectedItems = ()):
+	'''
+	Returns (fileVersionStr, [(table, rows), ...]) for the selectedItems
+	(blockSpecs keys; all of them if empty) of fileName.
+	'''
+	if len(selectedItems) == 0:
+		selectedItems = blockSpecs.keys()
+	tables = []
+	with MotifFile(fileName) as motifFile:
+		voiceEntries = None
+		for blockAbbrev in selectedItems:
+			blockSpec = blockSpecs[blockAbbrev]
+			if not motifFile.hasBlock(blockSpec.ident):
+				continue
+			if blockSpec.ident == b'EVCE':			# holds all 3 kinds of voice
+				if voiceEntries is None:			# only need to read 'EVCE' block once
+					voiceEntries = list(motifFile.entries(blockSpec))
+				kind = VOICE_KIND_BY_PRINT_FN[blockSpec.printFn]
+				entries = [entry for entry in voiceEntries if voiceKind(entry.number) == kind]
+			else:
+				entries = motifFile.entries(blockSpec)
+			rows = entryRows(motifFile, fileName, blockAbbrev, entries)
+			tables.append((tableName(blockSpec), rows))
+			if blockAbbrev == 'wf':
+				tables.append(('waveform_duplicates', waveformDuplicateRows(rows)))
+		return motifFile.fileVersionStr, tables
+
+class JsonLinesWriter:
+	def __init__(self, out, bufferSize = DEFAULT_BUFFER_SIZE):
+		if out == '-':
+			self.out = sys.stdout
+			self.ownsOut = False
+		else:
+			self.out = open(out, 'w', encoding = 'utf-8', buffering = bufferSize)
+			self.ownsOut = True
+
+	def beginFile(self, fileName, fileVersionStr):
+		pass
+
+	def writeRows(self, table, rows):
+		columns = TABLE_COLUMNS[table]
+		lines = []
+		for row in rows:
+			record = {'table' : table}
+			record.update(zip(columns, row))
+			lines.append(json.dumps(record))
+			lines.append('\n')
+		self.out.write(''.join(lines))
+
+	def endFile(self):
+		pass
+
+	def close(self):
+		if self.ownsOut:
+			self.out.close()
+		else:
+			self.out.flush()
+
+class CsvWriter:
+	# writes one <table>.csv per table into outDir
+	def __init__(self, outDir, bufferSize = DEFAULT_BUFFER_SIZE):
+		self.outDir =		outDir
+		self.bufferSize =	bufferSize
+		self.files =		{}
+		self.writers =		{}
+		os.makedirs(outDir, exist_ok = True)
+
+	def beginFile(self, fileName, fileVersionStr):
+		pass
+
+	def writeRows(self, table, rows):
+		if table not in self.writers:
+			csvFile = open(os.path.join(self.outDir, table + '.csv'), 'w', newline = '',
+						   encoding = 'utf-8', buffering = self.bufferSize)
+			self.files[table] = csvFile
+			self.writers[table] = csv.writer(csvFile)
+			self.writers[table].writerow(TABLE_COLUMNS[table])
+		self.writers[table].writerows(rows)
+
+	def endFile(self):
+		pass
+
+	def close(self):
+		for csvFile in self.files.values():
+			csvFile.close()
+
+class SqliteWriter:
+	# one table per TABLE_COLUMNS entry, plus 'files'; re-exporting a file replaces its rows
+	def __init__(self, dbPath):
+		self.db = sqlite3.connect(dbPath)
+		self.db.execute('PRAGMA synchronous = OFF')
+		self.db.execute('CREATE TABLE IF NOT EXISTS files (file TEXT PRIMARY KEY, version TEXT)')
+		for table, columns in TABLE_COLUMNS.items():
+			self.db.execute('CREATE TABLE IF NOT EXISTS %s (%s)' % (table, ', '.join(columns)))
+			self.db.execute('CREATE INDEX IF NOT EXISTS %s_file ON %s (file)' % (table, table))
+		self.db.commit()
+		self.inserts = dict(
+			(table, 'INSERT INTO %s VALUES (%s)' % (table, ', '.join('?' * len(columns))))
+			for table, columns in TABLE_COLUMNS.items())
+
+	def beginFile(self, fileName, fileVersionStr):
+		if self.db.execute('SELECT 1 FROM files WHERE file = ?', (fileName,)).fetchone():
+			for table in TABLE_COLUMNS:
+				self.db.execute('DELETE FROM %s WHERE file = ?' % table, (fileName,))
+		self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?)', (fileName, fileVersionStr))
+
+	def writeRows(self, table, rows):
+		self.db.executemany(self.inserts[table], rows)
+
+	def endFile(self):
+		self.db.commit()
+
+	def close(self):
+		self.db.commit()
+		self.db.close()
+
+writerClasses = {
+	'jsonl' :	JsonLinesWriter,
+	'csv' :		CsvWriter,
+	'sqlite' :	SqliteWriter,
+	}
+
+def openWriter(format, out):
+	return writerClasses[format](out)
+
+def exportTables(writer, fileName, fileVersionStr, tables):
+	writer.beginFile(fileName, fileVersionStr)
+	for table, rows in tables:
+		writer.writeRows(table, rows)
+	writer.endFile()
+
+def exportFiles(fileNames, selectedItems, writer, nWorkers = None):
+	'''
+	Parses fileNames across a process pool and writes them to writer in
+	fileNames order, with only a few files' rows in memory at once. Yields
+	(fileName, error) per file; error is None if ok.
+	'''
+	jobArgs = ((fileName, selectedItems) for fileName in fileNames)
+	for fileName, result, error in motifBatch.mapFiles(fileTables, jobArgs, nWorkers):
+		if error is None:
+			fileVersionStr, tables = result
+			exportTables(writer, fileName, fileVersionStr, tables)
+		yield fileName, error
@@ -0,0 +1,190 @@
+'''
+Writes a new Motif file holding just some of the blocks or entries of
+another one, e.g. to share the patterns or user waveforms of a big
+all-in-one backup.
+
+Whole blocks are copied byte for byte. For a block with only some of its
+entries selected, a new block is built from those entries, and a new D
+block from their Data chunks, with each entry's data offset rewritten.
+The catalog is rebuilt for the new block offsets. Bytes are copied in the
+kernel with os.copy_file_range() (or os.sendfile()) where possible,
+otherwise as large memoryview slices of the mmapped file, and never
+decoded. The new file is written to a temporary file next to it, which
+replaces it only once it is complete.
+'''
+
+import os, stat, struct
+
+import motifArchive, motifIndex
+from printMotifFile import BLOCK_HDR_LGTH, CATALOG_ENTRY_LGTH, ENTRY_HDR_LGTH, \
+	FILE_HDR_LGTH, MotifFile, blockSpecs, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+COPY_CHUNK_SIZE =			1 << 24
+ENTRY_DATA_OFFSET_POSN =	20			# of dataOffset in an entry header
+CATALOG_SIZE_POSN =			32			# of catalogSize in the file header
+
+def parseSelection(args):
+	'''
+	Returns {blockSpecs key: None (every entry) or [entry keys]} for args
+	like ['pt', 'wf=0001,0002', 'vc=USR1:005,#1234'].
+	'''
+	selection = {}
+	for arg in args:
+		blockAbbrev, _, keys = arg.partition('=')
+		if blockAbbrev not in blockSpecs:
+			raise ValueError('unknown data type: %s' % blockAbbrev)
+		if keys == '':
+			selection[blockAbbrev] = None
+		elif selection.get(blockAbbrev, []) is not None:
+			selection[blockAbbrev] = selection.get(blockAbbrev, []) + keys.split(',')
+	return selection
+
+def selectedEntries(fileName, selection):
+	'''
+	Returns {block ident: None (the whole block) or sorted entry offsets}
+	for a selection as returned by parseSelection().
+	'''
+	index = motifIndex.loadIndex(fileName)
+	entryPosns = {}
+	for blockAbbrev, keys in selection.items():
+		blockSpec = blockSpecs[blockAbbrev]
+		blockIndex = index.blocks.get(blockSpec.ident)
+		if blockIndex is None:
+			raise KeyError('no data of type: %s' % blockSpec.name)
+		posns = entryPosns.setdefault(blockSpec.ident, set())
+		if keys is not None:
+			for key in keys:
+				posns.add(index.entryPosn(blockAbbrev, key))
+		elif blockSpec.ident == b'EVCE':			# just this kind of voice
+			kind = VOICE_KIND_BY_PRINT_FN[blockSpec.printFn]
+			posns.update(posn for posn, number in zip(blockIndex.offsets, blockIndex.numbers)
+						 if voiceKind(number) == kind)
+		else:
+			posns.update(blockIndex.offsets)
+	return dict((ident, None if len(posns) == len(index.blocks[ident]) else sorted(posns))
+				for ident, posns in entryPosns.items())
+
+def blockHdrBytes(ident, bodyLgth, nEntries):
+	# the block length counts everything after the ident and length fields
+	return struct.pack('> 4s I I', ident, bodyLgth + 4, nEntries)
+
+def subsetPieces(motifFile, ident, entryPosns):
+	'''
+	Returns (E block pieces, D block pieces or None) for a block with only
+	the entries at entryPosns. A piece is bytes, or (offset, length) of
+	bytes to copy from the file.
+	'''
+	entryHdrStruct = motifFile.layout.entryHdrStruct
+	dataIdent = b'D' + ident[1:]
+	hasData = motifFile.hasBlock(dataIdent)
+	entryPieces = []
+	dataPieces = []
+	newDataOffsets = {}			# old data offset -> new one; entries may share Data chunks
+	dataLgth = 0
+	for entryPosn in entryPosns:
+		entryHdr = bytearray(motifFile.readAt(entryPosn, entryHdrStruct.size))
+		_, entryLgth, dataSize, dataOffset, _ = entryHdrStruct.unpack(entryHdr)
+		if hasData and dataSize > 0:
+			if dataOffset not in newDataOffsets:
+				newDataOffsets[dataOffset] = BLOCK_HDR_LGTH + dataLgth
+				dataPieces.append((motifFile.catalog[dataIdent] + dataOffset, dataSize + 8))
+				dataLgth += dataSize + 8
+			struct.pack_into('> I', entryHdr, ENTRY_DATA_OFFSET_POSN, newDataOffsets[dataOffset])
+		entryPieces.append(bytes(entryHdr))
+		entryPieces.append((entryPosn + entryHdrStruct.size, ENTRY_HDR_LGTH + entryLgth - entryHdrStruct.size))
+	entryPieces.insert(0, blockHdrBytes(ident, piecesLgth(entryPieces), len(entryPosns)))
+	if not hasData:
+		return entryPieces, None
+	dataPieces.insert(0, blockHdrBytes(dataIdent, dataLgth, len(newDataOffsets)))
+	return entryPieces, dataPieces
+
+def piecesLgth(pieces):
+	return sum(piece[1] if isinstance(piece, tuple) else len(piece) for piece in pieces)
+
+def copyRange(motifFile, outputFile, offset, lgth):
+	# appends lgth bytes at offset in motifFile to outputFile (unbuffered), in the kernel if possible
+	try:
+		inputFd = motifFile.inputStream.fileno()
+	except (AttributeError, OSError, ValueError):		# e.g. an archive member
+		inputFd = None
+	if inputFd is not None:
+		for copyFn in (getattr(os, 'copy_file_range', None), getattr(os, 'sendfile', None)):
+			if copyFn is None:
+				continue
+			try:
+				while lgth > 0:
+					if copyFn is os.sendfile:
+						nCopied = copyFn(outputFile.fileno(), inputFd, offset, lgth)
+					else:
+						nCopied = copyFn(inputFd, outputFile.fileno(), lgth, offset)
+					if nCopied == 0:
+						break
+					offset += nCopied
+					lgth -= nCopied
+				if lgth == 0:
+					return
+			except OSError:
+				pass						# e.g. not supported between these files: try the next way
+	while lgth > 0:
+		chunk = motifFile.readAt(offset, min(lgth, COPY_CHUNK_SIZE))
+		if len(chunk) == 0:
+			raise IOError('unexpected end of file: %s' % motifFile.fileName)
+		outputFile.write(chunk)
+		offset += len(chunk)
+		lgth -= len(chunk)
+
+def extractSubset(fileName, outFileName, selection):
+	'''
+	Writes a Motif file to outFileName with just the blocks and entries of
+	selection (see parseSelection()) from fileName, which outFileName must
+	not be. The new file gets fileName's (or its archive's) permissions.
+	Returns the number of bytes written.
+	'''
+	sourcePath = motifArchive.splitArchivePath(fileName)[0]
+	if os.path.exists(outFileName) and os.path.samefile(sourcePath, outFileName):
+		raise IOError('output file is the input file: %s' % outFileName)
+	fileMode = stat.S_IMODE(os.stat(sourcePath).st_mode)
+	entryPosns = selectedEntries(fileName, selection)
+	with MotifFile(fileName) as motifFile:
+		# blocks are written in the order they are in the source file
+		blocks = []							# (ident, pieces)
+		for ident in entryPosns.keys():
+			dataIdent = b'D' + ident[1:]
+			if entryPosns[ident] is None:
+				for blockIdent in (ident, dataIdent):
+					if motifFile.hasBlock(blockIdent):
+						start, end = motifFile.blockExtent(blockIdent)
+						blocks.append((blockIdent, [(start, end - start)]))
+			else:
+				entryPieces, dataPieces = subsetPieces(motifFile, ident, entryPosns[ident])
+				blocks.append((ident, entryPieces))
+				if dataPieces is not None:
+					blocks.append((dataIdent, dataPieces))
+		blocks.sort(key = lambda block: motifFile.catalog[block[0]])
+
+		fileHdr = bytearray(motifFile.readAt(0, FILE_HDR_LGTH))
+		catalogSize = CATALOG_ENTRY_LGTH * len(blocks)
+		struct.pack_into('> I', fileHdr, CATALOG_SIZE_POSN, catalogSize)
+		catalog = []
+		posn = FILE_HDR_LGTH + catalogSize
+		for ident, pieces in blocks:
+			catalog.append(struct.pack('> 4s I', ident, posn))
+			posn += piecesLgth(pieces)
+
+		def writeFile(outputFile):
+			if hasattr(os, 'fchmod'):		# the temporary file is only readable by its owner
+				os.fchmod(outputFile.fileno(), fileMode)
+			pending = [bytes(fileHdr)] + catalog		# small pieces are gathered into one write
+			for _, pieces in blocks:
+				for piece in pieces:
+					if isinstance(piece, tuple):
+						outputFile.write(b''.join(pending))
+						pending = []
+						copyRange(motifFile, outputFile, *piece)
+					else:
+						pending.append(piece)
+			outputFile.write(b''.join(pending))
+
+		# unbuffered, since copyRange() may write to the file descriptor
+		motifIndex.writeAtomically(outFileName, writeFile, buffering = 0)
+	return posn
@@ -0,0 +1,341 @@
+'''
+A persistent index of the entries in a Motif file, for random access.
+
+The index records, for every block in blockSpecs, the offset of each entry
+plus its number, label and name, as compact arrays, and a hash table from
+each label (and '#number') to the positions of the entries with it. It is kept in a shared
+cache directory, keyed by the Motif file's path, size and mtime, and rebuilt
+when the file changes. Looking up an entry then costs one index load and a
+single entry decode, instead of walking the block from its start, and a
+report can be printed from the index instead of from the entries (see
+printMotifFile's index argument).
+
+Index files are plain data: a JSON header, then each block's arrays as raw
+little-endian bytes and its names and labels as UTF-8. Nothing in them is
+ever executed, so a shared cache directory can't be used to run code.
+'''
+
+import array, hashlib, json, os, sqlite3, struct, sys, tempfile, zlib
+
+import motifArchive, motifBatch
+from printMotifFile import Entry, MotifFile, blockSpecs, fileLayoutFor, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+INDEX_FORMAT =		3					# bump when the index file layout changes
+INDEX_FILE_MAGIC =	b'PMFINDEX'
+INDEX_FILE_EXT =	'.pmfidx'
+CACHE_DIR_ENV_VAR =	'PMF_CACHE_DIR'
+HEADER_LGTH_STRUCT = struct.Struct('< I')
+
+def cacheDirectory():
+	# where persistent indexes go, unless CACHE_DIR_ENV_VAR says otherwise
+	cacheDir = os.environ.get(CACHE_DIR_ENV_VAR)
+	if cacheDir:
+		return cacheDir
+	if sys.platform == 'win32':
+		baseDir = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+	else:
+		baseDir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+	return os.path.join(baseDir, 'motif2text')
+
+def fileKey(fileName):
+	# (path, size, mtime) identifies one version of a Motif file; for one in an archive, of the archive
+	archivePath, memberName = motifArchive.splitArchivePath(fileName)
+	stat = os.stat(archivePath)
+	if memberName is None:
+		return os.path.abspath(fileName), stat.st_size, stat.st_mtime_ns
+	return motifArchive.memberPath(os.path.abspath(archivePath), memberName), stat.st_size, stat.st_mtime_ns
+
+def cachePathFor(fileName, cacheDir = None, ext = INDEX_FILE_EXT):
+	if cacheDir is None:
+		cacheDir = cacheDirectory()
+	pathHash = hashlib.sha1(os.path.abspath(fileName).encode('utf-8', 'surrogateescape')).hexdigest()
+	return os.path.join(cacheDir, pathHash + ext)
+
+def writeAtomically(filePath, writeFn, buffering = -1):
+	# writeFn(file) writes the contents; readers never see a partly written file
+	fileDir = os.path.dirname(os.path.abspath(filePath))
+	os.makedirs(fileDir, exist_ok = True)
+	fd, tempPath = tempfile.mkstemp(dir = fileDir, suffix = '.tmp')
+	try:
+		with os.fdopen(fd, 'wb', buffering = buffering) as tempFile:
+			writeFn(tempFile)
+		os.replace(tempPath, filePath)
+	except:
+		os.remove(tempPath)
+		raise
+
+def openCacheDatabase(dbPath, defaultFileName):
+	# a connection to the SQLite database at dbPath, or if that is None, defaultFileName in the cache directory
+	if dbPath is None:
+		dbPath = os.path.join(cacheDirectory(), defaultFileName)
+	dbDir = os.path.dirname(dbPath)
+	if dbDir:
+		os.makedirs(dbDir, exist_ok = True)
+	return sqlite3.connect(dbPath)
+
+def isCurrent(db, key):
+	# whether db's files table (file, size, mtime_ns) has the file version identified by key (see fileKey)
+	filePath, size, mtime = key
+	row = db.execute('SELECT size, mtime_ns FROM files WHERE file = ?', (filePath,)).fetchone()
+	return row == (size, mtime)
+
+def refreshFiles(db, fileNames, fileFn, updateFn, nWorkers = None):
+	'''
+	Runs fileFn(fileName) across a process pool (see motifBatch.mapFiles)
+	for those fileNames that are new or have changed since db's files table
+	recorded them, and passes each result to updateFn(fileKey, result).
+	Yields (fileName, error) per file run; error is None if ok.
+	'''
+	staleKeys = {}
+	for fileName in fileNames:
+		key = fileKey(fileName)
+		if not isCurrent(db, key):
+			staleKeys[fileName] = key
+	if len(staleKeys) == 0:
+		return
+	jobArgs = ((fileName,) for fileName in staleKeys.keys())
+	for fileName, result, error in motifBatch.mapFiles(fileFn, jobArgs, nWorkers):
+		if error is None:
+			updateFn(staleKeys[fileName], result)
+		yield fileName, error
+
+def keyHash(key):
+	# stable from run to run, unlike hash()
+	return zlib.crc32(key.encode('utf-8', 'surrogateescape'))
+
+class BlockIndex:
+	'''
+	The entries of one block. Names and labels are stored as single
+	'\\0'-joined strings and only split when a lookup needs them.
+	labelStarts[i] is where entry i's label starts in labels. keySlots is an
+	open-addressing hash table (a power of 2 long, at most half full) of
+	entry position + 1, or 0 for an empty slot, keyed by keyHash of each
+	entry's label, its label without the '(section)' part, and '#number'.
+	Every entry has its own slots, since labels aren't unique within a block
+	(e.g. the EVCE block holds 3 kinds of voice, the EWFM block 3 types of
+	waveform).
+	'''
+
+	def __init__(self, ident, posn):
+		self.ident =		ident
+		self.posn =			posn					# file offset of the block header
+		self.offsets =		array.array('I')		# file offset of each entry header
+		self.numbers =		array.array('I')		# entry number of each entry
+		self.names =		''
+		self.labels =		''
+		self.labelStarts =	array.array('I')
+		self.keySlots =		array.array('I')
+
+	def __len__(self):
+		return len(self.offsets)
+
+	def nameList(self):
+		return self.names.split('\0') if len(self.offsets) > 0 else []
+
+	def labelList(self):
+		return self.labels.split('\0') if len(self.offsets) > 0 else []
+
+	def label(self, i):
+		return self.labels[self.labelStarts[i]:self.labelStarts[i + 1] - 1]
+
+	def setEntries(self, names, labels):
+		# fills in names, labels, labelStarts and keySlots once offsets and numbers are complete
+		self.names = '\0'.join(names)
+		self.labels = '\0'.join(labels)
+		self.labelStarts = array.array('I', [0])
+		for label in labels:
+			self.labelStarts.append(self.labelStarts[-1] + len(label) + 1)
+		nSlots = 8
+		while nSlots < 6 * len(labels):			# up to 3 keys per entry
+			nSlots <<= 1
+		self.keySlots = array.array('I', bytes(4 * nSlots))
+		mask = nSlots - 1
+		for i, label in enumerate(labels):
+			for key in set((label, label.split('(')[0], '#%d' % self.numbers[i])):
+				slot = keyHash(key) & mask
+				while self.keySlots[slot] != 0:
+					slot = (slot + 1) & mask
+				self.keySlots[slot] = i + 1
+
+	def keyMatches(self, i, key):
+		if key.startswith('#'):
+			return key == '#%d' % self.numbers[i]
+		label = self.label(i)
+		return key == label or key == label.split('(')[0]
+
+	def find(self, key, numberFilter = None):
+		'''
+		Returns the position in this block of the first entry with label key,
+		or of entry number int(key[1:]) if key starts with '#', for which
+		numberFilter(entry number), if given, is true. The label may be given
+		without its '(section)' part, e.g. 'USR2:045'. Raises KeyError (or
+		ValueError for a bad '#number').
+		'''
+		if key.startswith('#'):
+			key = '#%d' % int(key[1:])
+		mask = len(self.keySlots) - 1
+		slot = keyHash(key) & mask
+		found = None
+		while self.keySlots[slot] != 0:
+			i = self.keySlots[slot] - 1
+			if (found is None or i < found) and self.keyMatches(i, key) \
+			   and (numberFilter is None or numberFilter(self.numbers[i])):
+				found = i
+			slot = (slot + 1) & mask
+		if found is None:
+			raise KeyError(key)
+		return found
+
+	def entries(self):
+		# yields an Entry, without data, for each entry in the block
+		for number, label, name, posn in zip(self.numbers, self.labelList(), self.nameList(), self.offsets):
+			yield Entry(self.ident, number, label, name, None, posn)
+
+ARRAY_NAMES = ('offsets', 'numbers', 'labelStarts', 'keySlots')
+
+class MotifIndex:
+	def __init__(self, fileKey, fileVersionStr):
+		self.format =			INDEX_FORMAT
+		self.fileKey =			fileKey
+		self.fileVersionStr =	fileVersionStr
+		self.blocks =			{}				# block ident -> BlockIndex
+
+	def entryPosn(self, blockAbbrev, key):
+		'''
+		Returns the file offset of the blockAbbrev entry with label (or
+		'#number') key, e.g. a Mixing Voice for 'mv' but never a Voice. A
+		waveform label is of a User Waveform unless it starts with another
+		waveform type, e.g. 'FL1:0001'. Raises KeyError if there isn't one.
+		'''
+		blockSpec = blockSpecs[blockAbbrev]
+		blockIndex = self.blocks.get(blockSpec.ident)
+		label = key
+		numberFilter = None
+		if blockSpec.printFn in VOICE_KIND_BY_PRINT_FN:
+			kind = VOICE_KIND_BY_PRINT_FN[blockSpec.printFn]
+			numberFilter = lambda number: voiceKind(number) == kind
+		elif blockSpec.ident == b'EWFM' and not key.startswith('#'):
+			layout = fileLayoutFor(tuple(map(int, self.fileVersionStr.split('.'))))
+			typeName, _, label = key.rpartition(':')
+			typeNames = [''] + [wfType.name.split()[0].lower() for wfType in layout.waveformTypes]
+			if typeName.lower() not in typeNames:
+				raise KeyError('no %s entry %s' % (blockSpec.name, key))
+			typeIndex = max(typeNames.index(typeName.lower()) - 1, 0)
+			numberFilter = lambda number: layout.waveformTypeIndex(number) == typeIndex
+		try:
+			return blockIndex.offsets[blockIndex.find(label, numberFilter)]
+		except (AttributeError, KeyError, ValueError):
+			raise KeyError('no %s entry %s' % (blockSpec.name, key))
+
+	def write(self, indexFile):
+		blocksJson = []
+		sections = []
+		for blockIndex in self.blocks.values():
+			blockJson = {'ident' : blockIndex.ident.decode('latin-1'), 'posn' : blockIndex.posn}
+			for arrayName in ARRAY_NAMES:
+				values = getattr(blockIndex, arrayName)
+				if sys.byteorder == 'big':
+					values = array.array('I', values)
+					values.byteswap()
+				sections.append(values.tobytes())
+				blockJson[arrayName] = len(values)
+			for textName in ('names', 'labels'):
+				textBytes = getattr(blockIndex, textName).encode('utf-8', 'surrogateescape')
+				sections.append(textBytes)
+				blockJson[textName] = len(textBytes)
+			blocksJson.append(blockJson)
+		header = json.dumps({'format' : self.format, 'fileKey' : self.fileKey,
+							 'fileVersion' : self.fileVersionStr, 'blocks' : blocksJson}).encode('utf-8')
+		indexFile.write(INDEX_FILE_MAGIC + HEADER_LGTH_STRUCT.pack(len(header)) + header)
+		for section in sections:
+			indexFile.write(section)
+
+def readIndex(indexBytes):
+	'''
+	Returns the MotifIndex in indexBytes (as written by MotifIndex.write), or
+	None if it is of another format. Raises an exception if it is damaged.
+	'''
+	if indexBytes[:len(INDEX_FILE_MAGIC)] != INDEX_FILE_MAGIC:
+		return None
+	posn = len(INDEX_FILE_MAGIC)
+	headerLgth, = HEADER_LGTH_STRUCT.unpack_from(indexBytes, posn)
+	posn += HEADER_LGTH_STRUCT.size
+	header = json.loads(indexBytes[posn:posn + headerLgth].decode('utf-8'))
+	posn += headerLgth
+	if header['format'] != INDEX_FORMAT:
+		return None
+	index = MotifIndex(tuple(header['fileKey']), header['fileVersion'])
+	for blockJson in header['blocks']:
+		blockIndex = BlockIndex(blockJson['ident'].encode('latin-1'), blockJson['posn'])
+		for arrayName in ARRAY_NAMES:
+			values = array.array('I')
+			end = posn + blockJson[arrayName] * values.itemsize
+			if end > len(indexBytes):
+				raise ValueError('index file is truncated')
+			values.frombytes(indexBytes[posn:end])
+			if sys.byteorder == 'big':
+				values.byteswap()
+			setattr(blockIndex, arrayName, values)
+			posn = end
+		for textName in ('names', 'labels'):
+			end = posn + blockJson[textName]
+			setattr(blockIndex, textName, indexBytes[posn:end].decode('utf-8', 'surrogateescape'))
+			posn = end
+		index.blocks[blockIndex.ident] = blockIndex
+	return index
+
+def buildIndex(fileName):
+	key = fileKey(fileName)
+	with MotifFile(fileName) as motifFile:
+		index = MotifIndex(key, motifFile.fileVersionStr)
+		for blockSpec in blockSpecs.values():
+			if blockSpec.ident in index.blocks or not motifFile.hasBlock(blockSpec.ident):
+				continue
+			blockIndex = BlockIndex(blockSpec.ident, motifFile.catalog[blockSpec.ident])
+			names = []
+			labels = []
+			for entry in motifFile.entries(blockSpec):
+				blockIndex.offsets.append(entry.posn)
+				blockIndex.numbers.append(entry.number)
+				names.append(entry.name)
+				labels.append(entry.label)
+			blockIndex.setEntries(names, labels)
+			index.blocks[blockSpec.ident] = blockIndex
+	return index
+
+def loadIndex(fileName, cacheDir = None, rebuild = False):
+	'''
+	Returns the MotifIndex for fileName, from the cache if it is still valid
+	for the file's current size and mtime, otherwise built and cached.
+	'''
+	indexPath = cachePathFor(fileName, cacheDir)
+	if not rebuild:
+		try:
+			with open(indexPath, 'rb') as indexFile:
+				index = readIndex(indexFile.read())
+			if index is not None and index.fileKey == fileKey(fileName):
+				return index
+		except Exception:
+			pass				# missing, stale or unreadable: rebuild it
+	index = buildIndex(fileName)
+	try:
+		writeAtomically(indexPath, index.write)
+	except OSError:
+		pass					# can't cache it, but the index is still good for this run
+	return index
+
+def forgetIndex(fileName, cacheDir = None):
+	# drops fileName's cached index, e.g. after changing the file in a way its mtime may not show
+	try:
+		os.remove(cachePathFor(fileName, cacheDir))
+	except FileNotFoundError:
+		pass
+
+def findEntry(fileName, blockAbbrev, key, cacheDir = None):
+	'''
+	Returns the Entry in fileName's blockAbbrev block with label (or '#number')
+	key, decoded directly from its offset. Raises KeyError if there isn't one.
+	'''
+	entryPosn = loadIndex(fileName, cacheDir).entryPosn(blockAbbrev, key)
+	with MotifFile(fileName) as motifFile:
+		return motifFile.entryAt(blockSpecs[blockAbbrev], entryPosn).detached()
@@ -0,0 +1,169 @@
+'''
+Renames entries of a Motif file in place, by patching their name bytes
+through an mmap, rather than writing a new file.
+
+Only the displayed part of a name (after its 'category:' prefix, if it has
+one) can be changed, and only to a name that fits in the bytes the old one
+takes up; shorter names are padded with spaces, so no other byte of the
+file moves. Entries are found through the file's MotifIndex, so a batch of
+renames reads and writes just the few bytes around each name, all through
+one mapping of the file. The new names are read back afterwards to verify
+them.
+'''
+
+import mmap, os, sys
+
+import motifArchive, motifIndex
+from printMotifFile import MotifFile, blockSpecs
+
+MTIME_STEP_NS =		2 * 10 ** 9		# FAT's mtime resolution, the coarsest there is
+
+class NameChange:
+	def __init__(self, blockAbbrev, key, newName):
+		self.blockAbbrev =	blockAbbrev
+		self.key =			key				# entry label, or '#' + entry number
+		self.newName =		newName
+
+	def __str__(self):
+		return '%s %s' % (self.blockAbbrev, self.key)
+
+class NamePatch:
+	# the bytes that change one entry's name
+	def __init__(self, blockSpec, entryPosn, label, oldName, slotPosn, oldBytes, newBytes, newName):
+		self.blockSpec =	blockSpec
+		self.entryPosn =	entryPosn		# file offset of the entry's header
+		self.label =		label
+		self.oldName =		oldName			# the whole name, as stored
+		self.slotPosn =		slotPosn		# file offset of the part of the name that changes
+		self.oldBytes =		oldBytes
+		self.newBytes =		newBytes
+		self.newName =		newName			# the whole name, as it will be stored
+
+def readChanges(listFile):
+	# one 'item key new name' per line; blank lines and lines starting with '#' are skipped
+	changes = []
+	for lineNumber, line in enumerate(listFile, 1):
+		line = line.rstrip('\r\n')
+		if line.strip() == '' or line.startswith('#'):
+			continue
+		fields = line.split(None, 2)
+		if len(fields) != 3:
+			raise ValueError('line %d: expected item, key and new name' % lineNumber)
+		changes.append(NameChange(*fields))
+	return changes
+
+def prefixChanges(fileName, blockAbbrev, prefix):
+	# NameChanges that put prefix in front of the name of every blockAbbrev entry
+	blockSpec = blockSpecs[blockAbbrev]
+	blockIndex = motifIndex.loadIndex(fileName).blocks.get(blockSpec.ident)
+	if blockIndex is None:
+		return []
+	return [NameChange(blockAbbrev, '#%d' % number, prefix + name.split(':')[-1].rstrip())
+			for number, name in zip(blockIndex.numbers, blockIndex.nameList())]
+
+def planRenames(fileName, changes):
+	'''
+	Returns (patches, problems): a NamePatch for each change that can be
+	made, and (change, what's wrong) for each one that can't.
+	'''
+	patches = []
+	problems = []
+	index = motifIndex.loadIndex(fileName)
+	patchedPosns = set()
+	with MotifFile(fileName) as motifFile:
+		nameOffset = motifFile.layout.entryHdrStruct.size
+		for change in changes:
+			blockSpec = blockSpecs.get(change.blockAbbrev)
+			if blockSpec is None:
+				problems.append((change, 'unknown data type'))
+				continue
+			try:
+				entryPosn = index.entryPosn(change.blockAbbrev, change.key)
+			except KeyError:
+				problems.append((change, 'no such entry'))
+				continue
+			entry = motifFile.entryAt(blockSpec, entryPosn)
+			prefixLgth = entry.name.rfind(':') + 1
+			slotLgth = len(entry.name) - prefixLgth
+			try:
+				newBytes = change.newName.encode('ascii')
+			except UnicodeEncodeError:
+				problems.append((change, 'new name is not ASCII'))
+				continue
+			if b':' in newBytes or b'\x00' in newBytes or b'\x03' in newBytes:
+				problems.append((change, "new name can't contain ':' or control characters"))
+			elif len(newBytes) > slotLgth:
+				problems.append((change, 'new name is longer than %d characters' % slotLgth))
+			elif entryPosn in patchedPosns:
+				problems.append((change, 'entry is renamed twice'))
+			else:
+				newBytes = newBytes.ljust(slotLgth, b' ')
+				oldBytes = entry.name[prefixLgth:].encode('ascii')
+				patchedPosns.add(entryPosn)
+				patches.append(NamePatch(blockSpec, entryPosn, entry.label, entry.name,
+										 entryPosn + nameOffset + prefixLgth, oldBytes, newBytes,
+										 entry.name[:prefixLgth] + newBytes.decode('ascii')))
+	return patches, problems
+
+def applyPatches(fileName, patches):
+	'''
+	Writes patches into fileName through a writable mmap. Nothing is written
+	if any patch's old bytes aren't what is in the file. Returns the number
+	of bytes written.
+
+	The file's size doesn't change, so everything cached by size and mtime
+	(MotifIndexes, the search and dedupe databases, watch state) only sees
+	the change through the mtime. If writing didn't change it (e.g. on FAT,
+	with 2-second mtimes) it is moved on by MTIME_STEP_NS, and the file's
+	cached MotifIndex is dropped in any case.
+	'''
+	if motifArchive.splitArchivePath(fileName)[1] is not None:
+		raise IOError("can't rename entries of a file in an archive: %s" % fileName)
+	oldStat = os.stat(fileName)
+	with open(fileName, 'r+b') as motifFile:
+		fileMap = mmap.mmap(motifFile.fileno(), 0, access = mmap.ACCESS_WRITE)
+		try:
+			for patch in patches:
+				if fileMap[patch.slotPosn:patch.slotPosn + len(patch.oldBytes)] != patch.oldBytes:
+					raise IOError('file changed since the renames were planned: %s' % fileName)
+			nBytesWritten = 0
+			for patch in patches:
+				fileMap[patch.slotPosn:patch.slotPosn + len(patch.newBytes)] = patch.newBytes
+				nBytesWritten += len(patch.newBytes)
+			fileMap.flush()
+		finally:
+			fileMap.close()
+	if nBytesWritten > 0 and os.stat(fileName).st_mtime_ns == oldStat.st_mtime_ns:
+		os.utime(fileName, ns = (oldStat.st_atime_ns, oldStat.st_mtime_ns + MTIME_STEP_NS))
+	motifIndex.forgetIndex(fileName)
+	return nBytesWritten
+
+def verifyPatches(fileName, patches):
+	# returns the patches whose entries don't have their new names
+	with MotifFile(fileName) as motifFile:
+		return [patch for patch in patches
+				if motifFile.entryAt(patch.blockSpec, patch.entryPosn).name != patch.newName]
+
+def renameEntries(fileName, changes, dryRun = False, verify = True, out = None):
+	'''
+	Renames the entries of fileName named by changes (NameChanges) in place,
+	printing what is (or, if dryRun, would be) renamed and what can't be.
+	Returns the number of changes that weren't made.
+	'''
+	if out is None:
+		out = sys.stdout
+	patches, problems = planRenames(fileName, changes)
+	for patch in patches:
+		print('%s %s: %s -> %s' % (patch.blockSpec.name, patch.label, patch.oldName, patch.newName), file = out)
+	for change, problem in problems:
+		print('not renamed: %s (%s)' % (change, problem), file = out)
+	if dryRun or len(patches) == 0:
+		return len(problems)
+	nBytesWritten = applyPatches(fileName, patches)
+	print('%d entries renamed, %d bytes written' % (len(patches), nBytesWritten), file = out)
+	if verify:
+		badPatches = verifyPatches(fileName, patches)
+		for patch in badPatches:
+			print('verify failed: %s %s' % (patch.blockSpec.name, patch.label), file = out)
+		return len(problems) + len(badPatches)
+	return len(problems)
@@ -0,0 +1,187 @@
+'''
+A library-wide index of entry names, for finding which Motif files have
+a voice, pattern, etc. whose name contains some text.
+
+Entry names come from each file's MotifIndex (see motifIndex), so a file
+that has been indexed for 'pmf.py get' isn't read again. They go into one
+SQLite database in the cache directory, along with a trigram inverted index
+of the distinct names (backups of the same synth share most of their names,
+so each name and its trigrams are only stored once). A search intersects
+the postings of the rarest few trigrams of the search text and checks the
+few names left, rather than scanning every name. Candidate names are passed
+to SQL in temporary tables, so no query grows with the search text or the
+number of matches. Files are re-indexed only when
+their size or mtime changes.
+'''
+
+import sys
+
+import motifArchive, motifBatch, motifIndex
+from printMotifFile import blockSpecs, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+INDEX_FILE_NAME =	'names.sqlite'
+GRAM_LGTH =			3
+SQL_GRAMS_MAX =		3		# how many of a search's trigrams are intersected in SQL; names are checked in Python
+
+def nameGrams(name):
+	# the distinct GRAM_LGTH-character substrings of name, ignoring case
+	name = name.lower()
+	return {name[i:i + GRAM_LGTH] for i in range(0, len(name) - GRAM_LGTH + 1)}
+
+# block ident -> blockSpecs key, and for EVCE, voice kind -> blockSpecs key
+BLOCK_ABBREVS = {}
+VOICE_BLOCK_ABBREVS = {}
+for blockAbbrev, blockSpec in blockSpecs.items():
+	if blockSpec.ident == b'EVCE':
+		VOICE_BLOCK_ABBREVS[VOICE_KIND_BY_PRINT_FN[blockSpec.printFn]] = blockAbbrev
+	else:
+		BLOCK_ABBREVS[blockSpec.ident] = blockAbbrev
+
+def fileNameRows(fileName):
+	'''
+	Returns [(blockSpecs key, label, number, name), ...] for every entry in a
+	Motif file.
+	'''
+	rows = []
+	for ident, blockIndex in motifIndex.loadIndex(fileName).blocks.items():
+		for number, label, name in zip(blockIndex.numbers, blockIndex.labelList(), blockIndex.nameList()):
+			if ident == b'EVCE':
+				blockAbbrev = VOICE_BLOCK_ABBREVS[voiceKind(number)]
+			else:
+				blockAbbrev = BLOCK_ABBREVS[ident]
+			rows.append((blockAbbrev, label, number, name))
+	return rows
+
+class NameIndex:
+	def __init__(self, dbPath = None):
+		self.db = motifIndex.openCacheDatabase(dbPath, INDEX_FILE_NAME)
+		self.db.execute('CREATE TABLE IF NOT EXISTS files '
+						'(file_id INTEGER PRIMARY KEY, file TEXT UNIQUE, size INTEGER, mtime_ns INTEGER)')
+		self.db.execute('CREATE TABLE IF NOT EXISTS names (name_id INTEGER PRIMARY KEY, name TEXT UNIQUE)')
+		self.db.execute('CREATE TABLE IF NOT EXISTS grams '
+						'(gram TEXT, name_id INTEGER, PRIMARY KEY (gram, name_id)) WITHOUT ROWID')
+		self.db.execute('CREATE TABLE IF NOT EXISTS entries '
+						'(file_id INTEGER, block TEXT, label TEXT, number INTEGER, name_id INTEGER)')
+		self.db.execute('CREATE INDEX IF NOT EXISTS entries_file ON entries (file_id)')
+		self.db.execute('CREATE INDEX IF NOT EXISTS entries_name ON entries (name_id)')
+		self.db.commit()
+
+	def nameId(self, name):
+		row = self.db.execute('SELECT name_id FROM names WHERE name = ?', (name,)).fetchone()
+		if row is not None:
+			return row[0]
+		nameId = self.db.execute('INSERT INTO names (name) VALUES (?)', (name,)).lastrowid
+		self.db.executemany('INSERT INTO grams VALUES (?, ?)', [(gram, nameId) for gram in nameGrams(name)])
+		return nameId
+
+	def update(self, key, rows):
+		filePath, size, mtime = key
+		self.removeFile(filePath)
+		fileId = self.db.execute('INSERT INTO files (file, size, mtime_ns) VALUES (?, ?, ?)', key).lastrowid
+		nameIds = {}
+		for _, _, _, name in rows:
+			if name not in nameIds:
+				nameIds[name] = self.nameId(name)
+		self.db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+							[(fileId, blockAbbrev, label, number, nameIds[name])
+							 for blockAbbrev, label, number, name in rows])
+		self.db.commit()
+
+	def removeFile(self, filePath):
+		# names stay behind, for the next file that has them
+		row = self.db.execute('SELECT file_id FROM files WHERE file = ?', (filePath,)).fetchone()
+		if row is not None:
+			self.db.execute('DELETE FROM entries WHERE file_id = ?', row)
+			self.db.execute('DELETE FROM files WHERE file_id = ?', row)
+
+	def removeMissingFiles(self):
+		# returns the paths of indexed files that no longer exist, after removing them
+		missing = [filePath for filePath, in self.db.execute('SELECT file FROM files')
+				   if not motifArchive.isFile(filePath)]
+		for filePath in missing:
+			self.removeFile(filePath)
+		self.db.commit()
+		return missing
+
+	def setTempTable(self, table, column, values):
+		# fills the temporary table (column PRIMARY KEY) with values, replacing what it had
+		self.db.execute('CREATE TEMP TABLE IF NOT EXISTS %s (%s PRIMARY KEY)' % (table, column))
+		self.db.execute('DELETE FROM %s' % table)
+		self.db.executemany('INSERT OR IGNORE INTO %s VALUES (?)' % table, [(value,) for value in values])
+
+	def matchingNameIds(self, text):
+		text = text.lower()
+		grams = nameGrams(text)
+		if len(grams) == 0:					# too short for trigrams: check every name
+			query = 'SELECT name_id, name FROM names'
+			rareGrams = []
+		else:
+			self.setTempTable('search_grams', 'gram TEXT', grams)
+			gramCounts = self.db.execute('SELECT gram, COUNT(*) FROM grams JOIN search_grams USING (gram) '
+										 'GROUP BY gram ORDER BY 2').fetchall()
+			if len(gramCounts) < len(grams):	# some trigram is in no name
+				return []
+			rareGrams = [gram for gram, _ in gramCounts[:SQL_GRAMS_MAX]]
+			query = 'SELECT name_id, name FROM names WHERE name_id IN (%s)' % \
+				' INTERSECT '.join(['SELECT name_id FROM grams WHERE gram = ?'] * len(rareGrams))
+		return [nameId for nameId, name in self.db.execute(query, rareGrams) if text in name.lower()]
+
+	def search(self, text, selectedItems = ()):
+		'''
+		Returns [(file, blockSpecs key, label, number, name), ...] for the
+		entries whose names contain text, ignoring case, in the selectedItems
+		(blockSpecs keys; all of them if empty), sorted by file.
+		'''
+		nameIds = self.matchingNameIds(text)
+		if len(nameIds) == 0:
+			return []
+		self.setTempTable('matched_names', 'name_id INTEGER', nameIds)
+		query = 'SELECT file, block, label, number, name FROM matched_names ' \
+				'JOIN entries USING (name_id) JOIN files USING (file_id) JOIN names USING (name_id)'
+		params = []
+		if len(selectedItems) > 0:		# at most one per blockSpecs key
+			query += ' WHERE block IN (%s)' % ', '.join('?' * len(selectedItems))
+			params += selectedItems
+		return self.db.execute(query + ' ORDER BY file, block, number, entries.rowid', params).fetchall()
+
+	def close(self):
+		self.db.close()
+
+def indexFiles(paths, dbPath = None, nWorkers = None):
+	'''
+	Brings the name index up to date for the Motif files named by paths
+	(files, directories or glob patterns), and drops files that no longer
+	exist. Progress goes to stderr. Returns the number of files that could
+	not be read.
+	'''
+	fileNames = motifBatch.expandPaths(paths)
+	index = NameIndex(dbPath)
+	try:
+		nIndexed = nFailed = 0
+		for fileName, error in motifIndex.refreshFiles(index.db, fileNames, fileNameRows, index.update, nWorkers):
+			if error is None:
+				nIndexed += 1
+				print('indexed %s' % fileName, file = sys.stderr)
+			else:
+				nFailed += 1
+				print('FAILED  %s (%s)' % (fileName, error), file = sys.stderr)
+		for filePath in index.removeMissingFiles():
+			print('removed %s' % filePath, file = sys.stderr)
+	finally:
+		index.close()
+	print('%d files, %d indexed, %d already indexed, %d failed' %
+		  (len(fileNames), nIndexed, len(fileNames) - nIndexed - nFailed, nFailed), file = sys.stderr)
+	return nFailed
+
+def printSearch(text, selectedItems = (), dbPath = None, out = None):
+	# prints the entries whose names contain text; returns how many there were
+	if out is None:
+		out = sys.stdout
+	index = NameIndex(dbPath)
+	try:
+		rows = index.search(text, selectedItems)
+	finally:
+		index.close()
+	for filePath, blockAbbrev, label, _, name in rows:
+		print('%s  %s  %s  %s' % (filePath, blockSpecs[blockAbbrev].name, label, name), file = out)
+	return len(rows)
@@ -0,0 +1,221 @@
+'''
+A local HTTP server that answers JSON queries about Motif files, for tools
+that would otherwise run pmf.py on the same files over and over.
+
+   GET /catalog?file=PATH			file version and the offset of each block
+   GET /summary?file=PATH			how many entries of each data type there are
+   GET /block/ITEM?file=PATH		the entries of one data type (ITEM is e.g. vc)
+   GET /entry/ITEM/KEY?file=PATH	one entry, by label (e.g. USR2:045, or FL1:0001 for
+									a waveform that isn't a User Waveform) or #number,
+									with its decoded parameters
+
+PATH may be anything MotifFile accepts, including 'archive.zip!/file.X0A'.
+Parsed files (their catalog plus their MotifIndex, see motifIndex) are kept
+in an LRU cache, bounded by size and keyed by path, size and mtime, so a
+changed file is parsed again. Parsing and entry decoding run in a process
+pool, so a big file doesn't hold up requests about others. The server only
+listens on localhost.
+'''
+
+import asyncio, collections, concurrent.futures, json, sys, urllib.parse
+
+import motifIndex
+from printMotifFile import MotifFile, blockSpecs, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+DEFAULT_PORT =			8470
+DEFAULT_CACHE_SIZE =	1 << 26			# bytes, roughly, of parsed files to keep
+SERVER_HOST =			'127.0.0.1'
+
+HTTP_REASONS = {
+	200 :	'OK',
+	400 :	'Bad Request',
+	404 :	'Not Found',
+	405 :	'Method Not Allowed',
+	500 :	'Internal Server Error',
+	}
+
+class HttpError(Exception):
+	def __init__(self, status, message):
+		Exception.__init__(self, message)
+		self.status =	status
+		self.message =	message
+
+class ParsedFile:
+	# what the server knows about one version of a Motif file, built in a worker process
+	def __init__(self, fileName):
+		self.index = motifIndex.loadIndex(fileName)
+		with MotifFile(fileName) as motifFile:
+			self.catalog = sorted(motifFile.catalog.items(), key = lambda item: item[1])
+		self.size = 1024 + sum(len(blockIndex.names) + len(blockIndex.labels) + 8 * len(blockIndex)
+							   for blockIndex in self.index.blocks.values())
+
+	def blockIndex(self, blockSpec):
+		# the BlockIndex for blockSpec, and for EVCE the kind of voice to pick out of it
+		blockIndex = self.index.blocks.get(blockSpec.ident)
+		kind = VOICE_KIND_BY_PRINT_FN.get(blockSpec.printFn) if blockSpec.ident == b'EVCE' else None
+		return blockIndex, kind
+
+	def catalogJson(self):
+		return {'version' :	self.index.fileVersionStr,
+				'blocks' :	[{'ident' : ident.decode('latin-1'), 'offset' : offset} for ident, offset in self.catalog]}
+
+	def summaryJson(self):
+		counts = {}
+		for blockAbbrev, blockSpec in blockSpecs.items():
+			blockIndex, kind = self.blockIndex(blockSpec)
+			if blockIndex is None:
+				counts[blockAbbrev] = None
+			elif kind is None:
+				counts[blockAbbrev] = len(blockIndex)
+			else:
+				counts[blockAbbrev] = sum(1 for number in blockIndex.numbers if voiceKind(number) == kind)
+		return {'version' : self.index.fileVersionStr, 'counts' : counts}
+
+	def blockJson(self, blockSpec):
+		blockIndex, kind = self.blockIndex(blockSpec)
+		if blockIndex is None:
+			raise HttpError(404, 'no data of type: %s' % blockSpec.name)
+		return {'name' :	blockSpec.name,
+				'entries' :	[{'label' : label, 'number' : number, 'name' : name}
+							 for number, label, name in
+								zip(blockIndex.numbers, blockIndex.labelList(), blockIndex.nameList())
+							 if kind is None or voiceKind(number) == kind]}
+
+def entryJson(fileName, blockAbbrev, posn):
+	# runs in a worker process
+	with MotifFile(fileName) as motifFile:
+		entry = motifFile.entryAt(blockSpecs[blockAbbrev], posn)
+		return {'label' : entry.label, 'number' : entry.number, 'name' : entry.name, 'params' : entry.params}
+
+class MotifServer:
+	def __init__(self, cacheSize = DEFAULT_CACHE_SIZE, nWorkers = None):
+		self.cacheSize =	cacheSize
+		self.cache =		collections.OrderedDict()	# file key -> ParsedFile, least recently used first
+		self.cacheBytes =	0
+		self.parsing =		{}							# file key -> future of a ParsedFile being built
+		self.executor =		concurrent.futures.ProcessPoolExecutor(nWorkers)
+
+	async def start(self, port = DEFAULT_PORT):
+		# returns the asyncio Server; port 0 picks a free port
+		return await asyncio.start_server(self.handleConnection, SERVER_HOST, port)
+
+	def close(self):
+		self.executor.shutdown()
+
+	def addToCache(self, key, parsedFile):
+		for oldKey in [oldKey for oldKey in self.cache.keys() if oldKey[0] == key[0]]:
+			self.cacheBytes -= self.cache.pop(oldKey).size		# an older version of the file
+		if parsedFile.size > self.cacheSize:
+			return
+		while self.cacheBytes + parsedFile.size > self.cacheSize:
+			_, oldParsedFile = self.cache.popitem(last = False)
+			self.cacheBytes -= oldParsedFile.size
+		self.cache[key] = parsedFile
+		self.cacheBytes += parsedFile.size
+
+	async def parsedFile(self, fileName):
+		try:
+			key = motifIndex.fileKey(fileName)
+		except OSError:
+			raise HttpError(404, 'could not open file: %s' % fileName)
+		parsedFile = self.cache.get(key)
+		if parsedFile is not None:
+			self.cache.move_to_end(key)
+			return parsedFile
+		future = self.parsing.get(key)
+		if future is not None:						# someone else asked for it first
+			return await future
+		future = asyncio.get_running_loop().run_in_executor(self.executor, ParsedFile, fileName)
+		self.parsing[key] = future
+		try:
+			parsedFile = await future
+		finally:
+			del self.parsing[key]
+		self.addToCache(key, parsedFile)
+		return parsedFile
+
+	async def respond(self, method, target):
+		# returns the JSON body for a request, or raises HttpError
+		if method != 'GET':
+			raise HttpError(405, 'only GET is supported')
+		url = urllib.parse.urlsplit(target)
+		path = [urllib.parse.unquote(part) for part in url.path.split('/') if part]
+		fileNames = urllib.parse.parse_qs(url.query).get('file')
+		if len(path) == 0 or path[0] not in ('catalog', 'summary', 'block', 'entry'):
+			raise HttpError(404, 'unknown request: %s' % url.path)
+		if fileNames is None:
+			raise HttpError(400, 'no file given')
+		fileName = fileNames[0]
+		if path[0] in ('block', 'entry'):
+			if len(path) != (2 if path[0] == 'block' else 3):
+				raise HttpError(404, 'unknown request: %s' % url.path)
+			if path[1] not in blockSpecs:
+				raise HttpError(404, 'unknown data type: %s' % path[1])
+			blockSpec = blockSpecs[path[1]]
+		elif len(path) != 1:
+			raise HttpError(404, 'unknown request: %s' % url.path)
+
+		try:
+			parsedFile = await self.parsedFile(fileName)
+		except HttpError:
+			raise
+		except Exception as e:
+			raise HttpError(500, 'file problem (%s)' % (str(e) or e.__class__.__name__))
+		if path[0] == 'catalog':
+			return parsedFile.catalogJson()
+		elif path[0] == 'summary':
+			return parsedFile.summaryJson()
+		elif path[0] == 'block':
+			return parsedFile.blockJson(blockSpec)
+
+		try:
+			posn = parsedFile.index.entryPosn(path[1], path[2])
+		except KeyError as e:
+			raise HttpError(404, e.args[0])
+		return await asyncio.get_running_loop().run_in_executor(self.executor, entryJson, fileName, path[1], posn)
+
+	async def handleConnection(self, reader, writer):
+		# one request per connection
+		try:
+			try:
+				head = await reader.readuntil(b'\r\n\r\n')
+			except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+				return
+			try:
+				method, target, _ = head.split(b'\r\n', 1)[0].decode('latin-1').split(' ', 2)
+				status, body = 200, await self.respond(method, target)
+			except HttpError as e:
+				status, body = e.status, {'error' : e.message}
+			except ValueError:
+				status, body = 400, {'error' : 'bad request'}
+			except Exception as e:
+				status, body = 500, {'error' : str(e) or e.__class__.__name__}
+			bodyBytes = json.dumps(body).encode('utf-8')
+			writer.write(('HTTP/1.1 %d %s\r\n'
+						  'Content-Type: application/json\r\n'
+						  'Content-Length: %d\r\n'
+						  'Connection: close\r\n\r\n' % (status, HTTP_REASONS[status], len(bodyBytes))).encode('ascii'))
+			writer.write(bodyBytes)
+			await writer.drain()
+		except ConnectionError:
+			pass
+		finally:
+			writer.close()
+
+def serve(port = DEFAULT_PORT, cacheSize = DEFAULT_CACHE_SIZE, nWorkers = None):
+	# serves until interrupted
+	motifServer = MotifServer(cacheSize, nWorkers)
+
+	async def run():
+		server = await motifServer.start(port)
+		print('serving Motif files at http://%s:%d/' % (SERVER_HOST, server.sockets[0].getsockname()[1]),
+			  file = sys.stderr)
+		async with server:
+			await server.serve_forever()
+
+	try:
+		asyncio.run(run())
+	except KeyboardInterrupt:
+		pass
+	finally:
+		motifServer.close()
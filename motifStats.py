@@ -0,0 +1,229 @@
+'''
+Library-wide statistics for many Motif files, e.g. thousands of backups:
+which file versions they are, how full their USR banks are, and which user
+waveforms turn up in the most of them.
+
+Each file is read in a worker process, walking just the entry headers of
+the blocks it needs, into a small LibraryStats of counters (never lists of
+entries). The main process merges these as they come back. Only a bounded
+number of files are in flight at once (see motifBatch.mapFiles), and only
+the MAX_TRACKED_WAVEFORMS most common waveforms are kept counting, so
+memory use doesn't grow with the number of files.
+'''
+
+import collections, json, sys
+
+import motifBatch
+from motifDiff import regionHash
+from printMotifFile import MotifFile, VoiceKind, blockSpecs, entryLabelFns, voiceKind, VOICE_KIND_BY_PRINT_FN
+
+SLOTS_PER_BANK =			128
+USER_BANKS =				('USR1', 'USR2', 'USR3', 'USR4', 'UDR')
+BANK_ITEMS =				('ms', 'pf', 'vc')		# data types whose entries are stored by bank
+MAX_TRACKED_WAVEFORMS =		4096
+
+class LibraryStats:
+	'''
+	Counters for some number of Motif files. fileStats makes one for a single
+	file and merge adds another one in, so the same class is both the partial
+	result of a worker and the running total.
+	'''
+
+	def __init__(self):
+		self.nFiles =			0
+		self.nBytes =			0
+		self.layouts =			collections.Counter()	# 'pre-XF' or 'XF' -> files
+		self.versions =			collections.Counter()	# file version string -> files
+		self.entries =			collections.Counter()	# blockSpecs key -> entries
+		self.filesWith =		collections.Counter()	# blockSpecs key -> files with any entries
+		self.bankEntries =		collections.Counter()	# (blockSpecs key, user bank) -> slots in use
+		self.bankFiles =		collections.Counter()	# blockSpecs key -> files with that kind of bank
+		self.waveforms =		{}		# data hash -> [files, size, a name it has]
+		self.waveformError =	0		# waveform file counts may be this much too low
+
+	def merge(self, other):
+		self.nFiles += other.nFiles
+		self.nBytes += other.nBytes
+		for counterName in ('layouts', 'versions', 'entries', 'filesWith', 'bankEntries', 'bankFiles'):
+			getattr(self, counterName).update(getattr(other, counterName))
+		for hash, (nFiles, size, name) in other.waveforms.items():
+			tally = self.waveforms.get(hash)
+			if tally is None:
+				self.waveforms[hash] = [nFiles, size, name]
+			else:
+				tally[0] += nFiles
+		self.waveformError += other.waveformError
+		if len(self.waveforms) > 2 * MAX_TRACKED_WAVEFORMS:
+			self.pruneWaveforms()
+
+	def pruneWaveforms(self):
+		# keeps the MAX_TRACKED_WAVEFORMS most common waveforms; one that is dropped and
+		# turns up again starts over, so counts may then be low by the most files dropped
+		if len(self.waveforms) <= MAX_TRACKED_WAVEFORMS:
+			return
+		tallies = sorted(self.waveforms.items(), key = lambda item: (-item[1][0], item[0]))
+		self.waveformError += tallies[MAX_TRACKED_WAVEFORMS][1][0]
+		self.waveforms = dict(tallies[:MAX_TRACKED_WAVEFORMS])
+
+	def topWaveforms(self, n):
+		# [(files, size, name, hash), ...], the n in the most files first
+		self.pruneWaveforms()
+		tallies = [(nFiles, size, name, hash) for hash, (nFiles, size, name) in self.waveforms.items()]
+		tallies.sort(key = lambda tally: (-tally[0], tally[2], tally[3]))
+		return tallies[:n]
+
+	def bankFill(self):
+		# [(blockSpecs key, user bank, slots in use, average fraction of its slots in use), ...]
+		fill = []
+		for blockAbbrev in BANK_ITEMS:
+			for bank in USER_BANKS:
+				if (blockAbbrev, bank) not in self.bankEntries:
+					continue
+				nEntries = self.bankEntries[(blockAbbrev, bank)]
+				fill.append((blockAbbrev, bank, nEntries,
+							 nEntries / (SLOTS_PER_BANK * self.bankFiles[blockAbbrev])))
+		return fill
+
+	def toJson(self, nTopWaveforms):
+		return {
+			'files' :			self.nFiles,
+			'bytes' :			self.nBytes,
+			'layouts' :			dict(self.layouts),
+			'versions' :		dict(sorted(self.versions.items())),
+			'entries' :			dict((blockAbbrev, {'entries' : self.entries[blockAbbrev],
+													'files' : self.filesWith[blockAbbrev]})
+									 for blockAbbrev in blockSpecs.keys() if blockAbbrev in self.filesWith),
+			'banks' :			[{'item' : blockAbbrev, 'bank' : bank, 'slots' : nEntries,
+								  'fill' : round(fraction, 4)}
+								 for blockAbbrev, bank, nEntries, fraction in self.bankFill()],
+			'userWaveforms' :	[{'files' : nFiles, 'size' : size, 'name' : name, 'hash' : hash.hex()}
+								 for nFiles, size, name, hash in self.topWaveforms(nTopWaveforms)],
+			'userWaveformCountError' :	self.waveformError,
+			}
+
+def fileStats(fileName):
+	# a LibraryStats for one file; entries are only counted, and only waveform data is read
+	stats = LibraryStats()
+	with MotifFile(fileName) as motifFile:
+		stats.nFiles = 1
+		stats.nBytes = motifFile.fileSize()
+		stats.layouts[motifFile.layout.name] += 1
+		stats.versions[motifFile.fileVersionStr] += 1
+		voiceKindCounts = None
+		for blockAbbrev, blockSpec in blockSpecs.items():
+			if not motifFile.hasBlock(blockSpec.ident):
+				continue
+			if blockSpec.ident == b'EVCE':
+				if voiceKindCounts is None:
+					voiceKindCounts = voiceStats(motifFile, stats)
+				nEntries = voiceKindCounts[VOICE_KIND_BY_PRINT_FN[blockSpec.printFn]]
+			elif blockAbbrev in BANK_ITEMS:
+				entryNumbers = list(motifFile.entryNumbers(blockSpec.ident))
+				countBankSlots(motifFile, stats, blockAbbrev, entryNumbers)
+				nEntries = len(entryNumbers)
+			else:
+				nEntries = motifFile.entryCount(blockSpec.ident)
+			if nEntries > 0:
+				stats.entries[blockAbbrev] += nEntries
+				stats.filesWith[blockAbbrev] += 1
+		userWaveformStats(motifFile, stats)
+	return stats
+
+def countBankSlots(motifFile, stats, blockAbbrev, entryNumbers):
+	# adds the number of distinct slots in use in each user bank
+	labelFn = entryLabelFns[blockSpecs[blockAbbrev].ident]
+	labels = set(labelFn(motifFile, entryNumber) for entryNumber in entryNumbers)
+	for label in labels:
+		bank = label.split(':')[0]
+		if bank in USER_BANKS:
+			stats.bankEntries[(blockAbbrev, bank)] += 1
+	stats.bankFiles[blockAbbrev] += 1
+
+def voiceStats(motifFile, stats):
+	# counts the EVCE block's 3 kinds of voice, and the bank slots of the ordinary ones
+	voiceKindCounts = [0, 0, 0]
+	voiceNumbers = []
+	for entryNumber in motifFile.entryNumbers(b'EVCE'):
+		kind = voiceKind(entryNumber)
+		voiceKindCounts[kind] += 1
+		if kind == VoiceKind.VOICE:
+			voiceNumbers.append(entryNumber)
+	countBankSlots(motifFile, stats, 'vc', voiceNumbers)
+	return voiceKindCounts
+
+def userWaveformStats(motifFile, stats):
+	# hashes the data of each user waveform (the first waveform type), once per distinct waveform
+	blockSpec = blockSpecs['wf']
+	if not motifFile.hasBlock(blockSpec.ident) or not motifFile.hasBlock(blockSpec.dataIdent):
+		return
+	dataBlockPosn = motifFile.catalog[blockSpec.dataIdent]
+	layout = motifFile.layout
+	for entry in motifFile.entries(blockSpec):
+		if entry.dataSize == 0 or layout.waveformTypeIndex(entry.number) != 0:
+			continue
+		dataPosn = dataBlockPosn + entry.dataOffset + 8		# skip the Data chunk's header
+		hash = regionHash(motifFile, dataPosn, dataPosn + entry.dataSize)
+		if hash not in stats.waveforms:
+			stats.waveforms[hash] = [1, entry.dataSize, entry.name.split(':')[-1]]
+
+def collectStats(fileNames, total, nWorkers = None):
+	'''
+	Maps fileStats over fileNames across a process pool and merges the results
+	into total (a LibraryStats), in whatever order they finish. Yields
+	(fileName, error) per file; error is None if ok.
+	'''
+	jobArgs = ((fileName,) for fileName in fileNames)
+	for fileName, stats, error in motifBatch.mapFiles(fileStats, jobArgs, nWorkers, ordered = False):
+		if error is None:
+			total.merge(stats)
+		yield fileName, error
+
+def printStats(stats, nTopWaveforms, out):
+	print('%d files, %d bytes' % (stats.nFiles, stats.nBytes), file = out)
+	for layoutName, nFiles in sorted(stats.layouts.items()):
+		print('   %-8s %6d files' % (layoutName, nFiles), file = out)
+	print('\nFile versions', file = out)
+	for versionStr, nFiles in sorted(stats.versions.items()):
+		print('   %-8s %6d files' % (versionStr, nFiles), file = out)
+
+	print('\n%-16s %8s %8s' % ('Data type', 'entries', 'files'), file = out)
+	for blockAbbrev, blockSpec in blockSpecs.items():
+		if blockAbbrev in stats.filesWith:
+			print('%-16s %8d %8d' % (blockSpec.name, stats.entries[blockAbbrev], stats.filesWith[blockAbbrev]),
+				  file = out)
+
+	print('\nBank fill (average per file, of %d slots)' % SLOTS_PER_BANK, file = out)
+	for blockAbbrev, bank, nEntries, fraction in stats.bankFill():
+		print('   %-14s %-5s %8d slots %6.1f%%' % (blockSpecs[blockAbbrev].name, bank, nEntries, fraction * 100),
+			  file = out)
+
+	topWaveforms = stats.topWaveforms(nTopWaveforms)
+	print('\nUser waveforms in the most files', file = out)
+	for nFiles, size, name, hash in topWaveforms:
+		print('   %6d files  %10d bytes  %s  (%s)' % (nFiles, size, name, hash.hex()[:12]), file = out)
+	if stats.waveformError > 0:
+		print('   (more waveforms than could be tracked: counts may be up to %d too low)' % stats.waveformError,
+			  file = out)
+
+def printLibraryStats(paths, nWorkers = None, asJson = False, nTopWaveforms = 20, out = None):
+	'''
+	Prints statistics for the Motif files named by paths (files, directories,
+	glob patterns or archives), as text or JSON. Progress goes to stderr.
+	Returns the number of files that could not be read.
+	'''
+	if out is None:
+		out = sys.stdout
+	fileNames = motifBatch.expandPaths(paths)
+	nFailed = 0
+	stats = LibraryStats()
+	for fileName, error in collectStats(fileNames, stats, nWorkers):
+		if error is not None:
+			nFailed += 1
+			print('FAILED  %s (%s)' % (fileName, error), file = sys.stderr)
+	print('%d files, %d ok, %d failed' % (len(fileNames), len(fileNames) - nFailed, nFailed), file = sys.stderr)
+	if asJson:
+		json.dump(stats.toJson(nTopWaveforms), out, indent = 1)
+		out.write('\n')
+	else:
+		printStats(stats, nTopWaveforms, out)
+	return nFailed
@@ -0,0 +1,23 @@
+'''
+The fixture shared by the test_*.py modules: each test gets a temporary
+directory, with its own cache directory and a synthetic Motif file made by
+makeMotifFile.
+'''
+
+import os, tempfile, unittest
+from unittest import mock
+
+import makeMotifFile, motifIndex
+
+class MotifFileTestCase(unittest.TestCase):
+	N_ENTRIES = 100
+
+	def setUp(self):
+		tempDir = tempfile.TemporaryDirectory()
+		self.addCleanup(tempDir.cleanup)
+		self.tempDir = tempDir.name
+		envPatch = mock.patch.dict(os.environ,
+								   {motifIndex.CACHE_DIR_ENV_VAR : os.path.join(self.tempDir, 'cache')})
+		envPatch.start()
+		self.addCleanup(envPatch.stop)
+		self.fileName = makeMotifFile.makeMotifFile(os.path.join(self.tempDir, 'test.X0A'), self.N_ENTRIES)
@@ -0,0 +1,192 @@
+'''
+Watches a directory and keeps the reports of the Motif files in it up to
+date: whenever a file is added or changed, its .txt report (and optionally
+its rows in an SQLite export) is regenerated.
+
+The directory is polled. A file is only picked up once its size and mtime
+have held still for a while, so files that are still being copied aren't
+read half-written, and only if its contents have really changed (a file
+that is just touched or copied over with the same bytes is left alone).
+Changed files are processed in parallel across a process pool. What has
+been processed is kept in a small JSON state file, along with the options
+it was processed with, so a restarted watch only processes what changed
+while it wasn't running, or everything if it is given other options.
+'''
+
+import concurrent.futures, hashlib, json, os, sys, time
+
+import motifArchive, motifBatch, motifExport, motifIndex
+
+STATE_FORMAT =			2
+STATE_FILE_EXT =		'.watch.json'
+DEFAULT_POLL_SECS =		2.0
+DEFAULT_SETTLE_SECS =	2.0				# how long a file must be unchanged before it is read
+HASH_CHUNK_SIZE =		1 << 20
+
+def fileHash(fileName):
+	digest = hashlib.blake2b(digest_size = 16)
+	with motifArchive.openInput(fileName) as inputFile:
+		for chunk in iter(lambda: inputFile.read(HASH_CHUNK_SIZE), b''):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+def watchSettings(selectedItems, outDir, dbPath):
+	# the options the outputs depend on, besides the files themselves
+	return {'items' :	list(selectedItems),
+			'outDir' :	None if outDir is None else os.path.abspath(outDir),
+			'db' :		None if dbPath is None else os.path.abspath(dbPath)}
+
+def loadState(statePath, settings):
+	'''
+	Returns {file path: [size, mtime_ns, content hash, ok]} for the files
+	processed so far with these settings (see watchSettings()).
+	'''
+	try:
+		with open(statePath, 'rb') as stateFile:
+			state = json.loads(stateFile.read().decode('utf-8'))
+		if state['format'] == STATE_FORMAT and state['settings'] == settings:
+			return state['files']
+	except Exception:
+		pass				# missing or unreadable: start from scratch
+	return {}				# or made with other settings: every output may be missing or stale
+
+def saveState(statePath, settings, files):
+	stateBytes = json.dumps({'format' : STATE_FORMAT, 'settings' : settings, 'files' : files},
+							indent = 0, sort_keys = True).encode('utf-8')
+	motifIndex.writeAtomically(statePath, lambda stateFile: stateFile.write(stateBytes))
+
+def regenerateFile(fileName, selectedItems, textFilePath, export):
+	# runs in a worker process; returns (BatchResult, motifExport.fileTables() result or None)
+	result = motifBatch.printFileToText(fileName, selectedItems, textFilePath)
+	if not result.ok or not export:
+		return result, None
+	tables, error = motifBatch.callOrError(motifExport.fileTables, fileName, selectedItems)
+	if error is not None:
+		return motifBatch.BatchResult(fileName, False, error), None
+	return result, tables
+
+class Watcher:
+	def __init__(self, dirPath, selectedItems = (), outDir = None, dbPath = None, nWorkers = None,
+				 settleSecs = DEFAULT_SETTLE_SECS, statePath = None, log = None):
+		self.dirPath =			dirPath
+		self.selectedItems =	selectedItems
+		self.outDir =			outDir
+		self.settleSecs =		settleSecs
+		self.statePath =		statePath or motifIndex.cachePathFor(dirPath, ext = STATE_FILE_EXT)
+		self.log =				log or sys.stderr
+		self.settings =			watchSettings(selectedItems, outDir, dbPath)
+		self.files =			loadState(self.statePath, self.settings)
+		self.pending =			{}		# file path -> (size, mtime_ns, when that was first seen)
+		self.running =			{}		# future -> (file name, file path, [size, mtime_ns, content hash])
+		self.writer =			None if dbPath is None else motifExport.openWriter('sqlite', dbPath)
+		self.executor =			concurrent.futures.ProcessPoolExecutor(nWorkers)
+
+	def scan(self):
+		'''
+		Looks for new and changed files, and starts regenerating the reports
+		of those that have settled. Returns the number of files started.
+		'''
+		now = time.monotonic()
+		runningPaths = {filePath for _, filePath, _ in self.running.values()}
+		seenPaths = set()
+		stateChanged = False
+		nStarted = 0
+		for fileName in motifBatch.expandPaths([self.dirPath]):
+			try:
+				filePath, size, mtime = motifIndex.fileKey(fileName)
+			except OSError:
+				continue					# gone since it was listed
+			seenPaths.add(filePath)
+			if filePath in runningPaths:
+				continue
+			fileStat = (size, mtime)
+			known = self.files.get(filePath)
+			if known is not None and tuple(known[:2]) == fileStat:
+				self.pending.pop(filePath, None)
+				continue
+			pending = self.pending.get(filePath)
+			if pending is None or pending[:2] != fileStat:
+				self.pending[filePath] = fileStat + (now,)		# new, or still being written
+				continue
+			if now - pending[2] < self.settleSecs:
+				continue
+			del self.pending[filePath]
+			try:
+				contentHash = fileHash(filePath)
+			except OSError:
+				continue
+			if known is not None and known[2] == contentHash:
+				self.files[filePath] = list(fileStat) + [contentHash, known[3]]
+				stateChanged = True
+				continue
+			textFilePath = motifBatch.textFilePathFor(fileName, self.outDir, self.dirPath)
+			future = self.executor.submit(regenerateFile, fileName, self.selectedItems, textFilePath,
+										  self.writer is not None)
+			self.running[future] = (fileName, filePath, list(fileStat) + [contentHash])
+			nStarted += 1
+		for filePath in list(self.files.keys()):
+			if filePath not in seenPaths:
+				del self.files[filePath]
+				stateChanged = True
+		for filePath in list(self.pending.keys()):
+			if filePath not in seenPaths:
+				del self.pending[filePath]
+		if stateChanged:
+			saveState(self.statePath, self.settings, self.files)
+		return nStarted
+
+	def collect(self, wait = False):
+		# records the files that have finished (all running ones, if wait); returns how many failed
+		if wait:
+			concurrent.futures.wait(self.running.keys())
+		nFailed = 0
+		for future in [future for future in self.running.keys() if future.done()]:
+			fileName, filePath, fileState = self.running.pop(future)
+			try:
+				result, tables = future.result()
+			except concurrent.futures.process.BrokenProcessPool as e:
+				# e.g. interrupted; not the file's fault, so try it again next time
+				print('FAILED  %s (%s)' % (fileName, str(e) or e.__class__.__name__), file = self.log)
+				nFailed += 1
+				continue
+			except Exception as e:
+				result, tables = motifBatch.BatchResult(fileName, False, str(e) or e.__class__.__name__), None
+			if tables is not None:
+				fileVersionStr, blockTables = tables
+				motifExport.exportTables(self.writer, fileName, fileVersionStr, blockTables)
+			if result.ok:
+				print('ok      %s' % fileName, file = self.log)
+			else:
+				nFailed += 1
+				print('FAILED  %s (%s)' % (fileName, result.message), file = self.log)
+			# failed files are recorded too, so they aren't retried until they change again
+			self.files[filePath] = fileState + [result.ok]
+			saveState(self.statePath, self.settings, self.files)
+		return nFailed
+
+	def run(self, pollSecs = DEFAULT_POLL_SECS, once = False):
+		'''
+		Polls every pollSecs until interrupted or, if once, until every
+		changed file has been processed. Returns the number of files that
+		failed.
+		'''
+		nFailed = 0
+		try:
+			while True:
+				self.scan()
+				nFailed += self.collect()
+				if once and len(self.pending) == 0 and len(self.running) == 0:
+					break
+				time.sleep(min(pollSecs, self.settleSecs) if once else pollSecs)
+		except KeyboardInterrupt:
+			pass
+		finally:
+			nFailed += self.collect(wait = True)
+			self.close()
+		return nFailed
+
+	def close(self):
+		self.executor.shutdown()
+		if self.writer is not None:
+			self.writer.close()
+			self.writer = None
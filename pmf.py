@@ -1,4 +1,4 @@
-import sys
+import argparse, os, sys
 from printMotifFile import blockSpecs, printMotifFile, VERSION as PMF_VERSION
 
 help1Str = \
@@ -7,6 +7,11 @@ To print everything in a Motif file, type:
 
    python pmf.py motifFileName
 
+The Motif file may also be in a zip or tar archive (give the archive
+alone to print every Motif file in it):
+
+   python pmf.py backups.zip!/2014/motifFileName
+
 If you want to save the output into a file, do this:
 
    python pmf.py ... > outputFileName
@@ -17,6 +22,98 @@ all Songs and all Patterns:
 
    python pmf.py sg pt motifFileName
 
+To see how long each data type took to read and print, and how much
+reading it took, add --stats (the table is printed after the output):
+
+   python pmf.py --stats [sg pt ...] motifFileName
+
+To decode the data types of a big Motif file in several processes at
+once (-j 0 uses one per CPU), add -j and the number of processes:
+
+   python pmf.py -j 4 [sg pt ...] motifFileName
+
+To print from the file's index instead (built on first use and kept
+until the file changes, so printing an unchanged file again only
+loads the index), add --index:
+
+   python pmf.py --index [sg pt ...] motifFileName
+
+To print many Motif files at once, give directories, glob patterns
+or file names after the batch command. Each file gets its own .txt
+file (use -o to put them in another directory, or -c to print them
+all to the screen). Use -j to set how many files print at once:
+
+   python pmf.py batch [-j 4] [-o outDir | -c] [sg pt ...] backupDir '*.X3A'
+
+To keep the .txt files of a directory of Motif files up to date as
+files are added or changed (add --db to also keep an SQLite export up
+to date, or --once to just catch up and stop; stop watching with ctrl-C):
+
+   python pmf.py watch [-j 4] [-o outDir] [--db library.db] [sg pt ...] backupDir
+
+To look up one entry by data type and label (or #entryNumber), using
+an index that is built on first use and kept until the file changes:
+
+   python pmf.py get vc USR2:045 motifFileName
+
+To find the Motif files with entries whose names contain some text
+(ignoring case), first index them (only new or changed files are read
+again), then search as often as you like:
+
+   python pmf.py index [-j 4] backupDir ...
+   python pmf.py search [vc pt ...] 'warm pad'
+
+To rename entries in a Motif file without rewriting it (a new name
+replaces the part of the name after any 'category:' and must fit in
+the space the old one takes up; -n shows what would change without
+changing anything):
+
+   python pmf.py rename [-n] motifFileName vc USR1:005 'Warm Pad' ...
+   python pmf.py rename -f renames.txt motifFileName
+   python pmf.py rename --prefix vc 'ST ' motifFileName
+
+renames.txt has one 'item label new name' per line.
+
+To write a new Motif file with just some data types of another one,
+or just some entries (by label or #entryNumber) of a data type:
+
+   python pmf.py extract -o patterns.X0A pt motifFileName
+   python pmf.py extract -o share.X0A wf=0001,0002 vc=USR1:005 motifFileName
+
+To export Motif files as JSON Lines, CSV (one file per data type, in
+the -o directory) or an SQLite database, with one table per data type:
+
+   python pmf.py export -f sqlite -o library.db [sg pt ...] backupDir
+
+To see what changed between two Motif files, e.g. two backups of the
+same synth (entries are listed as added +, removed -, renamed ~ or
+with changed data *):
+
+   python pmf.py diff [sg pt ...] oldMotifFileName newMotifFileName
+
+To find waveforms that are stored more than once across many Motif
+files, even under different names (waveform data is hashed once per
+file and kept in an index, so later runs only read new or changed files):
+
+   python pmf.py dedupe [-j 4] backupDir ...
+
+To let other programs ask about Motif files over HTTP, with JSON
+answers (only programs on this computer can connect; see motifServer.py
+for what can be asked):
+
+   python pmf.py serve [--port 8470]
+
+To see statistics for a whole library of Motif files: how many are
+pre-XF or XF files, how full their USR banks are on average, and which
+user waveforms are in the most files (--json for JSON output):
+
+   python pmf.py stats [-j 4] [--json] [--top 20] backupDir ...
+
+To print just how many of each data type Motif files contain
+(this only reads the block headers, so it is fast):
+
+   python pmf.py summary [sg pt ...] motifFileName ...
+
 The two-letter abbreviations for the various data types are:
 '''
 
@@ -29,8 +126,7 @@ it under the terms of the GNU General Public License as published by
 the Free Software Foundation, either version 3 of the License, or
 (at your option) any later version.'''
 
-if len(sys.argv) == 1:
-	# print help information
+def printHelp():
 	print('pmf (Print Motif File)')
 	print('version %s' % PMF_VERSION)
 	print('by Michael Trigoboff\nmtrigoboff@comcast.net\nhttp://spot.pcc.edu/~mtrigobo')
@@ -39,12 +135,367 @@ if len(sys.argv) == 1:
 		print('   %s    %s' % (blockFlag, blockSpec.name.lower()))
 	print(help2Str)
 
-# process file
-elif len(sys.argv) > 2:
-	itemFlags = sys.argv[1:-1]
-else:
-	itemFlags = ()
-try:
-	printMotifFile(sys.argv[-1], itemFlags)
-except Exception as e:
-	print('file problem (%s)' % e, file = sys.stderr)
+def splitItemsAndPaths(args):
+	# leading data type abbreviations select items, everything after them is a path
+	nItems = 0
+	while nItems < len(args) and args[nItems] in blockSpecs:
+		nItems += 1
+	return args[:nItems], args[nItems:]
+
+def batchCmd(args):
+	import motifBatch
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py batch',
+									 description = 'print many Motif files in parallel')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	outGroup = parser.add_mutually_exclusive_group()
+	outGroup.add_argument('-o', '--out-dir', default = None,
+						  help = 'write .txt files here instead of next to each Motif file')
+	outGroup.add_argument('-c', '--combined', action = 'store_true',
+						  help = 'print all files to stdout, in sorted order')
+	parser.add_argument('args', nargs = '+', metavar = 'item|path',
+						help = 'data type abbreviations, then files, directories or glob patterns')
+	options = parser.parse_args(args)
+	itemFlags, paths = splitItemsAndPaths(options.args)
+	if len(paths) == 0:
+		parser.error('no files given')
+	nFailed = motifBatch.printBatch(paths, itemFlags, options.jobs, options.out_dir, options.combined)
+	return 1 if nFailed > 0 else 0
+
+def extractCmd(args):
+	import motifExtract
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py extract',
+									 description = 'write a Motif file with some of the data of another one')
+	parser.add_argument('-o', '--out', required = True, help = 'Motif file to write')
+	parser.add_argument('items', nargs = '+', metavar = 'item[=key,...]',
+						help = 'data types to extract, each with just some of its entries if keys are given')
+	parser.add_argument('file')
+	options = parser.parse_args(args)
+	try:
+		selection = motifExtract.parseSelection(options.items)
+	except ValueError as e:
+		parser.error(str(e))
+	try:
+		nBytes = motifExtract.extractSubset(options.file, options.out, selection)
+	except KeyError as e:
+		print(e.args[0], file = sys.stderr)
+		return 1
+	except Exception as e:
+		print('file problem (%s)' % e, file = sys.stderr)
+		return 1
+	print('%s: %d bytes' % (options.out, nBytes), file = sys.stderr)
+	return 0
+
+def getCmd(args):
+	import motifIndex
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py get',
+									 description = 'print one entry, found through the file\'s index')
+	parser.add_argument('--rebuild', action = 'store_true', help = 'rebuild the index first')
+	parser.add_argument('item', choices = list(blockSpecs.keys()), help = 'data type abbreviation')
+	parser.add_argument('key', help = 'entry label, e.g. USR2:045 or FL1:0001, or #entryNumber')
+	parser.add_argument('file')
+	options = parser.parse_args(args)
+	try:
+		if options.rebuild:
+			motifIndex.loadIndex(options.file, rebuild = True)
+		entry = motifIndex.findEntry(options.file, options.item, options.key)
+	except KeyError as e:
+		print(e.args[0], file = sys.stderr)
+		return 1
+	except Exception as e:
+		print('file problem (%s)' % e, file = sys.stderr)
+		return 1
+	print(entry.label, entry.name)
+	if entry.params is not None:
+		for paramName, value in sorted(entry.params.items()):
+			print('   %s: %s' % (paramName, value))
+	return 0
+
+def dedupeCmd(args):
+	import motifDedupe
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py dedupe',
+									 description = 'list waveforms stored more than once across Motif files')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	parser.add_argument('--index', default = None,
+						help = 'waveform hash index to use (default: one in the cache directory)')
+	parser.add_argument('paths', nargs = '+', metavar = 'path',
+						help = 'files, directories or glob patterns')
+	options = parser.parse_args(args)
+	nFailed = motifDedupe.printDedupe(options.paths, options.index, options.jobs)
+	return 1 if nFailed > 0 else 0
+
+def diffCmd(args):
+	import motifDiff
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py diff',
+									 description = 'list the entries that changed between two Motif files')
+	parser.add_argument('args', nargs = '+', metavar = 'item|file',
+						help = 'data type abbreviations, then the old and new files')
+	options = parser.parse_args(args)
+	itemFlags, fileNames = splitItemsAndPaths(options.args)
+	if len(fileNames) != 2:
+		parser.error('two files are needed')
+	try:
+		nChanges = motifDiff.printDiff(fileNames[0], fileNames[1], itemFlags)
+	except Exception as e:
+		print('file problem (%s)' % e, file = sys.stderr)
+		return 2
+	return 1 if nChanges > 0 else 0
+
+def exportCmd(args):
+	import motifBatch, motifExport
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py export',
+									 description = 'export Motif files as JSON Lines, CSV or SQLite')
+	parser.add_argument('-f', '--format', choices = list(motifExport.writerClasses.keys()), default = 'jsonl')
+	parser.add_argument('-o', '--out', default = None,
+						help = 'output file (jsonl, default stdout), directory (csv) or database (sqlite)')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	parser.add_argument('args', nargs = '+', metavar = 'item|path',
+						help = 'data type abbreviations, then files, directories or glob patterns')
+	options = parser.parse_args(args)
+	itemFlags, paths = splitItemsAndPaths(options.args)
+	if len(paths) == 0:
+		parser.error('no files given')
+	if options.out is None:
+		if options.format != 'jsonl':
+			parser.error('-o is needed for %s output' % options.format)
+		options.out = '-'
+	fileNames = motifBatch.expandPaths(paths)
+	writer = motifExport.openWriter(options.format, options.out)
+	nFailed = 0
+	try:
+		for fileName, error in motifExport.exportFiles(fileNames, itemFlags, writer, options.jobs):
+			if error is None:
+				print('ok      %s' % fileName, file = sys.stderr)
+			else:
+				nFailed += 1
+				print('FAILED  %s (%s)' % (fileName, error), file = sys.stderr)
+	finally:
+		writer.close()
+	print('%d files, %d ok, %d failed' % (len(fileNames), len(fileNames) - nFailed, nFailed), file = sys.stderr)
+	return 1 if nFailed > 0 else 0
+
+def indexCmd(args):
+	import motifSearch
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py index',
+									 description = 'add Motif files to the name index used by search')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	parser.add_argument('--index', default = None,
+						help = 'name index to use (default: one in the cache directory)')
+	parser.add_argument('paths', nargs = '+', metavar = 'path',
+						help = 'files, directories or glob patterns')
+	options = parser.parse_args(args)
+	nFailed = motifSearch.indexFiles(options.paths, options.index, options.jobs)
+	return 1 if nFailed > 0 else 0
+
+def renameCmd(args):
+	import motifRename
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py rename',
+									 description = 'rename entries in a Motif file in place')
+	parser.add_argument('-n', '--dry-run', action = 'store_true', help = 'show what would be renamed')
+	parser.add_argument('--no-verify', action = 'store_true', help = "don't read the new names back")
+	parser.add_argument('-f', '--file', dest = 'listFile', default = None,
+						help = "file of 'item key new name' lines")
+	parser.add_argument('--prefix', nargs = 2, action = 'append', default = [], metavar = ('ITEM', 'TAG'),
+						help = 'put TAG in front of the name of every ITEM entry')
+	parser.add_argument('motifFile')
+	parser.add_argument('changes', nargs = '*', metavar = 'item key newName')
+	options = parser.parse_args(args)
+	if len(options.changes) % 3 != 0:
+		parser.error('each rename needs an item, a key and a new name')
+	try:
+		changes = [motifRename.NameChange(*options.changes[i:i + 3]) for i in range(0, len(options.changes), 3)]
+		if options.listFile is not None:
+			with open(options.listFile) as listFile:
+				changes += motifRename.readChanges(listFile)
+		for blockAbbrev, prefix in options.prefix:
+			if blockAbbrev not in blockSpecs:
+				parser.error('unknown data type: %s' % blockAbbrev)
+			changes += motifRename.prefixChanges(options.motifFile, blockAbbrev, prefix)
+		if len(changes) == 0:
+			parser.error('nothing to rename')
+		nProblems = motifRename.renameEntries(options.motifFile, changes, options.dry_run, not options.no_verify)
+	except Exception as e:
+		print('file problem (%s)' % e, file = sys.stderr)
+		return 1
+	return 1 if nProblems > 0 else 0
+
+def searchCmd(args):
+	import motifSearch
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py search',
+									 description = 'list indexed entries whose names contain some text')
+	parser.add_argument('--index', default = None,
+						help = 'name index to use (default: one in the cache directory)')
+	parser.add_argument('args', nargs = '+', metavar = 'item|text',
+						help = 'data type abbreviations, then the text to look for')
+	options = parser.parse_args(args)
+	itemFlags, textArgs = splitItemsAndPaths(options.args)
+	if len(textArgs) == 0:
+		parser.error('no search text given')
+	nFound = motifSearch.printSearch(' '.join(textArgs), itemFlags, options.index)
+	return 0 if nFound > 0 else 1
+
+def serveCmd(args):
+	import motifServer
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py serve',
+									 description = 'answer JSON queries about Motif files over HTTP on localhost')
+	parser.add_argument('--port', type = int, default = motifServer.DEFAULT_PORT)
+	parser.add_argument('--cache-mb', type = int, default = motifServer.DEFAULT_CACHE_SIZE >> 20,
+						help = 'how much parsed file data to keep in memory')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	options = parser.parse_args(args)
+	motifServer.serve(options.port, options.cache_mb << 20, options.jobs)
+	return 0
+
+def statsCmd(args):
+	import motifStats
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py stats',
+									 description = 'print statistics for a library of Motif files')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	parser.add_argument('--json', action = 'store_true', help = 'print the statistics as JSON')
+	parser.add_argument('--top', type = int, default = 20,
+						help = 'how many of the most common user waveforms to list')
+	parser.add_argument('paths', nargs = '+', metavar = 'path',
+						help = 'files, directories or glob patterns')
+	options = parser.parse_args(args)
+	nFailed = motifStats.printLibraryStats(options.paths, options.jobs, options.json, options.top)
+	return 1 if nFailed > 0 else 0
+
+def summaryCmd(args):
+	import motifArchive
+	from printMotifFile import printSummary
+
+	itemFlags, fileNames = splitItemsAndPaths(args)
+	# something that isn't a file and doesn't look like a path is a mistyped data type
+	unknownItems = [fileName for fileName in fileNames
+					if not ('.' in fileName or '/' in fileName or os.sep in fileName
+							or motifArchive.isFile(fileName))]
+	for blockAbbrev in unknownItems:
+		print('unknown data type: %s' % blockAbbrev, file = sys.stderr)
+	if len(unknownItems) > 0 or len(fileNames) == 0:
+		print('usage: pmf.py summary [item ...] file ...', file = sys.stderr)
+		return 2
+	status = 0
+	for i, fileName in enumerate(fileNames):
+		if i > 0:
+			print()
+		try:
+			printSummary(fileName, itemFlags)
+		except Exception as e:
+			print('file problem (%s)' % e, file = sys.stderr)
+			status = 1
+	return status
+
+def watchCmd(args):
+	import motifWatch
+
+	parser = argparse.ArgumentParser(prog = 'pmf.py watch',
+									 description = 'regenerate reports of Motif files in a directory as they change')
+	parser.add_argument('-j', '--jobs', type = int, default = None,
+						help = 'number of worker processes (default: one per CPU)')
+	parser.add_argument('-o', '--out-dir', default = None,
+						help = 'write .txt files here instead of next to each Motif file')
+	parser.add_argument('--db', default = None, help = 'also keep this SQLite export up to date')
+	parser.add_argument('--state', default = None,
+						help = 'state file (default: one in the cache directory for this directory)')
+	parser.add_argument('--interval', type = float, default = motifWatch.DEFAULT_POLL_SECS,
+						help = 'seconds between looks at the directory')
+	parser.add_argument('--settle', type = float, default = motifWatch.DEFAULT_SETTLE_SECS,
+						help = 'seconds a file must be unchanged before it is read')
+	parser.add_argument('--once', action = 'store_true', help = 'process what has changed, then stop')
+	parser.add_argument('args', nargs = '+', metavar = 'item|dir',
+						help = 'data type abbreviations, then the directory to watch')
+	options = parser.parse_args(args)
+	itemFlags, paths = splitItemsAndPaths(options.args)
+	if len(paths) != 1 or not os.path.isdir(paths[0]):
+		parser.error('one directory is needed')
+	watcher = motifWatch.Watcher(paths[0], itemFlags, options.out_dir, options.db, options.jobs,
+								 options.settle, options.state)
+	nFailed = watcher.run(options.interval, options.once)
+	return 1 if nFailed > 0 else 0
+
+commands = {
+	'batch' :	batchCmd,
+	'dedupe' :	dedupeCmd,
+	'diff' :	diffCmd,
+	'export' :	exportCmd,
+	'extract' :	extractCmd,
+	'get' :		getCmd,
+	'index' :	indexCmd,
+	'rename' :	renameCmd,
+	'search' :	searchCmd,
+	'serve' :	serveCmd,
+	'stats' :	statsCmd,
+	'summary' :	summaryCmd,
+	'watch' :	watchCmd,
+	}
+
+def main(args):
+	if len(args) == 0:
+		# print help information
+		printHelp()
+		return 0
+
+	if args[0] in commands:
+		return commands[args[0]](args[1:])
+
+	# process file
+	stats = None
+	if '--stats' in args:
+		from printMotifFile import ParseStats
+		args = [arg for arg in args if arg != '--stats']
+		stats = ParseStats()
+	useIndex = '--index' in args
+	if useIndex:
+		args = [arg for arg in args if arg != '--index']
+	nWorkers = 1
+	if '-j' in args:
+		i = args.index('-j')
+		try:
+			nWorkers = int(args[i + 1]) or None
+		except (IndexError, ValueError):
+			print('-j needs a number of processes', file = sys.stderr)
+			return 2
+		args = args[:i] + args[i + 2:]
+	if len(args) == 0:
+		print('usage: pmf.py [--stats] [--index] [-j processes] [item ...] motifFileName', file = sys.stderr)
+		return 2
+	try:
+		import motifArchive
+		if motifArchive.isArchivePath(args[-1]):		# print every Motif file in it
+			import motifBatch
+			fileNames = motifArchive.archiveMemberPaths(args[-1], motifBatch.isMotifFileName)
+		else:
+			fileNames = [args[-1]]
+		for i, fileName in enumerate(fileNames):
+			if i > 0:
+				print()
+			index = None
+			if useIndex:
+				import motifIndex
+				index = motifIndex.loadIndex(fileName)
+			printMotifFile(fileName, args[:-1], stats = stats, nWorkers = nWorkers, index = index)
+	except Exception as e:
+		print('file problem (%s)' % e, file = sys.stderr)
+		return 1
+	if stats is not None:
+		print('\n' + stats.table(), file = sys.stderr)
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -27,7 +27,7 @@ along with this program as file gpl.txt.
 If not, see <http://www.gnu.org/licenses/>.
 '''
 
-import collections, os.path, struct
+import array, bisect, collections, concurrent.futures, io, mmap, os.path, struct, sys, time
 
 VERSION = '4.0'
 
@@ -41,156 +41,777 @@ ENTRY_HDR_LGTH =				 	 8
 ENTRY_FIXED_SIZE_DATA_LGTH =	 	22
 ENTRY_FIXED_SIZE_DATA_LGTH_PRE_XF =	21
 
+# data-bearing entries read from the stream: how many entries' data is gathered per pass, and how
+# Data chunks are merged into one read (gaps of up to COALESCE_MAX_GAP, reads of up to COALESCE_MAX_READ)
+DATA_ENTRIES_PER_PASS =				1024
+COALESCE_MAX_GAP =					1 << 16
+COALESCE_MAX_READ =					1 << 22
+
 FILE_HDR_ID =		b'YAMAHA-YSFC'
 BLOCK_ENTRY_ID =	b'Entr'
 BLOCK_DATA_ID =		b'Data'
 
+ARCHIVE_MEMBER_SEP =	'!/'			# as in 'archive.zip!/path/file.X0A'
+
 BANKS = ('PRE1', 'PRE2', 'PRE3', 'PRE4', 'PRE5', 'PRE6', 'PRE7', 'PRE8',
 		 'USR1', 'USR2', 'USR3', 'USR4', 'GM',   'GMDR', 'PDR',  'UDR')
 
-# globals (this is just here for documentation)
-global catalog, fileVersion, inputStream, mixingVoices, \
-	   sampleVoices, voices, voiceBlockRead, waveformTypes
-
-def fileVersionPreXF():
-	return fileVersion[0] == 1 and fileVersion[1] == 0 and fileVersion[2] < 2
-
-def bankSectionNumberStr(bank, item):
-	number =			item & 0x7f
+def makeBankSectionNumberStr(bank, number):
 	section =			number >> 4
 	itemInSection =		number & 0x0f
 	return '%s:%03d(%c%02d)' % (BANKS[bank], number + 1, ord('A') + section, itemInSection + 1)
 
+# every bank/section/number label, made once: BANK_SECTION_NUMBER_STRS[bank][number]
+BANK_SECTION_NUMBER_STRS = tuple(tuple(makeBankSectionNumberStr(bank, number) for number in range(0, 128))
+								 for bank in range(0, len(BANKS)))
+
+def bankSectionNumberStr(bank, item):
+	return BANK_SECTION_NUMBER_STRS[bank][item & 0x7f]
+
 def bankSectNumStrFromEntryNum(entryNumber):
 	return bankSectionNumberStr(((entryNumber & 0x0780) >> 7) + 8, entryNumber & 0x007F)
 
+class WaveformType:
+	'''
+	A range of waveform numbers, and the waveforms in it that have been
+	read, as parallel columns: entry numbers in an array, (interned) names
+	in a list.
+	'''
+	def __init__(self, name, lowNumber, highNumber):
+		self.name =			name
+		self.lowNumber =	lowNumber
+		self.highNumber =	highNumber
+		self.numbers =		array.array('I')
+		self.names =		[]
+
+	def __len__(self):
+		return len(self.numbers)
+
+	def duplicates(self):
+		# name -> [entry number, ...], for the names that more than one waveform has
+		numbersByName = {}
+		for number, name in zip(self.numbers, self.names):
+			numbersByName.setdefault(name, []).append(number)
+		return dict((name, numbers) for name, numbers in numbersByName.items() if len(numbers) > 1)
+
+class FileLayout:
+	'''
+	The version-specific parts of the file format, with their structs compiled
+	once. MotifFile picks one per file from fileLayouts, by file version.
+	'''
+
+	def __init__(self, name, entryFixedSizeDataLgth, masterDataSize, waveformTypes,
+				 checkWaveformNumbers = True):
+		self.name =						name
+		self.entryFixedSizeDataLgth =	entryFixedSizeDataLgth
+		self.entryHdrStruct = \
+			struct.Struct('> 4s I 4x I 4x I I %dx' % (entryFixedSizeDataLgth - 20))
+				# entryId, entryLgth, dataSize, dataOffset, entryNumber
+		self.masterStruct = \
+			struct.Struct('> 4s 32x B x B B %dx' % (masterDataSize + 8 - 40))
+				# dataId, targetType, targetBank, target
+		self.waveformTypes =			waveformTypes		# only used for number ranges, never filled in
+		self.waveformLowNumbers =		[wfType.lowNumber for wfType in waveformTypes]
+		self.checkWaveformNumbers =		checkWaveformNumbers
+			# if False, every waveform is of waveformTypes[0]
+
+	def newWaveformTypes(self):
+		return tuple(WaveformType(wfType.name, wfType.lowNumber, wfType.highNumber)
+					 for wfType in self.waveformTypes)
+
+	def waveformTypeIndex(self, entryNumber):
+		# index into waveformTypes
+		if not self.checkWaveformNumbers:
+			return 0
+		i = bisect.bisect_right(self.waveformLowNumbers, entryNumber) - 1
+		if i < 0 or entryNumber > self.waveformTypes[i].highNumber:
+			raise Exception('uncategorized waveform (%d)' % entryNumber)
+		return i
+
+PRE_XF_LAYOUT = FileLayout('pre-XF', ENTRY_FIXED_SIZE_DATA_LGTH_PRE_XF, 360,
+						   (WaveformType('User Waveforms',	   1,  128),),
+						   checkWaveformNumbers = False)
+XF_LAYOUT = FileLayout('XF', ENTRY_FIXED_SIZE_DATA_LGTH, 552,
+					   (WaveformType('User Waveforms',	   1,  128),
+						WaveformType('FL1 Waveforms',	 129, 2176),
+						WaveformType('FL2 Waveforms',	2177, 4224)))
+
+# (lowest file version, FileLayout), sorted; a file uses the last one whose version is <= its own
+fileLayouts = []
+
+def registerFileLayout(lowVersion, layout):
+	fileLayouts.append((tuple(lowVersion), layout))
+	fileLayouts.sort(key = lambda versionLayout: versionLayout[0])
+
+def fileLayoutFor(fileVersion):
+	i = bisect.bisect_right([lowVersion for lowVersion, _ in fileLayouts], tuple(fileVersion)) - 1
+	if i < 0:
+		raise Exception('unknown file version: %s' % '.'.join(map(str, fileVersion)))
+	return fileLayouts[i][1]
+
+registerFileLayout((0,),		XF_LAYOUT)
+registerFileLayout((1, 0, 0),	PRE_XF_LAYOUT)
+registerFileLayout((1, 0, 2),	XF_LAYOUT)
+
+# block ident -> fn(entry) returning a dict of the entry's parameters, decoded from entry.data.
+# Only the Master payload layout is known, so Voice, Performance, Song and Pattern
+# entries have no params.
+payloadDecoders = {}
+NOT_DECODED = object()			# Entry._params until params is first used
+
+def registerPayloadDecoder(ident, decodeFn):
+	payloadDecoders[ident] = decodeFn
+
+class Entry:
+	'''
+	One parsed entry, as yielded by MotifFile.entries().
+
+	For needsData blocks, data is read along with the entry. For other
+	blocks it is only read from the D block on first access, and params is
+	only decoded (by the block's registered payload decoder) on first access,
+	at most once, so reports that just use names never touch the entry's
+	payload.
+	'''
+	__slots__ = ('ident', 'number', 'label', 'name', 'posn',
+				 'motifFile', 'dataOffset', 'dataSize', 'dataRead', '_data', '_params')
+
+	def __init__(self, ident, number, label, name, data, posn,
+				 motifFile = None, dataOffset = 0, dataSize = 0):
+		self.ident =		ident			# block ident, e.g. b'EVCE'
+		self.number =		number			# entry number as stored in the file
+		self.label =		label			# bank/section/number label, as printed
+		self.name =			name			# entry name as stored in the file
+		self.posn =			posn			# file offset of the entry's header
+		self.motifFile =	motifFile		# where to read data from, if it hasn't been
+		self.dataOffset =	dataOffset		# of the entry's Data chunk, in its D block
+		self.dataSize =		dataSize
+		self.dataRead =		data is not None or motifFile is None
+		self._data =		data
+		self._params =		NOT_DECODED
+
+	def __repr__(self):
+		return 'Entry(%r, %d, %r, %r)' % (self.ident, self.number, self.label, self.name)
+
+	@property
+	def data(self):
+		# the entry's Data chunk, or None if it has none
+		if not self.dataRead:
+			self._data = self.motifFile.readData(b'D' + self.ident[1:], self.dataOffset, self.dataSize + 8)
+			self.dataRead = True
+		return self._data
+
+	@property
+	def params(self):
+		# dict of the entry's decoded parameters, or None if there is no decoder for this block
+		if self._params is NOT_DECODED:
+			decodeFn = payloadDecoders.get(self.ident)
+			self._params = None if decodeFn is None or self.data is None else decodeFn(self)
+		return self._params
+
+	def detached(self):
+		# a copy that stays valid after its MotifFile is closed
+		data = self.data
+		entry = Entry(self.ident, self.number, self.label, self.name,
+					  None if data is None else bytes(data), self.posn)
+		entry.dataOffset = self.dataOffset
+		entry.dataSize = self.dataSize
+		entry._params = self.params
+		return entry
+
+def defaultLabel(motifFile, entryNumber):
+	return '%02d' % (entryNumber + 1)
+
+def bankSectNumLabel(motifFile, entryNumber):
+	return bankSectNumStrFromEntryNum(entryNumber)
+
+def userArpeggioLabel(motifFile, entryNumber):
+	return '%03d' % (entryNumber + 1)
+
+def voiceLabel(motifFile, entryNumber):
+	bankNumber = (entryNumber & 0x00FF00) >> 8
+	voiceNumber = entryNumber & 0x0000FF
+	if bankNumber < 16:
+		return bankSectionNumberStr(bankNumber, voiceNumber)
+	elif bankNumber == 40:
+		return bankSectionNumberStr(15, voiceNumber)
+	# Mixing Voice or Sample Voice
+	elif bankNumber >= 192:			# guess at where it switches to pattern
+		return '%s %02d:%03d' % (PATTERN_ABBREV, bankNumber - 191, voiceNumber - 127)
+	else:
+		return '%s %02d:%03d' % (SONG_ABBREV, bankNumber - 127, voiceNumber - 127)
+
+def waveformLabel(motifFile, entryNumber):
+	waveformType = motifFile.layout.waveformTypes[motifFile.layout.waveformTypeIndex(entryNumber)]
+	return '%04d' % (entryNumber - waveformType.lowNumber + 1)
+
+entryLabelFns = {
+	b'EMST' :	bankSectNumLabel,
+	b'EPFM' :	bankSectNumLabel,
+	b'EVCE' :	voiceLabel,
+	b'EARP' :	userArpeggioLabel,
+	b'EWFM' :	waveformLabel,
+	}
+
+class MotifFile:
+	'''
+	An open Motif file. All parsing state lives here rather than in module
+	globals, so any number of files can be parsed at once, e.g. in threads.
+	'''
+
+	def __init__(self, fileName, useMmap = True, countIO = False, stream = None):
+		'''
+		fileName may also name a Motif file in a zip or tar archive, as
+		'archive.zip!/path/file.X0A'. If stream (a seekable binary file) is
+		given, the Motif file is read from it, and fileName is just its name.
+		'''
+		self.fileName =			fileName
+		self.catalog =			{}
+		self.inputMap =			None
+		self.inputView =		None		# memoryview of the mmapped file, or None when reading the stream
+		self.entriesDecoded =	0			# counted once per block, for ParseStats
+		self.viewBytesRead =	0			# bytes decoded from inputView, likewise
+		self.blockStarts =		None		# sorted catalog offsets, for blockExtent()
+
+		# open file
+		if stream is not None:
+			self.inputStream = stream
+		elif ARCHIVE_MEMBER_SEP in fileName and not os.path.exists(fileName):
+			import motifArchive
+			self.inputStream = motifArchive.openInput(fileName)
+		else:
+			try:
+				self.inputStream = open(fileName, 'rb')
+			except IOError:
+				raise IOError('could not open file: %s' % fileName)
+		if countIO:
+			self.inputStream = CountingReader(self.inputStream)
+
+		try:
+			# map the whole file once; fall back to stream reads if that isn't possible (e.g. empty file)
+			if useMmap and isinstance(self.inputStream, io.BytesIO):
+				self.inputView = self.inputStream.getbuffer()		# already in memory
+			elif useMmap:
+				try:
+					self.inputMap = mmap.mmap(self.inputStream.fileno(), 0, access = mmap.ACCESS_READ)
+					self.inputView = memoryview(self.inputMap)
+				except (AttributeError, OSError, ValueError):		# e.g. an archive member: no fileno()
+					self.inputMap = None
+			self.readCatalog()
+		except:
+			self.close()
+			raise
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *_):
+		self.close()
+
+	def close(self):
+		if self.inputView is not None:
+			self.inputView.release()
+			self.inputView = None
+		try:
+			if self.inputMap is not None:
+				try:
+					self.inputMap.close()
+				except BufferError:
+					pass	# caller still holds Entry.data views; the map goes away with them
+				self.inputMap = None
+		finally:
+			try:
+				self.inputStream.close()
+			except BufferError:
+				pass		# a BytesIO whose buffer is still viewed goes away with the views
+
+	def readCatalog(self):
+		# read file header
+		if self.inputView is None:
+			fileHdr = self.inputStream.read(FILE_HDR_LGTH)
+			fileHdrId, fileVersionBytes, catalogSize = struct.unpack('> 16s 16s I 28x', fileHdr)
+		else:
+			fileHdrId, fileVersionBytes, catalogSize = struct.unpack_from('> 16s 16s I 28x', self.inputView)
+		assert fileHdrId[0:len(FILE_HDR_ID)] == FILE_HDR_ID, FILE_HDR_ID
+		self.fileVersionStr = fileVersionBytes.decode('ascii').rstrip('\x00')
+		self.fileVersion = tuple(map(int, self.fileVersionStr.split('.')))
+		self.layout = fileLayoutFor(self.fileVersion)
+
+		# build catalog
+		nCatalogEntries = int(catalogSize / CATALOG_ENTRY_LGTH)
+		if self.inputView is None:
+			for _ in range(0, nCatalogEntries):
+				entry = self.inputStream.read(CATALOG_ENTRY_LGTH)
+				entryId, offset = struct.unpack('> 4s I', entry)
+				self.catalog[entryId] = offset
+		else:
+			catalogView = self.inputView[FILE_HDR_LGTH:FILE_HDR_LGTH + nCatalogEntries * CATALOG_ENTRY_LGTH]
+			self.catalog.update(struct.iter_unpack('> 4s I', catalogView))
+			catalogView.release()
+
+	def hasBlock(self, ident):
+		return ident in self.catalog
+
+	def fileSize(self):
+		if self.inputView is not None:
+			return len(self.inputView)
+		posn = self.inputStream.tell()
+		size = self.inputStream.seek(0, os.SEEK_END)
+		self.inputStream.seek(posn)
+		return size
+
+	def blockExtent(self, ident):
+		'''
+		Returns (start, end) file offsets of the ident block, which runs to the
+		next block in the catalog or to the end of the file.
+		Raises KeyError if the file has no block of this type.
+		'''
+		start = self.catalog[ident]
+		if self.blockStarts is None:
+			self.blockStarts = sorted(self.catalog.values())
+		i = bisect.bisect_right(self.blockStarts, start)
+		end = self.blockStarts[i] if i < len(self.blockStarts) else self.fileSize()
+		return start, end
+
+	def entryCount(self, ident):
+		# raises KeyError if the file has no block of this type
+		blockPosn = self.catalog[ident]
+		if self.inputView is None:
+			self.inputStream.seek(blockPosn)
+			blockHdr = self.inputStream.read(BLOCK_HDR_LGTH)
+			blockIdData, nEntries = struct.unpack('> 4s 4x I', blockHdr)
+		else:
+			blockIdData, nEntries = struct.unpack_from('> 4s 4x I', self.inputView, blockPosn)
+		assert blockIdData == ident, ident
+		return nEntries
+
+	def entries(self, blockSpec):
+		'''
+		Yields an Entry for each entry in blockSpec's block, lazily.
+		Raises KeyError if the file has no block of this type.
+		'''
+		nEntries = self.entryCount(blockSpec.ident)
+		if self.inputView is None:
+			return self.streamEntries(blockSpec, nEntries)
+		else:
+			return self.viewEntries(blockSpec, self.catalog[blockSpec.ident] + BLOCK_HDR_LGTH, nEntries)
+
+	def streamEntries(self, blockSpec, nEntries):
+		# reads entries with one read() per header and per string
+		if blockSpec.needsData:
+			yield from self.streamDataEntries(blockSpec, nEntries)
+			return
+		labelFn = entryLabelFns.get(blockSpec.ident, defaultLabel)
+		for _ in range(0, nEntries):
+			posn, entryNumber, entryName, dataSize, dataOffset = self.readEntryHdr()
+			yield Entry(blockSpec.ident, entryNumber, labelFn(self, entryNumber), entryName, None, posn,
+						self, dataOffset, dataSize)
+		self.entriesDecoded += nEntries
+
+	def readEntryHdr(self):
+		# returns (posn, entryNumber, entryName, dataSize, dataOffset) of the entry at the stream position
+		inputStream = self.inputStream
+		entryHdrStruct = self.layout.entryHdrStruct
+		posn = inputStream.tell()
+		entryHdr = inputStream.read(entryHdrStruct.size)
+		entryId, entryLgth, dataSize, dataOffset, entryNumber = \
+			entryHdrStruct.unpack(entryHdr)
+		entryStrs = inputStream.read(entryLgth - self.layout.entryFixedSizeDataLgth)
+		assert entryId == BLOCK_ENTRY_ID, BLOCK_ENTRY_ID
+		return posn, entryNumber, entryNameFromStrs(entryStrs.decode('ascii')), dataSize, dataOffset
+
+	def streamDataEntries(self, blockSpec, nEntries):
+		'''
+		Reads data-bearing entries in passes: first the headers of up to
+		DATA_ENTRIES_PER_PASS entries, read sequentially, then their Data
+		chunks in offset order, merged into a few large reads, then the
+		entries are yielded in their original order.
+		'''
+		inputStream = self.inputStream
+		labelFn = entryLabelFns.get(blockSpec.ident, defaultLabel)
+		dataBlockPosn = self.catalog[blockSpec.dataIdent]
+		nLeft = nEntries
+		while nLeft > 0:
+			nPass = min(nLeft, DATA_ENTRIES_PER_PASS)
+			entryHdrs = [self.readEntryHdr() for _ in range(0, nPass)]
+			nextEntryPosn = inputStream.tell()
+			dataChunks = self.readCoalesced(dataBlockPosn,
+											[(dataOffset, dataSize + 8) for _, _, _, dataSize, dataOffset in entryHdrs])
+			for (posn, entryNumber, entryName, dataSize, dataOffset), blockData in zip(entryHdrs, dataChunks):
+				yield Entry(blockSpec.ident, entryNumber, labelFn(self, entryNumber), entryName, blockData, posn,
+							self, dataOffset, dataSize)
+			nLeft -= nPass
+			if nLeft > 0:
+				inputStream.seek(nextEntryPosn)
+		self.entriesDecoded += nEntries
+
+	def readData(self, dataIdent, dataOffset, size):
+		# returns size bytes at dataOffset in block dataIdent, or None if there is no such block
+		if dataIdent not in self.catalog or size <= 8:
+			return None
+		return self.readAt(self.catalog[dataIdent] + dataOffset, size)
+
+	def readAt(self, posn, size):
+		# returns size bytes at file offset posn, leaving the stream where it was
+		if self.inputView is not None:
+			return self.inputView[posn:posn + size]
+		streamPosn = self.inputStream.tell()		# may be in the middle of a streamEntries() block
+		self.inputStream.seek(posn)
+		data = self.inputStream.read(size)
+		self.inputStream.seek(streamPosn)
+		return data
+
+	def readCoalesced(self, basePosn, requests):
+		'''
+		Returns the bytes for each (offset, size) in requests, relative to
+		basePosn, as memoryviews in requests order. Requests are read in offset
+		order, with nearby ones merged into one seek and read.
+		'''
+		inputStream = self.inputStream
+		results = [None] * len(requests)
+		order = sorted(range(len(requests)), key = lambda i: requests[i][0])
+		i = 0
+		while i < len(order):
+			runStart, runSize = requests[order[i]]
+			runEnd = runStart + runSize
+			j = i + 1
+			while j < len(order):
+				offset, size = requests[order[j]]
+				if offset > runEnd + COALESCE_MAX_GAP or max(runEnd, offset + size) - runStart > COALESCE_MAX_READ:
+					break
+				runEnd = max(runEnd, offset + size)
+				j += 1
+			inputStream.seek(basePosn + runStart)
+			run = memoryview(inputStream.read(runEnd - runStart))
+			for k in order[i:j]:
+				offset, size = requests[k]
+				results[k] = run[offset - runStart:offset - runStart + size]
+			i = j
+		return results
+
+	def viewEntries(self, blockSpec, posn, nEntries):
+		# decodes entries in place from inputView; blockData is a memoryview slice, not a copy
+		entryFixedSizeDataLgth = self.layout.entryFixedSizeDataLgth
+		entryHdrStruct = self.layout.entryHdrStruct
+		entryHdrLgth = entryHdrStruct.size
+		if blockSpec.needsData:
+			dataBlockPosn = self.catalog[blockSpec.dataIdent]
+		ident = blockSpec.ident
+		labelFn = entryLabelFns.get(ident, defaultLabel)
+		view = self.inputView
+		blockPosn = posn
+		dataBytesRead = 0
+		for _ in range(0, nEntries):
+			entryPosn = posn
+			entryId, entryLgth, dataSize, dataOffset, entryNumber = \
+				entryHdrStruct.unpack_from(view, posn)
+			assert entryId == BLOCK_ENTRY_ID, BLOCK_ENTRY_ID
+			strsPosn = posn + entryHdrLgth
+			posn = strsPosn + entryLgth - entryFixedSizeDataLgth
+			entryName = entryNameFromStrs(str(view[strsPosn:posn], 'ascii'))
+			if blockSpec.needsData:
+				dataPosn = dataBlockPosn + dataOffset
+				blockData = view[dataPosn:dataPosn + dataSize + 8]
+				dataBytesRead += dataSize + 8
+			else:
+				blockData = None
+			yield Entry(ident, entryNumber, labelFn(self, entryNumber), entryName, blockData, entryPosn,
+						self, dataOffset, dataSize)
+		self.entriesDecoded += nEntries
+		self.viewBytesRead += posn - blockPosn + dataBytesRead
+
+	def entryNumbers(self, ident):
+		# yields just the entry numbers of a block, stepping over names and data without decoding them
+		nEntries = self.entryCount(ident)
+		entryHdrStruct = struct.Struct('> 4x I 16x I')
+		posn = self.catalog[ident] + BLOCK_HDR_LGTH
+		for _ in range(0, nEntries):
+			if self.inputView is None:
+				self.inputStream.seek(posn)
+				entryLgth, entryNumber = entryHdrStruct.unpack(self.inputStream.read(entryHdrStruct.size))
+			else:
+				entryLgth, entryNumber = entryHdrStruct.unpack_from(self.inputView, posn)
+			posn += ENTRY_HDR_LGTH + entryLgth
+			yield entryNumber
+
+	def entryAt(self, blockSpec, posn):
+		# decodes the single entry whose header is at file offset posn, e.g. as found in a MotifIndex
+		if self.inputView is None:
+			self.inputStream.seek(posn)
+			return next(self.streamEntries(blockSpec, 1))
+		else:
+			return next(self.viewEntries(blockSpec, posn, 1))
+
+def entryNameFromStrs(entryStrsDecoded):
+	return entryStrsDecoded.rstrip('\x00').split('\x00')[0].split('\x03')[0]
+		# splitting at \x03 strips trailing garbage seen in XS files
+
+class CountingReader:
+	# wraps a binary file, counting read() and seek() calls and bytes read, for ParseStats
+	def __init__(self, stream):
+		self.stream =		stream
+		self.readCalls =	0
+		self.seekCalls =	0
+		self.bytesRead =	0
+
+	def read(self, size = -1):
+		data = self.stream.read(size)
+		self.readCalls += 1
+		self.bytesRead += len(data)
+		return data
+
+	def seek(self, offset, whence = os.SEEK_SET):
+		self.seekCalls += 1
+		return self.stream.seek(offset, whence)
+
+	def tell(self):
+		return self.stream.tell()
+
+	def fileno(self):
+		return self.stream.fileno()
+
+	def close(self):
+		self.stream.close()
+
+class CountingWriter:
+	# wraps a text file, counting what is written to it, for ParseStats
+	def __init__(self, out):
+		self.out =			out
+		self.bytesWritten =	0
+
+	def write(self, text):
+		self.bytesWritten += len(text)
+		return self.out.write(text)
+
+	def flush(self):
+		self.out.flush()
+
+class BlockStats:
+	def __init__(self, name):
+		self.name =				name
+		self.seconds =			0.0
+		self.entries =			0			# entries decoded (0 if the block was already read)
+		self.bytesRead =		0
+		self.readCalls =		0
+		self.seekCalls =		0
+		self.outputBytes =		0
+
+class ParseStats:
+	'''
+	Per-block timing and I/O counts for printMotifFile(..., stats = ParseStats()).
+	blockCallback, if given, is called with each BlockStats as its block finishes.
+	When no ParseStats is passed in, none of this is measured.
+	'''
+
+	def __init__(self, blockCallback = None):
+		self.blockCallback =	blockCallback
+		self.blocks =			[]
+
+	def snapshot(self, report):
+		motifFile = report.motifFile
+		inputStream = motifFile.inputStream
+		return (time.perf_counter(), motifFile.entriesDecoded,
+				motifFile.viewBytesRead + inputStream.bytesRead,
+				inputStream.readCalls, inputStream.seekCalls, report.out.bytesWritten)
+
+	def measureBlock(self, report, blockSpec, blockFn):
+		before = self.snapshot(report)
+		blockFn(report, blockSpec)
+		after = self.snapshot(report)
+		blockStats = BlockStats(blockSpec.name)
+		blockStats.seconds, blockStats.entries, blockStats.bytesRead, \
+			blockStats.readCalls, blockStats.seekCalls, blockStats.outputBytes = \
+			[afterValue - beforeValue for beforeValue, afterValue in zip(before, after)]
+		self.blocks.append(blockStats)
+		if self.blockCallback is not None:
+			self.blockCallback(blockStats)
+
+	def total(self):
+		total = BlockStats('total')
+		for blockStats in self.blocks:
+			for attr in ('seconds', 'entries', 'bytesRead', 'readCalls', 'seekCalls', 'outputBytes'):
+				setattr(total, attr, getattr(total, attr) + getattr(blockStats, attr))
+		return total
+
+	def table(self):
+		lines = ['%-16s %9s %8s %11s %7s %7s %11s' %
+				 ('block', 'seconds', 'entries', 'bytes read', 'reads', 'seeks', 'output')]
+		for blockStats in self.blocks + [self.total()]:
+			lines.append('%-16s %9.4f %8d %11d %7d %7d %11d' %
+						 (blockStats.name, blockStats.seconds, blockStats.entries, blockStats.bytesRead,
+						  blockStats.readCalls, blockStats.seekCalls, blockStats.outputBytes))
+		return '\n'.join(lines)
+
+DEFAULT_OUTPUT_BUFFER_SIZE =	1 << 16
+CANCEL_CHECK_ENTRIES =			256		# with a cancelEvent, how often renderBlock looks at it
+
+class ParseCancelled(Exception):
+	pass
+
+class TextReport:
+	'''
+	Prints entries from a MotifFile as text. Voices and waveforms are collected
+	as their blocks are read and printed afterwards by the BlockSpec printFn.
+
+	Text is collected in a list and written to out in one piece at the end of
+	each block, or sooner once bufferSize characters are waiting.
+	'''
+
+	def __init__(self, motifFile, out, stats = None, bufferSize = DEFAULT_OUTPUT_BUFFER_SIZE, index = None,
+				 cancelEvent = None):
+		self.motifFile =		motifFile
+		self.index =			index			# a MotifIndex (see motifIndex.py) to take entries from, if any
+		self.cancelEvent =		cancelEvent		# a threading.Event that stops the report with ParseCancelled
+		self.out =				out
+		self.stats =			stats
+		self.bufferSize =		bufferSize
+		self.chunks =			[]
+		self.nBuffered =		0
+		self.mixingVoices =		VoiceList()
+		self.sampleVoices =		VoiceList()
+		self.voices =			VoiceList()
+		self.voiceBlockRead =	False
+		self.waveformTypes =	motifFile.layout.newWaveformTypes()
+
+	def write(self, text):
+		self.chunks.append(text)
+		self.nBuffered += len(text)
+		if self.nBuffered >= self.bufferSize:
+			self.flush()
+
+	def flush(self):
+		if len(self.chunks) > 0:
+			self.out.write(''.join(self.chunks))
+			self.chunks = []
+			self.nBuffered = 0
+
 # enum corresponds to how these types are defined in the Motif file
 class MasterTargetType:
 	MST_VOICE, MST_PERFORMANCE, MST_PATTERN, MST_SONG = range(4)
 
-def printMaster(entryNumber, entryName, data):
-	if fileVersionPreXF():
-		masterFormatStr = '> 4s 32x B x B B 328x'
-	else:
-		masterFormatStr = '> 4s 32x B x B B 520x'
-	dataId, targetType, targetBank, target = struct.unpack(masterFormatStr, data)
+def masterTarget(motifFile, data):
+	# returns (target type abbreviation, target) for a Master's Data chunk, e.g. ('Vc', 'PRE1:001(A01)')
+	dataId, targetType, targetBank, target = motifFile.layout.masterStruct.unpack(data)
 	assert dataId == BLOCK_DATA_ID, BLOCK_DATA_ID
 	targetBank &= 0x0F		# guess about keeping bank in range
-	print('%s: %-20s ' % (bankSectNumStrFromEntryNum(entryNumber), entryName), end='')
 	if targetType == MasterTargetType.MST_VOICE:
-		print('Vc', bankSectionNumberStr(targetBank, target))
+		return 'Vc', bankSectionNumberStr(targetBank, target)
 	elif targetType == MasterTargetType.MST_PERFORMANCE:
-		print('Pf', bankSectionNumberStr(targetBank + 8, target))
+		return 'Pf', bankSectionNumberStr(targetBank + 8, target)
 			# targetBank + 8 because Performances start in bank USR1
+	elif targetType == MasterTargetType.MST_PATTERN:	
+		return PATTERN_ABBREV, '%02d' % (target + 1)
 	else:
-		if targetType == MasterTargetType.MST_PATTERN:	
-			print(PATTERN_ABBREV, end='')
-		else:
-			assert targetType == MasterTargetType.MST_SONG
-			print(SONG_ABBREV, end='')
-		print(' %02d' % (target + 1))
+		assert targetType == MasterTargetType.MST_SONG
+		return SONG_ABBREV, '%02d' % (target + 1)
+
+def masterParams(entry):
+	targetTypeAbbrev, targetStr = masterTarget(entry.motifFile, entry.data)
+	return {'targetType' : targetTypeAbbrev, 'target' : targetStr}
+
+registerPayloadDecoder(b'EMST', masterParams)
 
-def printPerformance(entryNumber, entryName, data):
-	print(bankSectNumStrFromEntryNum(entryNumber), entryName.split(':')[-1])
+def printMaster(report, entry):
+	params = entry.params
+	report.write('%s: %-20s %s %s\n' % (entry.label, entry.name, params['targetType'], params['target']))
 
-def doVoice(entryNumber, entryName, data):
+def printPerformance(report, entry):
+	report.write('%s %s\n' % (entry.label, entry.name.split(':')[-1]))
+
+# the EVCE block holds all 3 kinds of voice
+class VoiceKind:
+	VOICE, MIXING_VOICE, SAMPLE_VOICE = range(3)
+
+def voiceKind(entryNumber):
 	bankNumber = (entryNumber & 0x00FF00) >> 8
-	voiceNumber = entryNumber & 0x0000FF
-	voiceName = entryName.split(':')[-1]
-	if bankNumber < 16:
-		voices.append([bankNumber, voiceNumber, voiceName])
-	elif bankNumber == 40:
-		voices.append([15, voiceNumber, voiceName])
+	if bankNumber < 16 or bankNumber == 40:
+		return VoiceKind.VOICE
 	elif bankNumber == 134:
-		sampleVoices.append([entryNumber, bankNumber, voiceNumber, voiceName])
-	else:	# Mixing Voice
-		mixingVoices.append([entryNumber, bankNumber, voiceNumber, voiceName])
-
-def printVoice(bankNumber, voiceNumber, voiceName):
-	print(bankSectionNumberStr(bankNumber, voiceNumber), voiceName)
-
-def printVoices(name):
-	print('%s (%d)' % (name, len(voices)))
-	for voice in voices:
-		printVoice(voice[0], voice[1], voice[2])
-	print()
-
-def printSpecialVoices(voices):
-	for voice in voices:
-		_, bankNumber, voiceNumber, voiceName = voice
-		if bankNumber >= 192:			# guess at where it switches to pattern
-			songPatternStr = PATTERN_ABBREV
-			bankNumber -= 191
-		else:
-			songPatternStr = SONG_ABBREV
-			bankNumber -= 127
-		print('%s %02d:%03d %s' % (songPatternStr, bankNumber, voiceNumber - 127, voiceName))
-	print()
+		return VoiceKind.SAMPLE_VOICE
+	else:
+		return VoiceKind.MIXING_VOICE
 
-def printMixingVoices(name):
-	mixingVoices.sort(key = lambda mixVoice: mixVoice[0])
-	print('%s (%d)' % (name, len(mixingVoices)))
-	printSpecialVoices(mixingVoices)
+class VoiceList:
+	'''
+	Voices of one kind, as collected by doVoice, in parallel columns: entry
+	numbers in an array, labels (shared, for bank/section/number labels) and
+	interned names in lists.
+	'''
+	def __init__(self):
+		self.numbers =	array.array('I')
+		self.labels =	[]
+		self.names =	[]
 
-def printSampleVoices(name):
-	print('%s (%d)' % (name, len(sampleVoices)))
-	printSpecialVoices(sampleVoices)
+	def __len__(self):
+		return len(self.numbers)
 
-class WaveformType:
-	def __init__(self, name, lowNumber, highNumber):
-		self.name =			name
-		self.lowNumber =	lowNumber
-		self.highNumber =	highNumber
-		self.list =			[]
-		self.duplicates =	{}
+	def append(self, number, label, name):
+		self.numbers.append(number)
+		self.labels.append(label)
+		self.names.append(name)
 
-def processWaveform(wfNumber, wfName, wfType):
-	wfType.list.append([wfNumber, wfName])
-	if wfName in wfType.duplicates:
-		wfType.duplicates[wfName].append(wfNumber)
-	else:
-		wfType.duplicates[wfName] = [wfNumber]
-	
-def doWaveform(entryNumber, entryName, data):					# entryNumber range is [0 .. 2047]
-	waveformName = entryName.split(':')[-1]
-	if fileVersionPreXF():
-		waveformType = waveformTypes[0]
+	def sortByNumber(self):
+		order = sorted(range(0, len(self.numbers)), key = self.numbers.__getitem__)
+		self.numbers =	array.array('I', [self.numbers[i] for i in order])
+		self.labels =	[self.labels[i] for i in order]
+		self.names =	[self.names[i] for i in order]
+
+def doVoice(report, entry):
+	voiceName = sys.intern(entry.name.split(':')[-1])
+	kind = voiceKind(entry.number)
+	if kind == VoiceKind.VOICE:
+		report.voices.append(entry.number, entry.label, voiceName)
+	elif kind == VoiceKind.SAMPLE_VOICE:
+		report.sampleVoices.append(entry.number, entry.label, voiceName)
 	else:
-		waveformType = None
-		for wfType in waveformTypes:
-			if entryNumber >= wfType.lowNumber and entryNumber <= wfType.highNumber:
-				waveformType = wfType
-				break
-		if waveformType == None:
-			raise Exception('uncategorized waveform %s(%d)' % (entryName, entryNumber))
-	processWaveform(entryNumber, waveformName, waveformType)
-
-def printWaveforms(name):
-	for wfType in waveformTypes:
-		if len(wfType.list) > 0:
-			print('%s (%d)' % (wfType.name, len(wfType.list)))
-			for wf in wfType.list:
-				wfNumber, wfName = wf
-				wfDuplicateNumbers = wfType.duplicates[wfName]
-				print('%04d:' % (wfNumber - wfType.lowNumber + 1), wfName)
-				if len(wfDuplicateNumbers) > 1:
-					print('  duplicates: ', end='')
-					first = True
-					for wfDuplicateNumber in wfDuplicateNumbers:
-						if wfDuplicateNumber != wfNumber:
-							if first:
-								first = False
-							else:
-								print(', ', end='')
-							print('%04d' % (wfDuplicateNumber - wfType.lowNumber + 1), end='')
-					print()
-			print()
-
-def printUserArpeggio(entryNumber, entryName, data):
-	print('%03d:' % (entryNumber + 1), entryName.split(':')[-1])
-
-def printDefault(entryNumber, entryName, data):
-	print('%02d:' % (entryNumber + 1), entryName)
+		report.mixingVoices.append(entry.number, entry.label, voiceName)
+
+def printVoices(report, name):
+	report.write('%s (%d)\n' % (name, len(report.voices)))
+	printSpecialVoices(report, report.voices)
+
+def printSpecialVoices(report, voices):
+	for voiceLabel, voiceName in zip(voices.labels, voices.names):
+		report.write('%s %s\n' % (voiceLabel, voiceName))
+	report.write('\n')
+
+def printMixingVoices(report, name):
+	report.mixingVoices.sortByNumber()
+	report.write('%s (%d)\n' % (name, len(report.mixingVoices)))
+	printSpecialVoices(report, report.mixingVoices)
+
+def printSampleVoices(report, name):
+	report.write('%s (%d)\n' % (name, len(report.sampleVoices)))
+	printSpecialVoices(report, report.sampleVoices)
+
+def processWaveform(wfNumber, wfName, wfType):
+	wfType.numbers.append(wfNumber)
+	wfType.names.append(sys.intern(wfName))
+
+def doWaveform(report, entry):									# entryNumber range is [0 .. 2047]
+	waveformName = entry.name.split(':')[-1]
+	waveformType = report.waveformTypes[report.motifFile.layout.waveformTypeIndex(entry.number)]
+	processWaveform(entry.number, waveformName, waveformType)
+
+def printWaveforms(report, name):
+	for wfType in report.waveformTypes:
+		if len(wfType) > 0:
+			report.write('%s (%d)\n' % (wfType.name, len(wfType)))
+			duplicates = wfType.duplicates()
+			for wfNumber, wfName in zip(wfType.numbers, wfType.names):
+				report.write('%04d: %s\n' % (wfNumber - wfType.lowNumber + 1, wfName))
+				wfDuplicateNumbers = duplicates.get(wfName)
+				if wfDuplicateNumbers is not None:
+					report.write('  duplicates: %s\n' %
+								 ', '.join(['%04d' % (wfDuplicateNumber - wfType.lowNumber + 1)
+											for wfDuplicateNumber in wfDuplicateNumbers
+											if wfDuplicateNumber != wfNumber]))
+			report.write('\n')
+
+def printUserArpeggio(report, entry):
+	report.write('%s: %s\n' % (entry.label, entry.name.split(':')[-1]))
+
+def printDefault(report, entry):
+	report.write('%s: %s\n' % (entry.label, entry.name))
 
 class BlockSpec:
 	def __init__(self, ident, name, underline, doFn, printFn, needsData):
@@ -200,6 +821,7 @@ class BlockSpec:
 		self.doFn =				doFn			# what to do with each item of this type
 		self.printFn =			printFn			# print items of this type if not done by doFn
 		self.needsData =		needsData
+		self.dataIdent =		b'D' + ident[1:]	# ident of the block holding this block's Data chunks
 
 # when printing out all blocks, they will print out in this order
 blockSpecs = collections.OrderedDict((
@@ -219,106 +841,196 @@ blockSpecs = collections.OrderedDict((
 	# voice data of the 3 different kinds is collected from the EVCE block
 	))
 
-def doBlock(blockSpec):
-	global catalog, voiceBlockRead
-	
+def doBlock(report, blockSpec):
+	if report.stats is None:
+		decodeBlock(report, blockSpec)
+	else:
+		report.stats.measureBlock(report, blockSpec, decodeBlock)
+
+def decodeBlock(report, blockSpec):
 	try:
-		inputStream.seek(catalog[blockSpec.ident])
-	except:
-		print('no data of type: %s\n' % (blockSpec.name))
-# 		print('no data of type: %s(%s)\n' % (blockSpec.name, blockSpec.ident.decode('ascii')))
-		return
+		renderBlock(report, blockSpec)
+	finally:
+		report.flush()
 
-	blockHdr = inputStream.read(BLOCK_HDR_LGTH)
-	blockIdData, nEntries = struct.unpack('> 4s 4x I', blockHdr)
+def renderBlock(report, blockSpec):
+	if not report.motifFile.hasBlock(blockSpec.ident):
+		report.write('no data of type: %s\n\n' % (blockSpec.name))
+# 		report.write('no data of type: %s(%s)\n\n' % (blockSpec.name, blockSpec.ident.decode('ascii')))
+		return
 
-	assert blockIdData == blockSpec.ident, blockSpec.ident
+	blockIndex = None
+	if report.index is not None and not blockSpec.needsData:
+		blockIndex = report.index.blocks.get(blockSpec.ident)
+	if blockIndex is None:
+		blockEntries = report.motifFile.entries(blockSpec)
+	else:										# names and labels were read when the index was built
+		blockEntries = blockIndex.entries()
 	
 	if blockSpec.printFn == None:
-		print(blockSpec.name)
+		report.write('%s\n' % blockSpec.name)
 
-	if blockSpec.ident != b'EVCE' or not voiceBlockRead:
-		for _ in range(0, nEntries):
-			if fileVersionPreXF():
-				entryFixedSizeDataLgth = ENTRY_FIXED_SIZE_DATA_LGTH_PRE_XF
-				entryHdrFormatStr = '> 4s I 4x I 4x I I x'
-				
-			else:
-				entryFixedSizeDataLgth = ENTRY_FIXED_SIZE_DATA_LGTH
-				entryHdrFormatStr = '> 4s I 4x I 4x I I 2x'
-			entryHdr = inputStream.read(ENTRY_HDR_LGTH + entryFixedSizeDataLgth)
-			entryId, entryLgth, dataSize, dataOffset, entryNumber = \
-				struct.unpack(entryHdrFormatStr, entryHdr)
-			entryStrs = inputStream.read(entryLgth - entryFixedSizeDataLgth)
-			assert entryId == BLOCK_ENTRY_ID, BLOCK_ENTRY_ID
-			entryStrsDecoded = entryStrs.decode('ascii')
-			entryName = entryStrsDecoded.rstrip('\x00').split('\x00')[0].split('\x03')[0]
-				# splitting at \x03 strips trailing garbage seen in XS files
-			if blockSpec.needsData:
-				entryPosn = inputStream.tell()
-				dataIdent = bytearray(blockSpec.ident)
-				dataIdent[0] = ord('D')
-				dataIdent = bytes(dataIdent)
-				inputStream.seek(catalog[dataIdent] + dataOffset)
-				blockData = inputStream.read(dataSize + 8)
-				inputStream.seek(entryPosn)
-			else:
-				blockData = None
-			blockSpec.doFn(entryNumber, entryName, blockData)
+	if blockSpec.ident != b'EVCE' or not report.voiceBlockRead:
+		if report.cancelEvent is None:
+			for entry in blockEntries:
+				blockSpec.doFn(report, entry)
+		else:
+			for i, entry in enumerate(blockEntries):
+				if i % CANCEL_CHECK_ENTRIES == 0 and report.cancelEvent.is_set():
+					raise ParseCancelled()
+				blockSpec.doFn(report, entry)
 		if blockSpec.ident == b'EVCE':	# only need to read 'EVCE' block once
-			voiceBlockRead = True
+			report.voiceBlockRead = True
 
 	if blockSpec.printFn == None:
-		print()
+		report.write('\n')
 	else:
-		blockSpec.printFn(blockSpec.name)
-
-def printMotifFile(fileName, selectedItems):
-	# globals
-	global catalog, fileVersion, inputStream, mixingVoices, \
-		   sampleVoices, voices, voiceBlockRead, waveformTypes
-
-	catalog =			{}
-	mixingVoices =		[]
-	sampleVoices =		[]
-	voices =			[]
-	voiceBlockRead = 	False
-	waveformTypes =		(WaveformType('User Waveforms',	   1,  128),
-						 WaveformType('FL1 Waveforms',	 129, 2176),
-						 WaveformType('FL2 Waveforms',	2177, 4224))
-	
-	# open file
-	try:
-		inputStream = open(fileName, 'rb')
-	except IOError:
-		errStr = 'could not open file: %s' % fileName
-		print(errStr)
-		raise Exception(errStr)
-
-	# read file header
-	fileHdr = inputStream.read(FILE_HDR_LGTH)
-	fileHdrId, fileVersionBytes, catalogSize = struct.unpack('> 16s 16s I 28x', fileHdr)
-	assert fileHdrId[0:len(FILE_HDR_ID)] == FILE_HDR_ID, FILE_HDR_ID
-	fileVersionStr = fileVersionBytes.decode('ascii').rstrip('\x00')
-	fileVersion = tuple(map(int, fileVersionStr.split('.')))
-	
-	# build catalog
-	for _ in range(0, int(catalogSize / CATALOG_ENTRY_LGTH)):
-		entry = inputStream.read(CATALOG_ENTRY_LGTH)
-		entryId, offset = struct.unpack('> 4s I', entry)
-		catalog[entryId] = offset
-
-	print('%s\n' % os.path.basename(fileName))
-	if len(selectedItems) == 0:					# print everything
-		for blockSpec in blockSpecs.values():
-			doBlock(blockSpec)
-	else:										# print selectedItems
-		# cmd line specifies what to print
+		blockSpec.printFn(report, blockSpec.name)
+
+def renderBlocks(fileName, blockAbbrevs, useMmap = True):
+	'''
+	Returns the text of each of blockAbbrevs (blockSpecs keys for one block
+	ident), rendered in one report of their own, so e.g. the EVCE block is
+	read once for all 3 kinds of voice. Runs in a worker process.
+	'''
+	out = io.StringIO()
+	blockTexts = []
+	with MotifFile(fileName, useMmap) as motifFile:
+		report = TextReport(motifFile, out)
+		for blockAbbrev in blockAbbrevs:
+			decodeBlock(report, blockSpecs[blockAbbrev])
+			blockTexts.append(out.getvalue())
+			out.seek(0)
+			out.truncate()
+	return blockTexts
+
+def decodeBlocksInParallel(report, selectedItems, useMmap, nWorkers):
+	'''
+	Decodes the blocks of selectedItems across a process pool, one task per
+	block ident, biggest block first, with each worker opening the file for
+	itself. Their text is written to report in selectedItems order.
+	'''
+	motifFile = report.motifFile
+	blockAbbrevsByIdent = collections.OrderedDict()
+	for blockAbbrev in selectedItems:
+		if blockAbbrev in blockSpecs:
+			blockAbbrevsByIdent.setdefault(blockSpecs[blockAbbrev].ident, []).append(blockAbbrev)
+
+	def blockSize(ident):
+		if not motifFile.hasBlock(ident):
+			return 0
+		start, end = motifFile.blockExtent(ident)
+		return end - start
+
+	with concurrent.futures.ProcessPoolExecutor(nWorkers) as executor:
+		futures = {}
+		for ident in sorted(blockAbbrevsByIdent.keys(), key = blockSize, reverse = True):
+			futures[ident] = executor.submit(renderBlocks, motifFile.fileName, blockAbbrevsByIdent[ident], useMmap)
+		nRendered = collections.Counter()
 		for blockAbbrev in selectedItems:
-			try:
-				doBlock(blockSpecs[blockAbbrev])
-			except KeyError:
-				print('unknown data type: %s\n' % blockAbbrev)
+			if blockAbbrev not in blockSpecs:
+				report.write('unknown data type: %s\n\n' % blockAbbrev)
+				continue
+			ident = blockSpecs[blockAbbrev].ident
+			report.write(futures[ident].result()[nRendered[ident]])
+			report.flush()
+			nRendered[ident] += 1
+
+def printMotifFile(fileName, selectedItems, useMmap = True, out = None, stats = None,
+				   bufferSize = DEFAULT_OUTPUT_BUFFER_SIZE, nWorkers = 1, index = None, cancelEvent = None):
+	'''
+	Prints the selectedItems (blockSpecs keys; all of them if empty) of a Motif
+	file to out, which defaults to sys.stdout. If stats is a ParseStats, it
+	collects timing and I/O counts for each block. Output is written a block
+	at a time, or every bufferSize characters if that comes first. If nWorkers
+	isn't 1, blocks are decoded in that many worker processes (None: one per
+	CPU) at once; that is not done when collecting stats. If index is a
+	MotifIndex for this version of the file (see motifIndex.loadIndex), the
+	entries of blocks that don't need their data are taken from it rather
+	than read from the file, and nWorkers is ignored. If cancelEvent (a
+	threading.Event) is set while blocks are being read, ParseCancelled is
+	raised; it is only looked at when nWorkers is 1.
+	'''
+	if out is None:
+		out = sys.stdout
+	if stats is not None:
+		out = CountingWriter(out)
+
+	try:
+		motifFile = MotifFile(fileName, useMmap, countIO = stats is not None)
+	except IOError as e:
+		print(e, file = out)
+		raise
+
+	with motifFile:
+		report = TextReport(motifFile, out, stats, bufferSize, index, cancelEvent)
+		report.write('%s\n\n' % os.path.basename(fileName))
+		report.flush()
+		if nWorkers != 1 and stats is None and index is None:
+			decodeBlocksInParallel(report, selectedItems or list(blockSpecs.keys()), useMmap, nWorkers)
+		elif len(selectedItems) == 0:				# print everything
+			for blockSpec in blockSpecs.values():
+				doBlock(report, blockSpec)
+		else:										# print selectedItems
+			# cmd line specifies what to print
+			for blockAbbrev in selectedItems:
+				try:
+					blockSpec = blockSpecs[blockAbbrev]
+				except KeyError:
+					report.write('unknown data type: %s\n\n' % blockAbbrev)
+					continue
+				doBlock(report, blockSpec)
 	
-	inputStream.close()
-	print('\n(Motif file v%s, printMotifFile v%s)' % (fileVersionStr, VERSION))
+	report.write('\n(Motif file v%s, printMotifFile v%s)\n' % (motifFile.fileVersionStr, VERSION))
+	report.flush()
+
+def blockSummary(motifFile, selectedItems = ()):
+	'''
+	Returns [(blockSpec, number of entries), ...] for the selectedItems
+	(blockSpecs keys; all of them if empty), with None for missing blocks.
+	Only the block headers are read, except for the EVCE block, whose entry
+	headers are scanned (but not decoded) to sort out the 3 kinds of voice.
+	'''
+	if len(selectedItems) == 0:
+		selectedItems = blockSpecs.keys()
+	voiceKindCounts = None
+	summary = []
+	for blockAbbrev in selectedItems:
+		blockSpec = blockSpecs[blockAbbrev]
+		if not motifFile.hasBlock(blockSpec.ident):
+			count = None
+		elif blockSpec.ident == b'EVCE':
+			if voiceKindCounts is None:
+				voiceKindCounts = [0, 0, 0]
+				for entryNumber in motifFile.entryNumbers(b'EVCE'):
+					voiceKindCounts[voiceKind(entryNumber)] += 1
+			count = voiceKindCounts[VOICE_KIND_BY_PRINT_FN[blockSpec.printFn]]
+		else:
+			count = motifFile.entryCount(blockSpec.ident)
+		summary.append((blockSpec, count))
+	return summary
+
+VOICE_KIND_BY_PRINT_FN = {
+	printVoices :		VoiceKind.VOICE,
+	printMixingVoices :	VoiceKind.MIXING_VOICE,
+	printSampleVoices :	VoiceKind.SAMPLE_VOICE,
+	}
+
+def printSummary(fileName, selectedItems, useMmap = True, out = None):
+	'''
+	Prints how many entries of each of the selectedItems (blockSpecs keys;
+	all of them if empty) a Motif file has, without reading the entries.
+	Raises ValueError for an unknown item.
+	'''
+	if out is None:
+		out = sys.stdout
+
+	for blockAbbrev in selectedItems:
+		if blockAbbrev not in blockSpecs:
+			raise ValueError('unknown data type: %s' % blockAbbrev)
+
+	with MotifFile(fileName, useMmap) as motifFile:
+		print('%s\n' % os.path.basename(fileName), file = out)
+		for blockSpec, count in blockSummary(motifFile, selectedItems):
+			print('%-16s %5s' % (blockSpec.name, '-' if count is None else count), file = out)
+		print('\n(Motif file v%s, printMotifFile v%s)' % (motifFile.fileVersionStr, VERSION), file = out)
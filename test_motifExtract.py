@@ -0,0 +1,53 @@
+'''
+Tests for motifExtract, on synthetic files made by makeMotifFile.
+
+   python -m unittest test_motifExtract
+'''
+
+import os, unittest
+
+import motifExtract
+from motifTestCase import MotifFileTestCase
+from printMotifFile import MotifFile, blockSpecs
+
+class ExtractTest(MotifFileTestCase):
+	def setUp(self):
+		super().setUp()
+		with open(self.fileName, 'rb') as motifFile:
+			self.fileBytes = motifFile.read()
+
+	def assertSourceUnchanged(self):
+		with open(self.fileName, 'rb') as motifFile:
+			self.assertEqual(motifFile.read(), self.fileBytes)
+		self.assertEqual([name for name in os.listdir(self.tempDir) if name.endswith('.tmp')], [])
+
+	def testExtract(self):
+		outFileName = os.path.join(self.tempDir, 'out.X0A')
+		selection = motifExtract.parseSelection(['pf'])
+		nBytes = motifExtract.extractSubset(self.fileName, outFileName, selection)
+		self.assertEqual(os.path.getsize(outFileName), nBytes)
+		self.assertEqual(os.stat(outFileName).st_mode, os.stat(self.fileName).st_mode)
+		with MotifFile(self.fileName) as motifFile:
+			oldNames = [entry.name for entry in motifFile.entries(blockSpecs['pf'])]
+		with MotifFile(outFileName) as motifFile:
+			self.assertEqual([entry.name for entry in motifFile.entries(blockSpecs['pf'])], oldNames)
+		self.assertSourceUnchanged()
+
+	def testOutputIsInput(self):
+		selection = motifExtract.parseSelection(['pf'])
+		with self.assertRaises(IOError):
+			motifExtract.extractSubset(self.fileName, self.fileName, selection)
+		self.assertSourceUnchanged()
+
+	@unittest.skipUnless(hasattr(os, 'symlink'), 'no symlinks')
+	def testOutputIsLinkToInput(self):
+		linkName = os.path.join(self.tempDir, 'link.X0A')
+		os.symlink(self.fileName, linkName)
+		selection = motifExtract.parseSelection(['pf'])
+		with self.assertRaises(IOError):
+			motifExtract.extractSubset(self.fileName, linkName, selection)
+		self.assertTrue(os.path.islink(linkName))
+		self.assertSourceUnchanged()
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,69 @@
+'''
+Tests for motifRename, on synthetic files made by makeMotifFile.
+
+   python -m unittest test_motifRename
+'''
+
+import io, os, unittest
+from unittest import mock
+
+import motifIndex, motifRename
+from motifTestCase import MotifFileTestCase
+from printMotifFile import MotifFile, blockSpecs
+
+class RenameTest(MotifFileTestCase):
+	def entryNames(self, blockAbbrev):
+		with MotifFile(self.fileName) as motifFile:
+			return [(entry.label, entry.name) for entry in motifFile.entries(blockSpecs[blockAbbrev])]
+
+	def testRenameChangesOnlyTheName(self):
+		with open(self.fileName, 'rb') as motifFile:
+			oldBytes = motifFile.read()
+		oldNames = self.entryNames('pf')
+		label, oldName = oldNames[3]
+		changes = [motifRename.NameChange('pf', label, 'Warm')]
+		(patch,), problems = motifRename.planRenames(self.fileName, changes)
+		self.assertEqual(problems, [])
+		nProblems = motifRename.renameEntries(self.fileName, changes, out = io.StringIO())
+		self.assertEqual(nProblems, 0)
+
+		newName = oldName[:oldName.rfind(':') + 1] + 'Warm'.ljust(len(oldName) - oldName.rfind(':') - 1)
+		newNames = self.entryNames('pf')
+		self.assertEqual(newNames[3], (label, newName))
+		self.assertEqual(newNames[:3] + newNames[4:], oldNames[:3] + oldNames[4:])
+
+		with open(self.fileName, 'rb') as motifFile:
+			newBytes = motifFile.read()
+		self.assertEqual(len(newBytes), len(oldBytes))
+		slotEnd = patch.slotPosn + len(patch.newBytes)
+		self.assertEqual(newBytes[patch.slotPosn:slotEnd], patch.newBytes)
+		self.assertEqual(newBytes[:patch.slotPosn], oldBytes[:patch.slotPosn])
+		self.assertEqual(newBytes[slotEnd:], oldBytes[slotEnd:])
+
+	def testIndexIsRefreshedWhenMtimeDoesNotChange(self):
+		label = self.entryNames('pf')[0][0]
+		motifIndex.loadIndex(self.fileName)				# cache it
+		stat = os.stat(self.fileName)
+		motifRename.renameEntries(self.fileName, [motifRename.NameChange('pf', label, 'A')], out = io.StringIO())
+		os.utime(self.fileName, ns = (stat.st_atime_ns, stat.st_mtime_ns))		# as on a 2-second-mtime volume
+		entry = motifIndex.findEntry(self.fileName, 'pf', label)
+		self.assertEqual(entry.name.split(':')[-1].rstrip(), 'A')
+		changes = motifRename.prefixChanges(self.fileName, 'pf', 'B')
+		self.assertEqual(changes[0].newName, 'BA')
+
+	def testMtimeChanges(self):
+		oldKey = motifIndex.fileKey(self.fileName)
+		label = self.entryNames('pf')[0][0]
+		motifRename.renameEntries(self.fileName, [motifRename.NameChange('pf', label, 'A')], out = io.StringIO())
+		self.assertNotEqual(motifIndex.fileKey(self.fileName), oldKey)
+
+	def testMtimeIsMovedOnWhenWritingDoesNotChangeIt(self):
+		label = self.entryNames('pf')[0][0]
+		patches, _ = motifRename.planRenames(self.fileName, [motifRename.NameChange('pf', label, 'A')])
+		oldStat = os.stat(self.fileName)
+		with mock.patch.object(motifRename.os, 'stat', return_value = oldStat):	# as on a 2-second-mtime volume
+			motifRename.applyPatches(self.fileName, patches)
+		self.assertEqual(os.stat(self.fileName).st_mtime_ns, oldStat.st_mtime_ns + motifRename.MTIME_STEP_NS)
+
+if __name__ == '__main__':
+	unittest.main()